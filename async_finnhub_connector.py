@@ -0,0 +1,119 @@
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+from finnhub_connector import FinnhubConnector
+
+
+# asyncio flavour of FinnhubConnector. Every method has the same arguments and return value as its sync
+# counterpart, but the calls run on a bounded worker pool that shares one keep-alive session and one
+# rate limiter, so independent requests overlap instead of waiting on each other. The *_many methods
+# fetch the same dataset for a list of symbols concurrently and return a {symbol: result} dict
+class AsyncFinnhubConnector:
+
+    def __init__(self, api_key=None, base_api_url='https://finnhub.io/api/v1/', max_concurrency=10,
+                 connector=None, **kwargs):
+        # an existing sync connector can be wrapped to share its session and rate limiter
+        if connector is None:
+            connector = FinnhubConnector(api_key, base_api_url=base_api_url, pool_size=max_concurrency, **kwargs)
+        self.connector = connector
+        self.max_concurrency = max_concurrency
+        self.executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix='finnhub')
+
+    def close(self):
+        self.executor.shutdown(wait=False)
+        self.connector.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        self.close()
+
+    # run one blocking connector call on the worker pool
+    async def _run(self, func, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, functools.partial(func, *args, **kwargs))
+
+    # run the same call for every symbol at once. The worker pool already bounds how many requests are in
+    # flight, so thousands of symbols can be passed without opening thousands of connections. With
+    # return_exceptions=True a failing symbol maps to its exception instead of cancelling the whole batch
+    async def _many(self, func, symbols, *args, return_exceptions=False, **kwargs) -> dict:
+        symbols = list(symbols)
+        results = await asyncio.gather(*[self._run(func, symbol, *args, **kwargs) for symbol in symbols],
+                                       return_exceptions=return_exceptions)
+        return dict(zip(symbols, results))
+
+    async def get_north_american_stocks(self) -> pd.DataFrame:
+        return await self._run(self.connector.get_north_american_stocks)
+
+    async def look_up_stock(self, search_query: str) -> pd.DataFrame:
+        return await self._run(self.connector.look_up_stock, search_query)
+
+    async def get_company_news(self, symbol: str, start_date: str, end_date: str) -> pd.DataFrame:
+        return await self._run(self.connector.get_company_news, symbol, start_date, end_date)
+
+    async def get_basic_financials(self, symbol: str) -> dict:
+        return await self._run(self.connector.get_basic_financials, symbol)
+
+    async def get_metric_snapshot(self, symbol: str) -> pd.Series:
+        return await self._run(self.connector.get_metric_snapshot, symbol)
+
+    async def get_earnings_surprises(self, symbol: str) -> pd.DataFrame:
+        return await self._run(self.connector.get_earnings_surprises, symbol)
+
+    async def get_current_quote(self, symbol: str) -> pd.DataFrame:
+        return await self._run(self.connector.get_current_quote, symbol)
+
+    async def get_stock_candles(self, symbol: str, resolution: str, date_from: str, date_to: str,
+                                time_from='00:00:00', time_to='00:00:00', compact=False) -> pd.DataFrame:
+        return await self._run(self.connector.get_stock_candles, symbol, resolution, date_from, date_to,
+                               time_from, time_to, compact=compact)
+
+    async def get_crypto_symbols(self, exchange: str) -> pd.DataFrame:
+        return await self._run(self.connector.get_crypto_symbols, exchange)
+
+    async def get_crypto_candles(self, symbol: str, resolution: str, date_from: str, date_to: str,
+                                 time_from='00:00:00', time_to='00:00:00', compact=False) -> pd.DataFrame:
+        return await self._run(self.connector.get_crypto_candles, symbol, resolution, date_from, date_to,
+                               time_from, time_to, compact=compact)
+
+    # the stream is asyncio based already, it is returned as is and can be iterated with `async for`
+    def stream(self, symbols=(), **kwargs):
+        return self.connector.stream(symbols, **kwargs)
+
+    async def stream_websocket(self, symbol: str):
+        await self.stream([symbol], on_batch=lambda batch: print(batch.to_frame(), end='\n\n')).run()
+
+    # bulk versions of the per-symbol methods
+    async def get_company_news_many(self, symbols, start_date: str, end_date: str,
+                                    return_exceptions=False) -> dict:
+        return await self._many(self.connector.get_company_news, symbols, start_date, end_date,
+                                return_exceptions=return_exceptions)
+
+    async def get_basic_financials_many(self, symbols, return_exceptions=False) -> dict:
+        return await self._many(self.connector.get_basic_financials, symbols, return_exceptions=return_exceptions)
+
+    async def get_metric_snapshot_many(self, symbols, return_exceptions=False) -> dict:
+        return await self._many(self.connector.get_metric_snapshot, symbols, return_exceptions=return_exceptions)
+
+    async def get_earnings_surprises_many(self, symbols, return_exceptions=False) -> dict:
+        return await self._many(self.connector.get_earnings_surprises, symbols,
+                                return_exceptions=return_exceptions)
+
+    async def get_current_quote_many(self, symbols, return_exceptions=False) -> dict:
+        return await self._many(self.connector.get_current_quote, symbols, return_exceptions=return_exceptions)
+
+    async def get_stock_candles_many(self, symbols, resolution: str, date_from: str, date_to: str,
+                                     time_from='00:00:00', time_to='00:00:00', compact=False,
+                                     return_exceptions=False) -> dict:
+        return await self._many(self.connector.get_stock_candles, symbols, resolution, date_from, date_to,
+                                time_from, time_to, compact, return_exceptions=return_exceptions)
+
+    async def get_crypto_candles_many(self, symbols, resolution: str, date_from: str, date_to: str,
+                                      time_from='00:00:00', time_to='00:00:00', compact=False,
+                                      return_exceptions=False) -> dict:
+        return await self._many(self.connector.get_crypto_candles, symbols, resolution, date_from, date_to,
+                                time_from, time_to, compact, return_exceptions=return_exceptions)
@@ -0,0 +1,260 @@
+import argparse
+import datetime as dt
+import importlib.util
+import multiprocessing
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+
+import pandas as pd
+from dateutil.relativedelta import relativedelta
+
+from finnhub_connector import FinnhubConnector, SharedRateLimiter
+
+# what a unit of work downloads, every dataset is saved as one or more files per symbol
+DATASETS = ('candles', 'basic_financials', 'earnings')
+
+# Parquet needs pyarrow, without it the frames are saved as pickles
+PARQUET = importlib.util.find_spec('pyarrow') is not None
+
+
+# Backfills the local history of a whole universe (every US symbol by default): candles, basic financials and
+# earnings surprises of each symbol are units of a work queue kept in a SQLite file, run on a process pool
+# where every worker has its own connector and all of them share one SharedRateLimiter, so the job stays under
+# the API quota while downloading, parsing and writing the files on every core. A unit is checkpointed as done
+# in the queue as soon as its file is written, an interrupted or crashed job therefore resumes with the units
+# that are left and failed units are retried on the next run (up to max_attempts times). Symbols without data
+# are marked 'empty' and not asked for again. Files are written to
+# <directory>/<dataset>/<symbol>.<part>.parquet (.pkl without pyarrow) and can be read with load()
+class Backfill:
+
+    def __init__(self, directory='finnhub_backfill', path=None, max_attempts=3):
+        self.directory = directory
+        self.path = path or os.path.join(directory, 'queue.sqlite')
+        self.max_attempts = max_attempts
+        os.makedirs(directory, exist_ok=True)
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        with self.conn:
+            self.conn.execute('PRAGMA journal_mode=WAL')
+            self.conn.execute('CREATE TABLE IF NOT EXISTS units (symbol TEXT, dataset TEXT, status TEXT, '
+                              'attempts INTEGER, updated_at REAL, rows INTEGER, error TEXT, '
+                              'PRIMARY KEY (symbol, dataset))')
+
+    def close(self):
+        self.conn.close()
+
+    # add the units of the given symbols and datasets to the queue, units that are already queued (done or
+    # not) are kept as they are. Returns how many units were added
+    def plan(self, symbols, datasets=DATASETS) -> int:
+        unknown = set(datasets) - set(DATASETS)
+        if unknown:
+            raise ValueError(f"UNKNOWN DATASETS-> {', '.join(sorted(unknown))}")
+        with self.lock, self.conn:
+            before = self.conn.total_changes
+            self.conn.executemany("INSERT OR IGNORE INTO units VALUES (?, ?, 'pending', 0, NULL, NULL, NULL)",
+                                  [(symbol, dataset) for symbol in symbols for dataset in datasets])
+            return self.conn.total_changes - before
+
+    # units still to be run: pending ones and failed ones with attempts left
+    def pending(self, datasets=DATASETS) -> list:
+        with self.lock:
+            return self.conn.execute(
+                f"SELECT symbol, dataset FROM units WHERE dataset IN ({','.join('?' * len(datasets))}) AND "
+                "(status='pending' OR (status='error' AND attempts<?)) ORDER BY symbol, dataset",
+                (*datasets, self.max_attempts)).fetchall()
+
+    # queue done units of a dataset again, e.g. to bring the candles up to date
+    def reset(self, datasets=DATASETS, status='done') -> int:
+        with self.lock, self.conn:
+            return self.conn.execute(
+                f"UPDATE units SET status='pending', attempts=0 WHERE status=? AND "
+                f"dataset IN ({','.join('?' * len(datasets))})", (status, *datasets)).rowcount
+
+    def _checkpoint(self, symbol, dataset, status, rows=None, error=None):
+        with self.lock, self.conn:
+            self.conn.execute('UPDATE units SET status=?, attempts=attempts+1, updated_at=?, rows=?, error=? '
+                              'WHERE symbol=? AND dataset=?', (status, time.time(), rows, error, symbol, dataset))
+
+    # run every pending unit of the given datasets on `processes` worker processes (all cores by default) and
+    # return {status: units}. Candles of the given resolution are fetched from date_from (20 years back by
+    # default) to date_to (today). progress(done, total) is called after every unit if given. Ctrl+C stops
+    # the job after the units that are running, the rest stays queued
+    def run(self, api_key, datasets=DATASETS, processes=None, calls_per_minute=60, resolution='D', date_from=None,
+            date_to=None, base_api_url='https://finnhub.io/api/v1/', file_format=None, progress=None) -> dict:
+        file_format = file_format or ('parquet' if PARQUET else 'pickle')
+        if file_format == 'parquet' and not PARQUET:
+            raise ImportError('Parquet files need pyarrow, install it with: pip install pyarrow')
+        date_to = date_to or str(dt.date.today())
+        date_from = date_from or str(dt.date.fromisoformat(date_to) - relativedelta(years=20))
+        options = {'resolution': resolution, 'date_from': date_from, 'date_to': date_to, 'format': file_format}
+
+        units = self.pending(datasets)
+        counts = {}
+        if not units:
+            return counts
+
+        # spawned workers start from a clean interpreter instead of a copy of this one and its threads
+        context = multiprocessing.get_context('spawn')
+        limiter = SharedRateLimiter(calls_per_minute, context=context)
+        executor = ProcessPoolExecutor(max_workers=processes or os.cpu_count(), mp_context=context,
+                                       initializer=_start_worker, initargs=(api_key, base_api_url, limiter))
+        try:
+            futures = {executor.submit(_run_unit, symbol, dataset, self.directory, options): (symbol, dataset)
+                       for symbol, dataset in units}
+            for done, future in enumerate(as_completed(futures), 1):
+                symbol, dataset = futures[future]
+                try:
+                    status, rows, error = future.result()
+                except BrokenProcessPool:
+                    raise
+                except Exception as failure:
+                    # network errors once the connector's retries are used up, unexpected payloads, full disks.
+                    # The unit is tried again on the next run, the job itself goes on
+                    status, rows, error = 'error', None, f'{type(failure).__name__}: {failure}'
+                self._checkpoint(symbol, dataset, status, rows, error)
+                counts[status] = counts.get(status, 0) + 1
+                if progress is not None:
+                    progress(done, len(units))
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+        return counts
+
+    # units per dataset and status
+    def status(self) -> pd.DataFrame:
+        with self.lock:
+            rows = self.conn.execute('SELECT dataset, status, COUNT(*) FROM units GROUP BY dataset, status'
+                                     ).fetchall()
+        df = pd.DataFrame(rows, columns=['Dataset', 'Status', 'Units'])
+        return df.pivot(index='Dataset', columns='Status', values='Units').fillna(0).astype(int)
+
+    def failed(self) -> pd.DataFrame:
+        with self.lock:
+            rows = self.conn.execute("SELECT symbol, dataset, attempts, updated_at, error FROM units "
+                                     "WHERE status='error' ORDER BY symbol").fetchall()
+        return pd.DataFrame([(symbol, dataset, attempts, pd.Timestamp(updated_at, unit='s', tz='UTC'), error)
+                             for symbol, dataset, attempts, updated_at, error in rows],
+                            columns=['Symbol', 'Dataset', 'Attempts', 'Updated', 'Error'])
+
+
+# the file of one part of a dataset, e.g. ('AAPL', 'basic_financials', 'annual')
+def unit_path(directory, symbol, dataset, part, file_format='parquet') -> str:
+    extension = 'parquet' if file_format == 'parquet' else 'pkl'
+    # symbols such as 'BRK/A' are kept valid file names
+    return os.path.join(directory, dataset, f"{symbol.replace('/', '_')}.{part}.{extension}")
+
+
+# a backfilled frame, from the Parquet file or the pickle, whichever was written
+def load(directory, symbol, dataset, part=None) -> pd.DataFrame:
+    part = part or {'candles': 'candles', 'basic_financials': 'metric', 'earnings': 'earnings'}[dataset]
+    path = unit_path(directory, symbol, dataset, part)
+    if os.path.exists(path):
+        return pd.read_parquet(path)
+    path = unit_path(directory, symbol, dataset, part, 'pickle')
+    if os.path.exists(path):
+        return pd.read_pickle(path)
+    raise ValueError(f'THERE IS NO BACKFILLED DATA FOR-> {symbol} {dataset} {part}')
+
+
+# -- worker processes
+
+_connector = None
+
+
+def _start_worker(api_key, base_api_url, limiter):
+    global _connector
+    # a worker handles one unit at a time, a couple of connections cover the windows of a long candle range
+    _connector = FinnhubConnector(api_key, base_api_url=base_api_url, rate_limiter=limiter, pool_size=2)
+
+
+# fetch, normalize and write one unit, returns (status, rows written, error). Only a symbol without data (the
+# connector's ValueError for a no_data or empty answer) is 'empty'. Anything else is recorded as 'error' so the
+# next run tries again: connection errors, HTTP errors once the retries are used up, error answers of the API
+# such as an invalid key (FinnhubAPIError) and undecodable responses, which are all OSErrors.
+# Files are written under a temporary name and renamed, so a unit interrupted half way leaves no partial file
+def _run_unit(symbol, dataset, directory, options) -> tuple:
+    try:
+        if dataset == 'candles':
+            parts = {'candles': _connector.get_stock_candles(symbol, options['resolution'], options['date_from'],
+                                                             options['date_to'], compact=True)}
+        elif dataset == 'basic_financials':
+            financials = _connector.get_basic_financials(symbol)
+            # only the numeric metrics are kept, as one row
+            metric = pd.to_numeric(financials['past_year']['metric'], errors='coerce').dropna()
+            parts = {'annual': financials['annual'], 'quarterly': financials['quarterly'],
+                     'metric': metric.to_frame(symbol).T}
+        else:
+            parts = {'earnings': _connector.get_earnings_surprises(symbol)}
+    except OSError as error:
+        # returned rather than raised, some of these (requests' JSONDecodeError) cannot be unpickled in the
+        # parent process and would break the whole pool
+        return 'error', None, f'{type(error).__name__}: {error}'
+    except ValueError as no_data:
+        return 'empty', 0, str(no_data)
+
+    rows = 0
+    for part, df in parts.items():
+        path = unit_path(directory, symbol, dataset, part, options['format'])
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temporary = f'{path}.{os.getpid()}.tmp'
+        if options['format'] == 'parquet':
+            df.to_parquet(temporary)
+        else:
+            df.to_pickle(temporary)
+        os.replace(temporary, path)
+        rows += len(df)
+    return 'done', rows, None
+
+
+# python backfill.py                                   (every US symbol, all datasets, API key from FINNHUB_API_KEY)
+# python backfill.py AAPL MSFT --datasets candles --resolution D --from 2010-01-01
+# python backfill.py --status
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Backfill candles, fundamentals and earnings of many symbols')
+    parser.add_argument('symbols', nargs='*', help='symbols to add to the queue, the US universe by default')
+    parser.add_argument('--dir', default='finnhub_backfill')
+    parser.add_argument('--datasets', nargs='+', default=list(DATASETS), help=f"any of {', '.join(DATASETS)}")
+    parser.add_argument('--processes', type=int, help='worker processes, one per core by default')
+    parser.add_argument('--calls-per-minute', type=int, default=60, help='API quota shared by all workers')
+    parser.add_argument('--resolution', default='D')
+    parser.add_argument('--from', dest='date_from', help='first candle day (yyyy-mm-dd), 20 years ago by default')
+    parser.add_argument('--to', dest='date_to', help='last candle day (yyyy-mm-dd), today by default')
+    parser.add_argument('--refresh', action='store_true', help='queue the finished units of the datasets again')
+    parser.add_argument('--status', action='store_true', help='only show the state of the queue')
+    args = parser.parse_args()
+    unknown = set(args.datasets) - set(DATASETS)
+    if unknown:
+        parser.error(f"unknown datasets: {', '.join(sorted(unknown))}")
+
+    backfill = Backfill(args.dir)
+    if not args.status:
+        api_key = os.environ.get('FINNHUB_API_KEY')
+        if not api_key:
+            parser.error('set the FINNHUB_API_KEY environment variable')
+        base_api_url = os.environ.get('FINNHUB_API_URL', 'https://finnhub.io/api/v1/')
+        symbols = args.symbols
+        if not symbols:
+            with FinnhubConnector(api_key, base_api_url=base_api_url) as connector:
+                symbols = connector.get_north_american_stocks()['Symbol'].tolist()
+        print(f'{backfill.plan(symbols, args.datasets)} units added to the queue')
+        if args.refresh:
+            print(f'{backfill.reset(args.datasets)} finished units queued again')
+
+        started = time.perf_counter()
+
+        def show(done, total):
+            rate = done / (time.perf_counter() - started)
+            print(f'\r{done}/{total} units, {rate:.1f}/s, {(total - done) / rate / 60:.0f} min left   ', end='',
+                  flush=True)
+
+        try:
+            counts = backfill.run(api_key, args.datasets, args.processes, args.calls_per_minute, args.resolution,
+                                  args.date_from, args.date_to, base_api_url, progress=show)
+            print(f"\n{', '.join(f'{count} {status}' for status, count in counts.items()) or 'nothing to do'}")
+        except KeyboardInterrupt:
+            print('\nstopped, run the same command again to resume')
+    print(backfill.status())
+    backfill.close()
@@ -0,0 +1,66 @@
+import argparse
+import sys
+
+from benchmarks import bench_normalize, bench_portfolio
+from benchmarks.mock_finnhub import MockFinnhub
+from benchmarks.report import compare, format_table, load, result, save
+
+# Run the benchmark suites against the local mock and print one table, optionally saving the run and
+# comparing it with an earlier one. With --compare the exit status is 1 when any result got worse than
+# --threshold, so the command can gate a deploy:
+#   python -m benchmarks --save baseline.json
+#   python -m benchmarks --compare baseline.json --threshold 0.25
+# Timings depend on the machine, only compare runs made on the same one
+
+SUITES = ('normalize', 'portfolio', 'connector', 'stream', 'dashapp')
+
+
+def normalize_results() -> list:
+    results = []
+    for name, points, legacy, vectorized in bench_normalize.run():
+        results.append(result('normalize', f'{name} {points} apply', legacy))
+        results.append(result('normalize', f'{name} {points} vectorized', vectorized))
+    return results
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog='python -m benchmarks', description='Finnhub connector benchmarks')
+    parser.add_argument('suites', nargs='*', help=f"suites to run, all by default ({', '.join(SUITES)})")
+    parser.add_argument('--repeat', type=int, default=5, help='timed runs per benchmark, the median is kept')
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds the mock waits before every response')
+    parser.add_argument('--recordings', help='directory with recorded API responses for the mock to serve')
+    parser.add_argument('--save', help='write the results to this JSON file')
+    parser.add_argument('--compare', help='JSON file of an earlier run to compare with')
+    parser.add_argument('--threshold', type=float, default=0.2, help='relative slowdown counted as regression')
+    args = parser.parse_args(argv)
+    unknown = set(args.suites) - set(SUITES)
+    if unknown:
+        parser.error(f"unknown suites: {', '.join(sorted(unknown))}")
+    args.suites = args.suites or list(SUITES)
+
+    results = []
+    if 'normalize' in args.suites:
+        results.extend(normalize_results())
+    if 'portfolio' in args.suites:
+        results.extend(bench_portfolio.run(args.repeat))
+    with MockFinnhub(recordings=args.recordings, latency=args.latency) as mock:
+        # imported here so running only the normalize suite does not need dash
+        if 'connector' in args.suites:
+            from benchmarks import bench_connector
+            results.extend(bench_connector.run(mock, args.repeat))
+        if 'stream' in args.suites:
+            from benchmarks import bench_stream
+            results.extend(bench_stream.run(mock))
+        if 'dashapp' in args.suites:
+            from benchmarks import bench_dashapp
+            results.extend(bench_dashapp.run(mock, args.repeat))
+
+    rows = compare(results, load(args.compare) if args.compare else [], args.threshold)
+    print(format_table(rows))
+    if args.save:
+        save(args.save, results)
+    return 1 if any(regression for *_, regression in rows) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,78 @@
+import asyncio
+import json
+import os
+import tempfile
+
+from async_finnhub_connector import AsyncFinnhubConnector
+from candle_cache import CandleCache
+from finnhub_connector import FinnhubConnector
+import finnhub_normalize
+
+from benchmarks.mock_finnhub import MockFinnhub
+from benchmarks.report import measure, once, result
+
+# Time the connector methods against the mock server: the REST round trip, JSON decoding and normalization
+# for small payloads, long candle and news ranges that are split into many windows, the candle cache and
+# the async bulk calls. The rate limiter is opened up so only our own code is measured.
+# Run from the repository root: python -m benchmarks.bench_connector
+
+SUITE = 'connector'
+SYMBOLS = ['AAPL', 'MSFT', 'AMZN', 'AMD', 'TSLA'] + [f'S{i:05d}' for i in range(45)]
+
+
+def run(mock: MockFinnhub, repeat=5) -> list:
+    results = []
+    connector = FinnhubConnector('benchmark', base_api_url=mock.rest_url, websocket_url=mock.ws_url,
+                                 calls_per_minute=10**6)
+
+    for name, call in [('get_current_quote', lambda: connector.get_current_quote('AAPL')),
+                       ('get_earnings_surprises', lambda: connector.get_earnings_surprises('AAPL')),
+                       ('get_basic_financials', lambda: connector.get_basic_financials('AAPL')),
+                       ('get_metric_snapshot', lambda: connector.get_metric_snapshot('AAPL')),
+                       ('look_up_stock', lambda: connector.look_up_stock('AAPL')),
+                       (f'get_north_american_stocks ({mock.n_symbols} rows)', connector.get_north_american_stocks),
+                       ('get_company_news (1 year)',
+                        lambda: connector.get_company_news('AAPL', '2023-01-01', '2023-12-31')),
+                       ('get_stock_candles (3 years daily)',
+                        lambda: connector.get_stock_candles('AAPL', 'D', '2021-01-01', '2023-12-31')),
+                       ('get_stock_candles (1 year 1 min)',
+                        lambda: connector.get_stock_candles('AAPL', '1', '2023-01-01', '2023-12-31')),
+                       ('get_stock_candles (1 year 1 min, compact)',
+                        lambda: connector.get_stock_candles('AAPL', '1', '2023-01-01', '2023-12-31', compact=True))]:
+        results.append(result(SUITE, name, measure(call, repeat)))
+
+    # the same large window through the candle cache, first filling it and then served from SQLite
+    with tempfile.TemporaryDirectory() as directory:
+        cached = FinnhubConnector('benchmark', base_api_url=mock.rest_url, calls_per_minute=10**6,
+                                  candle_cache=CandleCache(os.path.join(directory, 'candles.sqlite')))
+        window = ('AAPL', '1', '2023-01-01', '2023-12-31')
+        results.append(result(SUITE, 'get_stock_candles (1 year 1 min, cold cache)',
+                              once(lambda: cached.get_stock_candles(*window))))
+        results.append(result(SUITE, 'get_stock_candles (1 year 1 min, warm cache)',
+                              measure(lambda: cached.get_stock_candles(*window), repeat)))
+        cached.candle_cache.close()
+        cached.close()
+
+    # parse and normalize cost on their own, without the HTTP round trip
+    payload = json.dumps(mock.respond('stock/candle', {'symbol': 'AAPL', 'resolution': '1', 'from': '1672531200',
+                                                       'to': '1704067199'})[1])
+    results.append(result(SUITE, 'json decode (1 year 1 min candles)', measure(lambda: json.loads(payload), repeat)))
+    decoded = json.loads(payload)
+    results.append(result(SUITE, 'candles_frame (1 year 1 min)',
+                          measure(lambda: finnhub_normalize.candles_frame(decoded), repeat)))
+    metric = mock.respond('stock/metric', {'symbol': 'AAPL'})[1]
+    results.append(result(SUITE, 'basic_financials normalize',
+                          measure(lambda: finnhub_normalize.basic_financials(metric), repeat)))
+
+    # bulk calls through the async wrapper, closing it closes the wrapped connector as well
+    client = AsyncFinnhubConnector(connector=connector, max_concurrency=10)
+    results.append(result(SUITE, f'get_current_quote_many ({len(SYMBOLS)} symbols)',
+                          measure(lambda: asyncio.run(client.get_current_quote_many(SYMBOLS)), repeat)))
+    client.close()
+    return results
+
+
+if __name__ == '__main__':
+    from benchmarks.report import compare, format_table
+    with MockFinnhub() as server:
+        print(format_table(compare(run(server), [])))
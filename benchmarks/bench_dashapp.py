@@ -0,0 +1,111 @@
+import importlib
+import json
+import os
+import sys
+import tempfile
+import time
+
+from benchmarks.mock_finnhub import MockFinnhub
+from benchmarks.report import measure, once, result
+
+# Startup time of the dashboard and the latency of its callbacks, served by the mock instead of Finnhub.
+# Callbacks are called the way the browser calls them, through Flask's test client posting to
+# /_dash-update-component, so dash's own (de)serialization is part of the numbers. Each callback is timed
+# once cold (nothing cached, the data comes from the mock) and then warm (served from the server cache).
+# The app writes its local stores into a temporary directory.
+# Run from the repository root: python -m benchmarks.bench_dashapp
+
+SUITE = 'dashapp'
+
+
+class DashClient:
+
+    def __init__(self, app):
+        self.app = app
+        self.client = app.server.test_client()
+
+    # call the callback that writes `output` (e.g. 'graph0.figure') when `trigger` changes, values holds the
+    # 'id.property' values of its inputs and state
+    def call(self, output, trigger, values):
+        key, spec = next((key, spec) for key, spec in self.app.callback_map.items()
+                         if output in key and any(f"{item['id']}.{item['property']}" == trigger
+                                                  for item in spec['inputs']))
+        outputs = [{'id': name.split('.', 1)[0], 'property': name.split('.', 1)[1]}
+                   for name in key.strip('.').split('...')]
+        body = {'output': key, 'outputs': outputs if key.startswith('..') else outputs[0],
+                'inputs': [dict(item, value=values.get(f"{item['id']}.{item['property']}"))
+                           for item in spec['inputs']],
+                'state': [dict(item, value=values.get(f"{item['id']}.{item['property']}"))
+                          for item in spec['state']],
+                'changedPropIds': [trigger]}
+        response = self.client.post('/_dash-update-component', json=body)
+        if response.status_code not in (200, 204):
+            raise RuntimeError(f'{output} FAILED WITH {response.status_code}: {response.get_data(as_text=True)}')
+        return json.loads(response.get_data(as_text=True))['response'] if response.status_code == 200 else None
+
+
+def run(mock: MockFinnhub, repeat=5) -> list:
+    results = []
+    os.environ['FINNHUB_API_URL'] = mock.rest_url
+    os.environ['FINNHUB_WS_URL'] = mock.ws_url
+    mock.max_messages, mock.trade_rate, mock.trades_per_message = None, 200, 5
+
+    with tempfile.TemporaryDirectory() as directory:
+        # the first create_app call also pays for importing dash, plotly and pandas, the second one is what
+        # every further app (or gunicorn worker importing them before forking) costs
+        if 'finn_dashapp' not in sys.modules:
+            results.append(result(SUITE, 'import finn_dashapp', once(lambda: importlib.import_module('finn_dashapp'))))
+        module = sys.modules['finn_dashapp']
+        apps = []
+        results.append(result(SUITE, 'create_app (first)', once(lambda: apps.append(
+            module.create_app('benchmark', data_dir=os.path.join(directory, 'first'), background=False)))))
+        results.append(result(SUITE, 'create_app', once(lambda: apps.append(
+            module.create_app('benchmark', data_dir=directory)))))
+        client = DashClient(apps[-1])
+        results.append(result(SUITE, 'GET /_dash-layout', measure(lambda: client.client.get('/_dash-layout'),
+                                                                  repeat)))
+        results.extend(_callbacks(client, module, repeat))
+    return results
+
+
+def _callbacks(client, module, repeat):
+    results = []
+    symbol = {'symbol.value': 'AAPL'}
+    calls = [('title', 'title.children', 'symbol.value', symbol),
+             ('symbol search', 'symbol.options', 'symbol.search_value',
+              {'symbol.search_value': 'S001', 'symbol.value': 'AAPL'}),
+             ('basic info', 'basic-info.figure', 'symbol.value', symbol),
+             ('earnings', 'earnings.figure', 'symbol.value', symbol),
+             ('quote', 'quote.figure', 'symbol.value', symbol),
+             ('news panel', 'news.children', 'symbol.value', symbol),
+             ('quote board', 'quote-board.data', 'board-interval.n_intervals',
+              {'board-interval.n_intervals': 1, 'board-state.data': None}),
+             ('annual', 'graph.figure', 'dropdown.value', dict(symbol, **{'dropdown.value': 'Book Value (USD)'})),
+             ('quarterly', 'graph2.figure', 'dropdown2.value',
+              dict(symbol, **{'dropdown2.value': 'Book Value (USD)'}))]
+    for timeframe in module.timeframes:
+        calls.append((f'candles {timeframe}', 'graph0.figure', 'dropdown0.value',
+                      dict(symbol, **{'dropdown0.value': timeframe, 'overlays.value': []})))
+    calls.append(('candles with all indicators', 'graph0.figure', 'overlays.value',
+                  dict(symbol, **{'dropdown0.value': 'Last trading day (1 min)',
+                                  'overlays.value': ['SMA 20', 'SMA 50', 'EMA 20', 'BB 20 2', 'VWAP', 'RSI 14',
+                                                     'MACD']})))
+
+    for name, output, trigger, values in calls:
+        results.append(result(SUITE, f'{name} (cold)', once(lambda: client.call(output, trigger, values))))
+        results.append(result(SUITE, f'{name} (warm)', measure(lambda: client.call(output, trigger, values), repeat)))
+
+    # live candle updates while the mock streams trades for the symbol the chart subscribed to
+    state = client.call('graph0.figure', 'overlays.value', calls[-1][3])['live-state']['data']
+    time.sleep(1)
+    live = {'live-interval.n_intervals': 1, 'live-state.data': state}
+    results.append(result(SUITE, 'live candle update', measure(lambda: client.call('graph0.figure@',
+                                                                                   'live-interval.n_intervals',
+                                                                                   live), repeat)))
+    return results
+
+
+if __name__ == '__main__':
+    from benchmarks.report import compare, format_table
+    with MockFinnhub() as server:
+        print(format_table(compare(run(server), [])))
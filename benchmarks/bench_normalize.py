@@ -0,0 +1,78 @@
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+import finnhub_normalize
+
+# Compare the old per-row apply normalization of candle and metric payloads with the vectorized
+# finnhub_normalize layer on synthetic payloads of growing size.
+# Run from the repository root: python -m benchmarks.bench_normalize
+
+
+def candle_payload(rows):
+    start = 1_600_000_000
+    close = 100 + np.cumsum(np.random.default_rng(0).normal(0, 0.1, rows))
+    return {'c': close.tolist(), 'h': (close + 0.2).tolist(), 'l': (close - 0.2).tolist(),
+            'o': close.tolist(), 's': 'ok', 't': list(range(start, start + 60 * rows, 60)),
+            'v': np.random.default_rng(1).integers(100, 10_000, rows).tolist()}
+
+
+def series_payload(metrics, periods):
+    dates = pd.date_range('1990-01-01', periods=periods, freq='Q').strftime('%Y-%m-%d')
+    return {f'metric{m}': [{'period': d, 'v': float(m + i)} for i, d in enumerate(dates)] for m in range(metrics)}
+
+
+# the candle and series normalization as they were written before finnhub_normalize existed
+def legacy_candles(payload):
+    df = pd.DataFrame(payload)
+    df.set_index(df['t'].apply(lambda x: datetime.utcfromtimestamp(x).strftime('%Y-%m-%d %H:%M:%S')), inplace=True)
+    df.rename(columns={'c': 'Close', 'h': 'High', 'l': 'Low', 'o': 'Open', 's': 'Status',
+                       'v': 'Volume'}, inplace=True)
+    df.index.rename('Datetime', inplace=True)
+    df.drop(['t'], axis=1, inplace=True)
+    return df
+
+
+def legacy_series(fiscal_period):
+    fiscal_df = pd.DataFrame({key: pd.Series(value) for key, value in fiscal_period.items()})
+    periods = []
+    for i in fiscal_period.values():
+        if len(i) == len(fiscal_df):
+            for d in i:
+                periods.append(d['period'])
+            break
+    for col in fiscal_df.columns:
+        fiscal_df[col] = fiscal_df[col].apply(lambda x: x.get('v') if type(x) == dict else np.nan)
+    fiscal_df.set_index([periods], inplace=True)
+    fiscal_df.sort_index(ascending=True, inplace=True)
+    return fiscal_df
+
+
+def best_of(func, payload, repeat=3) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(payload)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def run() -> list:
+    results = []
+    for rows in (10_000, 100_000, 500_000):
+        payload = candle_payload(rows)
+        results.append(('candles', rows, best_of(legacy_candles, payload),
+                        best_of(finnhub_normalize.candles_frame, payload)))
+    for metrics in (30, 120):
+        payload = series_payload(metrics, 160)
+        results.append(('financial series', metrics * 160, best_of(legacy_series, payload),
+                        best_of(finnhub_normalize.financial_series_frame, payload)))
+    return results
+
+
+if __name__ == '__main__':
+    print(f"{'payload':<18}{'points':>10}{'apply (s)':>12}{'vectorized (s)':>16}{'speedup':>10}")
+    for name, points, legacy, vectorized in run():
+        print(f'{name:<18}{points:>10}{legacy:>12.4f}{vectorized:>16.4f}{legacy / vectorized:>9.1f}x')
@@ -0,0 +1,49 @@
+import numpy as np
+import pandas as pd
+
+from portfolio import Portfolio, price_matrix
+
+from benchmarks.report import measure, result
+
+# Portfolio analytics on cached data: 500 symbols of three years of daily candles (some listed later, a few
+# bars missing) are aligned into one matrix, then the correlation matrix and the full set of analytics the
+# dashboard's portfolio tab shows are computed. No API calls are involved, the frames stand in for the
+# candles the connector has already cached.
+# Run from the repository root: python -m benchmarks.bench_portfolio
+
+SUITE = 'portfolio'
+
+
+def candle_frames(symbols=500, days=756, seed=0) -> dict:
+    rng = np.random.default_rng(seed)
+    index = pd.date_range('2021-01-04', periods=days, freq='B', tz='UTC', name='Datetime')
+    frames = {}
+    for i in range(symbols):
+        dates = index[rng.integers(0, days // 10):]
+        dates = dates[rng.random(len(dates)) > 0.01]
+        close = 100 * np.exp(np.cumsum(rng.normal(0, 0.02, len(dates))))
+        frames[f'S{i:03d}'] = pd.DataFrame({'Close': close}, index=dates)
+    return frames
+
+
+def analytics(portfolio):
+    portfolio.volatility()
+    portfolio.correlation()
+    portfolio.drawdowns()
+    portfolio.pnl()
+    portfolio.summary()
+
+
+def run(repeat=5, symbols=500, days=756) -> list:
+    frames = candle_frames(symbols, days)
+    portfolio = Portfolio.from_frames(frames)
+    label = f'{symbols} symbols x {days} days'
+    return [result(SUITE, f'align ({label})', measure(lambda: price_matrix(frames), repeat)),
+            result(SUITE, f'correlation ({label})', measure(lambda: Portfolio.from_frames(frames).correlation(),
+                                                            repeat)),
+            result(SUITE, f'all analytics ({label})', measure(lambda: analytics(portfolio), repeat))]
+
+
+if __name__ == '__main__':
+    from benchmarks.report import compare, format_table
+    print(format_table(compare(run(), [])))
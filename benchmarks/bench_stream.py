@@ -0,0 +1,71 @@
+import asyncio
+import time
+
+from candle_aggregator import CandleAggregator
+from finnhub_stream import FinnhubStream
+
+from benchmarks.mock_finnhub import MockFinnhub
+from benchmarks.report import percentile, result
+
+# Throughput and latency of the live trade stream against the mock websocket: how many trades per second
+# FinnhubStream turns into TradeBatch objects when the server sends as fast as it can, once with the
+# candle aggregator as on_batch callback (what the dashboard does) and once through the queue, and how long
+# a trade takes from being sent to reaching the callback at a steady message rate. The mock runs in the
+# same process, so the rates are a lower bound of what the stream manages against the real API.
+# Run from the repository root: python -m benchmarks.bench_stream
+
+SUITE = 'stream'
+
+
+async def _consume(mock, messages, trades_per_message, rate=None, mode='callback'):
+    mock.max_messages, mock.trades_per_message, mock.trade_rate = messages, trades_per_message, rate
+    target = messages * trades_per_message
+    state = {'trades': 0, 'first': None, 'latencies': []}
+    done = asyncio.Event()
+    aggregator = CandleAggregator()
+
+    def on_batch(batch):
+        now = time.time() * 1000
+        if state['first'] is None:
+            state['first'] = time.perf_counter()
+        aggregator.add_batch(batch)
+        state['latencies'].append(now - batch.timestamps[0])
+        state['trades'] += len(batch)
+        if state['trades'] >= target:
+            done.set()
+
+    stream = FinnhubStream('benchmark', ['AAPL', 'MSFT'], url=mock.ws_url, reconnect_delay=60,
+                           on_batch=on_batch if mode == 'callback' else None)
+    if mode == 'callback':
+        task = asyncio.create_task(stream.run())
+        await asyncio.wait_for(done.wait(), timeout=120)
+    else:
+        async for batch in stream:
+            on_batch(batch)
+            if done.is_set():
+                break
+        task = stream.task
+    elapsed = time.perf_counter() - state['first']
+    await stream.stop()
+    await task
+    return state['trades'] / elapsed, state['latencies']
+
+
+def run(mock: MockFinnhub, messages=20000, trades_per_message=10) -> list:
+    results = []
+    rate, _ = asyncio.run(_consume(mock, messages, trades_per_message))
+    results.append(result(SUITE, f'trades/s (on_batch + aggregator, {trades_per_message}/msg)', rate,
+                          'trades/s', 'higher'))
+    rate, _ = asyncio.run(_consume(mock, messages, trades_per_message, mode='queue'))
+    results.append(result(SUITE, f'trades/s (queue, {trades_per_message}/msg)', rate, 'trades/s', 'higher'))
+
+    _, latencies = asyncio.run(_consume(mock, 3000, 5, rate=1000))
+    results.append(result(SUITE, 'latency p50 (1000 msg/s)', percentile(latencies, 50), 'ms'))
+    results.append(result(SUITE, 'latency p99 (1000 msg/s)', percentile(latencies, 99), 'ms'))
+    return results
+
+
+if __name__ == '__main__':
+    from benchmarks.report import compare, format_table
+    with MockFinnhub() as server:
+        print(format_table(compare(run(server), [])))
@@ -0,0 +1,264 @@
+import asyncio
+import datetime as dt
+import json
+import os
+import threading
+import time
+import urllib.parse
+import zlib
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import websockets
+
+from candle_cache import RESOLUTION_SECONDS
+
+# Local stand-in for the Finnhub REST and websocket APIs, so the benchmarks measure our own code instead of
+# the network and the free tier rate limit. Every endpoint the connector uses answers with synthetic data
+# of realistic shape and size (candles for any window and resolution, a US listing of n_symbols rows, a
+# news item per day, full stock/metric series). A recorded response can be served instead by saving it as
+# <recordings>/<endpoint with / replaced by _>.json, or <endpoint>__<SYMBOL>.json for one symbol only, e.g.
+# recordings/stock_metric__AAPL.json.
+# The websocket sends trade messages for the subscribed symbols at trade_rate messages per second (as fast as
+# possible when None) with trades_per_message trades each, until max_messages have been sent.
+#
+#   with MockFinnhub() as mock:
+#       connector = FinnhubConnector('key', base_api_url=mock.rest_url, websocket_url=mock.ws_url)
+
+
+class MockFinnhub:
+
+    def __init__(self, recordings=None, latency=0.0, n_symbols=5000, throttle_every=0, trade_rate=None,
+                 trades_per_message=10, max_messages=None, garbage_every=0):
+        self.recordings = recordings
+        self.latency = latency
+        self.n_symbols = n_symbols
+        # every n-th REST call is answered with 429 and Retry-After: 0, to exercise the retry path
+        self.throttle_every = throttle_every
+        # every n-th REST call is answered with 200 and an HTML error page, like a proxy in front of the API
+        self.garbage_every = garbage_every
+        self.trade_rate = trade_rate
+        self.trades_per_message = trades_per_message
+        self.max_messages = max_messages
+
+        self.calls = Counter()
+        self.messages_sent = 0
+        self.lock = threading.Lock()
+        self.http = None
+        self.ws_loop = None
+        self.ws_server = None
+        self.ws_port = None
+
+    @property
+    def rest_url(self) -> str:
+        return f'http://127.0.0.1:{self.http.server_port}/api/v1/'
+
+    @property
+    def ws_url(self) -> str:
+        return f'ws://127.0.0.1:{self.ws_port}'
+
+    def start(self) -> 'MockFinnhub':
+        self.http = ThreadingHTTPServer(('127.0.0.1', 0), _handler(self))
+        self.http.daemon_threads = True
+        threading.Thread(target=self.http.serve_forever, name='mock-finnhub-rest', daemon=True).start()
+
+        started = threading.Event()
+
+        def serve():
+            async def main():
+                self.ws_loop = asyncio.get_running_loop()
+                self.ws_server = await websockets.serve(self._trades, '127.0.0.1', 0)
+                self.ws_port = self.ws_server.sockets[0].getsockname()[1]
+                started.set()
+                await self.ws_server.wait_closed()
+            asyncio.run(main())
+
+        threading.Thread(target=serve, name='mock-finnhub-ws', daemon=True).start()
+        started.wait()
+        return self
+
+    def stop(self):
+        self.http.shutdown()
+        self.http.server_close()
+        self.ws_loop.call_soon_threadsafe(self.ws_server.close)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    # -- REST
+
+    def respond(self, endpoint: str, params: dict):
+        with self.lock:
+            self.calls[endpoint] += 1
+            throttled = self.throttle_every and sum(self.calls.values()) % self.throttle_every == 0
+            garbage = self.garbage_every and sum(self.calls.values()) % self.garbage_every == 0
+        if throttled:
+            return 429, {'error': 'API limit reached. Please try again later.'}
+        if garbage:
+            return 200, b'<html><body>502 Bad Gateway</body></html>'
+        if self.latency:
+            time.sleep(self.latency)
+
+        recorded = self._recorded(endpoint, params.get('symbol'))
+        if recorded is not None:
+            return 200, recorded
+        builder = getattr(self, '_' + endpoint.replace('/', '_').replace('-', '_'), None)
+        if builder is None:
+            return 200, {'error': f'unknown endpoint {endpoint}'}
+        return 200, builder(params)
+
+    def _recorded(self, endpoint, symbol):
+        if self.recordings is None:
+            return None
+        name = endpoint.replace('/', '_')
+        for file_name in ([f'{name}__{symbol}.json'] if symbol else []) + [f'{name}.json']:
+            path = os.path.join(self.recordings, file_name)
+            if os.path.exists(path):
+                with open(path) as file:
+                    return json.load(file)
+        return None
+
+    @staticmethod
+    def _rng(*keys):
+        return np.random.default_rng(zlib.crc32(repr(keys).encode()))
+
+    def _stock_candle(self, params):
+        step = RESOLUTION_SECONDS[params['resolution']]
+        start, end = int(params['from']), min(int(params['to']), int(time.time()))
+        t = np.arange(start - start % step + step, end + 1, step, dtype=np.int64)
+        if len(t) == 0:
+            return {'s': 'no_data'}
+        # prices only depend on the bar time, so overlapping windows agree
+        close = 100 + 10 * np.sin(t / 86400 / 30) + np.cos(t / 3600)
+        return {'c': close.round(4).tolist(), 'h': (close + 0.5).round(4).tolist(),
+                'l': (close - 0.5).round(4).tolist(), 'o': (close + 0.1).round(4).tolist(), 's': 'ok',
+                't': t.tolist(), 'v': (1000 + t % 977).tolist()}
+
+    _crypto_candle = _stock_candle
+
+    def _stock_symbol(self, params):
+        symbols = ['AAPL', 'MSFT', 'AMZN', 'AMD', 'TSLA'] + [f'S{i:05d}' for i in range(self.n_symbols - 5)]
+        return [{'currency': 'USD', 'description': f'{symbol} HOLDINGS INC', 'displaySymbol': symbol,
+                 'figi': f'BBG{i:09d}', 'isin': None, 'mic': 'XNAS', 'shareClassFIGI': '', 'symbol': symbol,
+                 'symbol2': '', 'type': 'Common Stock'} for i, symbol in enumerate(symbols)]
+
+    def _crypto_symbol(self, params):
+        return [{'description': f'{params["exchange"]} {base}/USDT', 'displaySymbol': f'{base}/USDT',
+                 'symbol': f'{params["exchange"]}:{base}USDT'} for base in ('BTC', 'ETH', 'SOL', 'ADA', 'XRP')]
+
+    def _search(self, params):
+        query = params.get('q', '').upper()
+        result = [{'description': f'{query} HOLDINGS INC', 'displaySymbol': query, 'symbol': query,
+                   'type': 'Common Stock'}]
+        return {'count': len(result), 'result': result}
+
+    def _company_news(self, params):
+        day, end = dt.date.fromisoformat(params['from']), dt.date.fromisoformat(params['to'])
+        # article IDs are unique across symbols like the real ones
+        base = zlib.crc32(params['symbol'].encode()) % 10**6 * 10**6
+        news = []
+        while day <= end:
+            timestamp = int(dt.datetime(day.year, day.month, day.day, 12, tzinfo=dt.timezone.utc).timestamp())
+            news.append({'category': 'company', 'datetime': timestamp, 'headline': f'{params["symbol"]} news {day}',
+                         'id': base + day.toordinal(), 'image': '', 'related': params['symbol'], 'source': 'mock',
+                         'summary': f'What happened to {params["symbol"]} on {day}', 'url': 'https://example.com'})
+            day += dt.timedelta(days=1)
+        return news
+
+    def _stock_metric(self, params):
+        rng = self._rng('metric', params['symbol'])
+        names = ['bookValue', 'cashRatio', 'currentRatio', 'ebitPerShare', 'eps', 'ev', 'fcfMargin',
+                 'fcfPerShareTTM', 'grossMargin', 'netMargin', 'operatingMargin', 'pb', 'peTTM', 'psTTM',
+                 'quickRatio', 'roaTTM', 'roeTTM', 'roicTTM', 'salesPerShare', 'totalDebtToEquity']
+        annual = {name: [{'period': f'{year}-09-30', 'v': float(rng.normal(10, 5))} for year in range(1990, 2024)]
+                  for name in names}
+        quarterly = {name: [{'period': f'{year}-{month:02d}-30', 'v': float(rng.normal(10, 5))}
+                            for year in range(1990, 2024) for month in (3, 6, 9, 12)] for name in names}
+        metric = {name: float(rng.normal(10, 5)) for name in names}
+        metric.update({'52WeekHigh': 180.5, '52WeekHighDate': '2023-07-31', '52WeekLow': 120.25,
+                       '52WeekLowDate': '2022-10-03', 'beta': 1.2, 'marketCapitalization': 2.5e6})
+        return {'metric': metric, 'metricType': 'all', 'series': {'annual': annual, 'quarterly': quarterly},
+                'symbol': params['symbol']}
+
+    def _stock_earnings(self, params):
+        rng = self._rng('earnings', params['symbol'])
+        return [{'actual': round(float(rng.normal(1.5, 0.3)), 2), 'estimate': 1.5,
+                 'period': f'{year}-{month:02d}-30', 'quarter': month // 3, 'surprise': 0.1,
+                 'surprisePercent': 6.7, 'symbol': params['symbol'], 'year': year}
+                for year in (2023, 2024) for month in (3, 6, 9, 12)][-4:]
+
+    def _quote(self, params):
+        return {'c': 150.1, 'd': 1.2, 'dp': 0.8, 'h': 151.0, 'l': 148.0, 'o': 149.0, 'pc': 148.9,
+                't': int(time.time())}
+
+    # -- websocket
+
+    async def _trades(self, ws):
+        symbols = []
+
+        async def read():
+            async for message in ws:
+                message = json.loads(message)
+                if message.get('type') == 'subscribe' and message['symbol'] not in symbols:
+                    symbols.append(message['symbol'])
+                elif message.get('type') == 'unsubscribe' and message['symbol'] in symbols:
+                    symbols.remove(message['symbol'])
+
+        reader = asyncio.create_task(read())
+        try:
+            sent, started, price = 0, time.perf_counter(), 100.0
+            while self.max_messages is None or sent < self.max_messages:
+                if not symbols:
+                    await asyncio.sleep(0.01)
+                    continue
+                now = int(time.time() * 1000)
+                trades = [{'s': symbols[i % len(symbols)], 'p': price + (i % 7) * 0.01, 't': now, 'v': 10 + i,
+                           'c': ['1']} for i in range(self.trades_per_message)]
+                await ws.send(json.dumps({'type': 'trade', 'data': trades}))
+                sent += 1
+                self.messages_sent += 1
+                if self.trade_rate:
+                    delay = started + sent / self.trade_rate - time.perf_counter()
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                elif sent % 100 == 0:
+                    # let the reader see (un)subscriptions
+                    await asyncio.sleep(0)
+            await ws.close()
+        except websockets.ConnectionClosed:
+            pass
+        finally:
+            reader.cancel()
+
+
+def _handler(mock: MockFinnhub):
+
+    class Handler(BaseHTTPRequestHandler):
+
+        # keep-alive like the real API. Headers and body go out in one write with Nagle off, otherwise every
+        # response waits for the client's delayed ACK and small calls measure ~40 ms of nothing
+        protocol_version = 'HTTP/1.1'
+        disable_nagle_algorithm = True
+        wbufsize = 64 * 1024
+
+        def do_GET(self):
+            url = urllib.parse.urlparse(self.path)
+            endpoint = url.path.split('/api/v1/', 1)[-1].strip('/')
+            status, payload = mock.respond(endpoint, dict(urllib.parse.parse_qsl(url.query)))
+            body = payload if isinstance(payload, bytes) else json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'text/html' if isinstance(payload, bytes) else 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            if status == 429:
+                self.send_header('Retry-After', '0')
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
@@ -0,0 +1,91 @@
+import json
+import platform
+import statistics
+import subprocess
+import time
+from datetime import datetime, timezone
+
+# Shared helpers of the benchmark suites. Every suite returns a list of results, plain dicts of
+# {'suite', 'name', 'value', 'unit', 'better'} where better is 'lower' for timings and 'higher' for rates.
+# A run is saved as JSON together with the versions and the commit it ran on, and compare() lines it up
+# with an earlier run so slowdowns beyond a threshold are flagged as regressions
+
+
+def result(suite: str, name: str, value: float, unit='s', better='lower') -> dict:
+    return {'suite': suite, 'name': name, 'value': float(value), 'unit': unit, 'better': better}
+
+
+# median of `repeat` timed calls after `warmup` untimed ones, the median is less noisy than the mean on a
+# busy machine and unlike the minimum still notices slow paths that are hit every other call
+def measure(func, repeat=5, warmup=1) -> float:
+    for _ in range(warmup):
+        func()
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def once(func) -> float:
+    start = time.perf_counter()
+    func()
+    return time.perf_counter() - start
+
+
+def percentile(values, q) -> float:
+    values = sorted(values)
+    if not values:
+        return float('nan')
+    return values[min(len(values) - 1, int(round(q / 100 * (len(values) - 1))))]
+
+
+def environment() -> dict:
+    import numpy
+    import pandas
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {'time': datetime.now(timezone.utc).isoformat(timespec='seconds'), 'commit': commit,
+            'python': platform.python_version(), 'platform': platform.platform(), 'machine': platform.machine(),
+            'numpy': numpy.__version__, 'pandas': pandas.__version__}
+
+
+def save(path: str, results: list):
+    with open(path, 'w') as file:
+        json.dump({'environment': environment(), 'results': results}, file, indent=1)
+
+
+def load(path: str) -> list:
+    with open(path) as file:
+        return json.load(file)['results']
+
+
+# one row per result: (result, baseline value or None, relative change, regression). The change is positive
+# when the result got worse, whichever direction is better for it
+def compare(results: list, baseline: list, threshold=0.2) -> list:
+    before = {(entry['suite'], entry['name']): entry['value'] for entry in baseline}
+    rows = []
+    for entry in results:
+        old = before.get((entry['suite'], entry['name']))
+        if not old:
+            rows.append((entry, old, None, False))
+            continue
+        change = (entry['value'] - old) / old
+        if entry['better'] == 'higher':
+            change = -change
+        rows.append((entry, old, change, change > threshold))
+    return rows
+
+
+def format_table(rows: list) -> str:
+    lines = [f"{'suite':<10}{'benchmark':<48}{'value':>14}{'unit':>10}{'baseline':>14}{'change':>10}"]
+    for entry, old, change, regression in rows:
+        baseline = '' if old is None else f'{old:>14.4g}'
+        delta = '' if change is None else f'{change:>+9.1%}'
+        lines.append(f"{entry['suite']:<10}{entry['name']:<48}{entry['value']:>14.4g}{entry['unit']:>10}"
+                     f"{baseline:>14}{delta:>10}{'  REGRESSION' if regression else ''}")
+    return '\n'.join(lines)
@@ -0,0 +1,88 @@
+import threading
+from collections import deque
+
+import numpy as np
+import pandas as pd
+
+
+# Folds live trades into rolling OHLCV bars for several minute resolutions at once. Every trade touches only
+# the newest bar of each resolution, so the cost per tick is constant no matter how long the stream has run.
+# Bars are kept as [start_ms, open, high, low, close, volume] lists, the last one per key is still open and
+# keeps changing until a trade for the next interval arrives. Only the most recent max_bars bars are kept
+class CandleAggregator:
+
+    def __init__(self, resolutions=(1, 5, 15), max_bars=2000):
+        self.resolutions = tuple(int(resolution) for resolution in resolutions)
+        self.max_bars = max_bars
+        self.bars = {}
+        self.lock = threading.Lock()
+
+    def add_trade(self, symbol: str, price: float, volume: float, timestamp: int):
+        with self.lock:
+            for resolution in self.resolutions:
+                self._add(symbol, resolution, price, volume, timestamp)
+
+    # feed a finnhub_stream.TradeBatch, can be passed directly as the stream's on_batch callback
+    def add_batch(self, batch):
+        with self.lock:
+            for symbol, price, volume, timestamp in zip(batch.symbols, batch.prices.tolist(), batch.volumes.tolist(),
+                                                        batch.timestamps.tolist()):
+                for resolution in self.resolutions:
+                    self._add(symbol, resolution, price, volume, timestamp)
+
+    def _add(self, symbol, resolution, price, volume, timestamp):
+        bars = self.bars.get((symbol, resolution))
+        if bars is None:
+            bars = self.bars[(symbol, resolution)] = deque(maxlen=self.max_bars)
+        start = timestamp - timestamp % (resolution * 60000)
+
+        if bars and bars[-1][0] == start:
+            bar = bars[-1]
+            if price > bar[2]:
+                bar[2] = price
+            if price < bar[3]:
+                bar[3] = price
+            bar[4] = price
+            bar[5] += volume
+        elif not bars or start > bars[-1][0]:
+            bars.append([start, price, price, price, price, volume])
+        else:
+            # a late trade for an older bar, rare enough to look it up, the close of that bar is left alone
+            for bar in reversed(bars):
+                if bar[0] == start:
+                    bar[2] = max(bar[2], price)
+                    bar[3] = min(bar[3], price)
+                    bar[5] += volume
+                    break
+
+    # bars that started at or after since_ms (UNIX milliseconds), oldest first, as (start, o, h, l, c, v) tuples.
+    # Polling with the start of the last bar already shown returns that bar again (it may have changed)
+    # followed by every newer one
+    def bars_since(self, symbol: str, resolution: int, since_ms: int) -> list:
+        with self.lock:
+            bars = self.bars.get((symbol, int(resolution)))
+            if not bars:
+                return []
+            new = []
+            for bar in reversed(bars):
+                if bar[0] < since_ms:
+                    break
+                new.append(tuple(bar))
+        new.reverse()
+        return new
+
+    # every bar held for a key in the same layout as the connector's candle frames
+    def to_frame(self, symbol: str, resolution: int) -> pd.DataFrame:
+        with self.lock:
+            bars = np.array(self.bars.get((symbol, int(resolution)), ()), dtype=np.float64).reshape(-1, 6)
+        return pd.DataFrame(bars[:, [4, 2, 3, 1, 5]], columns=['Close', 'High', 'Low', 'Open', 'Volume'],
+                            index=pd.DatetimeIndex(pd.to_datetime(bars[:, 0].astype(np.int64), unit='ms', utc=True),
+                                                   name='Datetime'))
+
+    def clear(self, symbol=None):
+        with self.lock:
+            if symbol is None:
+                self.bars.clear()
+            else:
+                for key in [key for key in self.bars if key[0] == symbol]:
+                    del self.bars[key]
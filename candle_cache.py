@@ -0,0 +1,113 @@
+import sqlite3
+import threading
+import time
+
+# length of one bar in seconds for every resolution supported by the candle endpoints
+RESOLUTION_SECONDS = {'1': 60, '5': 300, '15': 900, '30': 1800, '60': 3600,
+                      'D': 86400, 'W': 7 * 86400, 'M': 31 * 86400}
+
+
+# Local candle store backed by SQLite. Bars are kept per (symbol, resolution) together with the list of
+# UNIX time ranges that were already requested from the API, so a repeated request only downloads the
+# parts of the window that have never been fetched (usually just the last bar or two) and the rest is
+# read from disk. Payloads go in and out in the same raw {'c', 'h', 'l', 'o', 's', 't', 'v'} format the
+# API returns, so the connector can normalize cached and live data the same way
+class CandleCache:
+
+    def __init__(self, path='finnhub_candles.sqlite'):
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        with self.conn:
+            self.conn.execute('PRAGMA journal_mode=WAL')
+            self.conn.execute('CREATE TABLE IF NOT EXISTS candles (symbol TEXT, resolution TEXT, t INTEGER, '
+                              'o REAL, h REAL, l REAL, c REAL, v REAL, '
+                              'PRIMARY KEY (symbol, resolution, t)) WITHOUT ROWID')
+            self.conn.execute('CREATE TABLE IF NOT EXISTS ranges (symbol TEXT, resolution TEXT, '
+                              'start INTEGER, end INTEGER)')
+            self.conn.execute('CREATE INDEX IF NOT EXISTS ranges_key ON ranges (symbol, resolution)')
+
+    def close(self):
+        self.conn.close()
+
+    def covered_ranges(self, symbol: str, resolution: str) -> list:
+        with self.lock:
+            rows = self.conn.execute('SELECT start, end FROM ranges WHERE symbol=? AND resolution=? ORDER BY start',
+                                     (symbol, resolution)).fetchall()
+        return [tuple(row) for row in rows]
+
+    # return the (start, end) sub-ranges of the requested window that are not in the store yet
+    def missing_ranges(self, symbol: str, resolution: str, start: int, end: int) -> list:
+        gaps = []
+        cursor = start
+        for covered_start, covered_end in self.covered_ranges(symbol, resolution):
+            if covered_end < cursor:
+                continue
+            if covered_start > end:
+                break
+            if covered_start > cursor:
+                gaps.append((cursor, covered_start - 1))
+            cursor = max(cursor, covered_end + 1)
+        if cursor <= end:
+            gaps.append((cursor, end))
+        return gaps
+
+    # save the bars of an API payload and mark [start, end] as fetched. The part of the window that is
+    # not older than one bar is never marked as covered, because the latest bar is still being updated
+    # by the exchange and has to be fetched again next time
+    def store(self, symbol: str, resolution: str, payload: dict, start: int, end: int):
+        rows = []
+        if payload.get('s') == 'ok' and payload.get('t'):
+            rows = [(symbol, resolution, int(t), o, h, l, c, v) for t, o, h, l, c, v in
+                    zip(payload['t'], payload['o'], payload['h'], payload['l'], payload['c'], payload['v'])]
+        end = min(end, int(time.time()) - RESOLUTION_SECONDS.get(str(resolution), 60))
+
+        with self.lock, self.conn:
+            self.conn.executemany('INSERT OR REPLACE INTO candles VALUES (?, ?, ?, ?, ?, ?, ?, ?)', rows)
+
+            # error responses (no access, bad symbol) must not be remembered as an empty range
+            if start > end or payload.get('s') not in ('ok', 'no_data'):
+                return
+
+            # merge the new range with every range it overlaps or touches so the table stays small
+            overlapping = self.conn.execute('SELECT start, end FROM ranges WHERE symbol=? AND resolution=? '
+                                            'AND start<=? AND end>=?', (symbol, resolution, end + 1, start - 1)
+                                            ).fetchall()
+            for covered_start, covered_end in overlapping:
+                start = min(start, covered_start)
+                end = max(end, covered_end)
+            self.conn.execute('DELETE FROM ranges WHERE symbol=? AND resolution=? AND start<=? AND end>=?',
+                              (symbol, resolution, end + 1, start - 1))
+            self.conn.execute('INSERT INTO ranges VALUES (?, ?, ?, ?)', (symbol, resolution, start, end))
+
+    # read the bars of a window back in the raw API payload format
+    def load(self, symbol: str, resolution: str, start: int, end: int) -> dict:
+        with self.lock:
+            rows = self.conn.execute('SELECT t, o, h, l, c, v FROM candles WHERE symbol=? AND resolution=? '
+                                     'AND t BETWEEN ? AND ? ORDER BY t', (symbol, resolution, start, end)
+                                     ).fetchall()
+        if not rows:
+            return {'s': 'no_data'}
+        t, o, h, l, c, v = (list(column) for column in zip(*rows))
+        return {'c': c, 'h': h, 'l': l, 'o': o, 's': 'ok', 't': t, 'v': v}
+
+    # fetch only the missing gaps through fetch(start, end) -> payload, store them and return the whole window
+    def get_candles(self, symbol: str, resolution: str, start: int, end: int, fetch) -> dict:
+        for gap_start, gap_end in self.missing_ranges(symbol, resolution, start, end):
+            payload = fetch(gap_start, gap_end)
+
+            # hand API errors back untouched instead of returning a window with a hole in it
+            if payload.get('s') not in ('ok', 'no_data'):
+                return payload
+            self.store(symbol, resolution, payload, gap_start, gap_end)
+        return self.load(symbol, resolution, start, end)
+
+    # forget everything stored for a symbol (or only one of its resolutions)
+    def invalidate(self, symbol: str, resolution=None):
+        with self.lock, self.conn:
+            if resolution is None:
+                self.conn.execute('DELETE FROM candles WHERE symbol=?', (symbol,))
+                self.conn.execute('DELETE FROM ranges WHERE symbol=?', (symbol,))
+            else:
+                self.conn.execute('DELETE FROM candles WHERE symbol=? AND resolution=?', (symbol, resolution))
+                self.conn.execute('DELETE FROM ranges WHERE symbol=? AND resolution=?', (symbol, resolution))
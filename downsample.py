@@ -0,0 +1,108 @@
+import numpy as np
+import pandas as pd
+
+# Keep the figures sent to the browser small no matter how long the history is. Candles are merged into
+# coarser OHLCV bars, line series are thinned with LTTB (largest triangle three buckets) which keeps the
+# visual shape of the line, and viewport_ohlcv() spends the bar budget on the part of the chart the user
+# is actually looking at
+
+
+# merge consecutive rows into at most target_bars OHLCV bars. Rows are grouped by position, not by clock
+# time, so nights and weekends do not turn into empty buckets. Each bar is stamped with its first row's time
+def resample_ohlcv(df: pd.DataFrame, target_bars: int) -> pd.DataFrame:
+    n = len(df)
+    if n <= target_bars or target_bars < 1:
+        return df
+
+    size = -(-n // target_bars)
+    starts = np.arange(0, n, size)
+    ends = np.r_[starts[1:] - 1, n - 1]
+    bars = {'Open': df['Open'].to_numpy()[starts],
+            'High': np.maximum.reduceat(df['High'].to_numpy(), starts),
+            'Low': np.minimum.reduceat(df['Low'].to_numpy(), starts),
+            'Close': df['Close'].to_numpy()[ends],
+            'Volume': np.add.reduceat(df['Volume'].to_numpy(), starts)}
+    out = pd.DataFrame({column: bars[column] for column in df.columns if column in bars}, index=df.index[starts])
+    out.attrs = dict(df.attrs)
+    return out
+
+
+# indices of the n_out points LTTB keeps from the line (x, y), always including the first and last point
+def lttb_indices(x, y, n_out: int) -> np.ndarray:
+    n = len(y)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+
+    x = np.asarray(x.asi8 if isinstance(x, pd.DatetimeIndex) else x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    indices = np.empty(n_out, dtype=np.int64)
+    indices[0], indices[-1] = 0, n - 1
+
+    # for every bucket keep the point that forms the largest triangle with the previously kept point and
+    # the average of the next bucket
+    a = 0
+    for i in range(n_out - 2):
+        start, end = edges[i], max(edges[i + 1], edges[i] + 1)
+        next_end = edges[i + 2] if i + 2 < len(edges) else n
+        next_x = x[end:next_end].mean() if next_end > end else x[-1]
+        next_y = np.nanmean(y[end:next_end]) if next_end > end else y[-1]
+        area = np.abs((x[a] - next_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (next_y - y[a]))
+        a = start + int(np.nanargmax(area)) if not np.all(np.isnan(area)) else start
+        indices[i + 1] = a
+    return indices
+
+
+# the series thinned to n_out points, missing values (e.g. an indicator's warm-up) are left out when thinning
+def lttb(series: pd.Series, n_out: int) -> pd.Series:
+    if n_out >= len(series):
+        return series
+    series = series.dropna()
+    return series.iloc[lttb_indices(series.index, series.to_numpy(), n_out)]
+
+
+# the x range of a dash Graph's relayoutData: (start, end) timestamps after a zoom or pan, 'auto' after the
+# user resets the axes and None for layout changes that do not touch the x axis. Any of the first four
+# (shared) x axes counts, so zooming the volume or an indicator row works as well
+def visible_range(relayout):
+    if not relayout:
+        return None
+    for axis in ('xaxis', 'xaxis2', 'xaxis3', 'xaxis4'):
+        if f'{axis}.range[0]' in relayout and f'{axis}.range[1]' in relayout:
+            bounds = relayout[f'{axis}.range[0]'], relayout[f'{axis}.range[1]']
+        elif f'{axis}.range' in relayout:
+            bounds = relayout[f'{axis}.range']
+        elif relayout.get(f'{axis}.autorange'):
+            return 'auto'
+        else:
+            continue
+        return pd.Timestamp(bounds[0], tz='UTC'), pd.Timestamp(bounds[1], tz='UTC')
+    return None
+
+
+# candles for a chart showing the window (start, end) of df: the rows inside the window at full resolution
+# when they fit in target_bars (merged down otherwise), plus a coarse version of the history on either side
+# so the range slider still shows the whole period. window=None shows everything downsampled
+def viewport_ohlcv(df: pd.DataFrame, window, target_bars=1500) -> pd.DataFrame:
+    if window is None or window == 'auto' or len(df) <= target_bars:
+        return resample_ohlcv(df, target_bars)
+
+    start, end = df.index.searchsorted(window[0]), df.index.searchsorted(window[1], side='right')
+    context = max(target_bars // 8, 1)
+    return pd.concat([resample_ohlcv(df.iloc[:start], context),
+                      resample_ohlcv(df.iloc[start:end], target_bars),
+                      resample_ohlcv(df.iloc[end:], context)])
+
+
+# a line drawn over the candles of viewport_ohlcv() (e.g. an indicator computed on the full resolution candles),
+# thinned with LTTB to the same number of points per part of the chart as the candles get, so the line keeps its
+# shape instead of being sampled at the merged bars' start times
+def viewport_line(series: pd.Series, window, target_bars=1500) -> pd.Series:
+    if window is None or window == 'auto' or len(series) <= target_bars:
+        return lttb(series, target_bars)
+
+    start, end = series.index.searchsorted(window[0]), series.index.searchsorted(window[1], side='right')
+    context = max(target_bars // 8, 1)
+    return pd.concat([lttb(series.iloc[:start], context),
+                      lttb(series.iloc[start:end], target_bars),
+                      lttb(series.iloc[end:], context)])
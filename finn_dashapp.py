@@ -1,291 +1,673 @@
-import dash
-import dash_core_components as dcc
-from dash import html
-from dash.dependencies import Input, Output
-import plotly.subplots as ms
-import plotly.graph_objects as go
+import argparse
+import atexit
+import os
+import time
 from datetime import date
+
 from dateutil.relativedelta import relativedelta
-import dash_html_components as html
 
-#Import the Finnhub API connector from another Github repo
-from finnhub_connector import FinnhubConnector
+try:
+    import fcntl
+except ImportError:
+    #not available on Windows (where gunicorn does not run either), every process then runs the background jobs
+    fcntl = None
 
-#define your API connector object that will later be used within the function
-api_key = input('Paste your Finnhub API key: ')
-connector = FinnhubConnector(api_key = api_key)
+#Importing this module only defines the app factory and the static pieces of the layout. Dash, Plotly, pandas and
+#the connector modules are imported by create_app(), and nothing is downloaded or started before it is called:
+#    python finn_dashapp.py --symbol MSFT                         (API key from FINNHUB_API_KEY or --api-key)
+#    gunicorn -w 4 'finn_dashapp:create_server()'
+#Settings that are not passed to create_app() are read from the environment:
+#  FINNHUB_API_KEY             the Finnhub API key
+#  FINNHUB_WATCHLIST           comma separated symbols of the quote board and the news archive
+#  FINNHUB_DATA_DIR            directory of the local candle, snapshot, symbol and news stores (default: current)
+#  FINNHUB_CACHE_DIR           keep the server cache in this directory so several workers share it
+#  FINNHUB_API_URL, FINNHUB_WS_URL   point the app at another server, e.g. the benchmarks' mock
+#  FINNHUB_RECORD_DIR          save every streamed trade to this directory
+#  FINNHUB_REPLAY_DIR          play such a recording back instead of connecting to Finnhub, at
+#  FINNHUB_REPLAY_SPEED        times the recorded pace (0 for full speed)
 
-def run_dash_app(symbol):
-    
-    #Use the get_basic_financials method to get the data frame
-    basic_fin = connector.get_basic_financials(symbol)
-    
-    #Change column names in the symbol[past_year] data frame to prettify for visualization
-    columns = {'bookValue': 'Book Value (USD)',
-    'cashRatio': 'Cash Ratio',
-    'currentRatio': 'Current Ratio',
-    'ebitPerShare': 'EBIT per Share (USD)',
-    'eps': 'Earnings per Share (USD)',
-    'ev': 'Embedded Value (USD)',
-    'fcfMargin': 'Free Cash Flow Margin (USD)',
-    'fcfPerShareTTM': 'Free Cash Flow Per Share (USD)',
-    'grossMargin': 'Gross Margin (%)',
-    'longtermDebtTotalAsset': 'Long Term Debt Total Asset (%)',
-    'longtermDebtTotalCapital': 'Long Term Debt Total Capital (USD)',
-    'longtermDebtTotalEquity': 'Long Term Debt Total Equity (USD)',
-    'netDebtToTotalCapital': 'Net Debt to Total Capital',
-    'netDebtToTotalEquity': 'Net Debt to Total Equity',
-    'netMargin': 'Net Margin (%)',
-    'operatingMargin': 'Operating Margin (%)',
-    'pb': 'Price-to-Book Ratio',
-    'peTTM': 'Price to Earnings TTM',
-    'pfcfTTM': 'Price to Free Cash Flow TTM',
-    'pretaxMargin': 'Pre-tax Margin (USD)',
-    'psTTM': 'Price to Sales TTM',
-    'quickRatio': 'Quick Ratio',
-    'roaTTM': 'Return on Assets (USD)',
-    'roeTTM': 'Return on Equity (USD)',
-    'roicTTM': 'Return on Invested Capital (USD)',
-    'rotcTTM': 'Return on Traded Capital (USD)',
-    'salesPerShare': 'Sales per Share',
-    'sgaToSale': 'SG&A to Sale',
-    'totalDebtToEquity': 'Total Debt to Equity',
-    'totalDebtToTotalAsset': 'Total Debt to Total Asset',
-    'totalDebtToTotalCapital': 'Total Debt to Total Capital',
-    'totalRatio': 'Total Ratio'}
-
-    #Define annual and quarterly data frames from the dictionary output
-    df_annual = basic_fin['annual']
-    df_annual.rename(columns=columns, inplace=True)
-    df_quarterly = basic_fin['quarterly']
-    df_quarterly.rename(columns=columns, inplace=True)
-
-    #Write a recursive helper function to normalize each value within (negative) 5 to 100 range to fit on the graph.
-    #Keep track of the number of recursive calls made in order to know what was the original value.
-    def normalize(x, count=1):
-        if x>100 or x<-100:
-            return normalize(x/10, count*10)
-        elif -5<x<5:
-            return normalize(x*10, count/10)
-        elif count>1:
-            return [round(x, 3), f'(Divided by {int(count)})']
-        elif count<1:
-            return [round(x, 3), f'(Multiplied by {int(1/count)})']
-        else:
-            return x
-
-    #Define the past_year data frame and normalize the values using the above function
-    df_pastyear = basic_fin['past_year']
-    df_pastyear['normalized'] = df_pastyear['metric'].apply(lambda x: normalize(x) if (type(x)== float or type(x)== int) else x)
-    
-    #Get the high and low date for a stock as they are in the datetime format and cannot be normalized
-    highdate = df_pastyear['metric']['52WeekHighDate']
-    lowdate = df_pastyear['metric']['52WeekLowDate']
-    
-    #Create a new column for the normalized values to make them look like: X (multiplied/divided by x)
-    df_pastyear['new'] = df_pastyear.index + ' ' + df_pastyear['normalized'].apply(lambda x: x[1] if type(x)==list else '')
-    
-    #Concatenate the columns and create final values, annotate the date with the 52 week low/high values
-    df_pastyear['normalized_vals'] = df_pastyear['normalized'].apply(lambda x: x[0] if type(x)==list else x)
-    dfs = df_pastyear.drop(['52WeekHighDate','52WeekLowDate'], axis=0)
-    
-    #Create the plotly go figure, make it horizontal for better representation
-    fig = go.Figure(
-        data=[go.Bar(x= dfs['normalized_vals'], y=dfs['new'])],
-        layout_title=f"{symbol} Basic Stock Info")
-    fig.layout.template='plotly_dark'
-    fig.layout.height = 3500
-    fig.update_layout(xaxis_title="Normalized value between (-)(5 to 100)", title_x=0.5, font=dict(size=15))
-    fig.update_traces(marker_color='yellowgreen', orientation='h')
-    fig.add_annotation(x=dfs['normalized_vals']['52WeekHigh']+10, y=4,
-                       text=highdate,
-                       showarrow=False,)
-    fig.add_annotation(x=dfs['normalized_vals']['52WeekLow']+10, y=5,
-                text=lowdate,
-                showarrow=False,)
-
-    #Define a list of dictionaries to create column options for dropdown menu on our annual and quarterly graphs
-    a_and_q_options = [
-                    {'label': 'Book Value (USD)', 'value': 'Book Value (USD)'},
-                    {'label': 'Cash Ratio', 'value': 'Cash Ratio'},
-                    {'label': 'Current Ratio', 'value': 'Current Ratio'},
-                    {'label': 'EBIT per Share (USD)', 'value': 'EBIT per Share (USD)'},
-                    {'label': 'Earnings per Share (USD)', 'value': 'Earnings per Share (USD)'},   
-                    {'label': 'Embedded Value (USD)', 'value': 'Embedded Value (USD)'},
-                    {'label': 'Free Cash Flow Margin (USD)', 'value': 'Free Cash Flow Margin (USD)'},
-                    {'label': 'Free Cash Flow Per Share (USD)', 'value': 'Free Cash Flow Per Share (USD)'},
-                    {'label': 'Gross Margin (%)', 'value': 'Gross Margin (%)'},
-                    {'label': 'Long Term Debt Total Asset (%)', 'value': 'Long Term Debt Total Asset (%)'},
-                    {'label': 'Long Term Debt Total Capital (USD)', 'value': 'Long Term Debt Total Capital (USD)'},
-                    {'label': 'Long Term Debt Total Equity (USD)', 'value': 'Long Term Debt Total Equity (USD)'},
-                    {'label': 'Net Debt to Total Capital', 'value': 'Net Debt to Total Capital'},
-                    {'label': 'Net Debt to Total Equity', 'value': 'Net Debt to Total Equity'},
-                    {'label': 'Net Margin (%)', 'value': 'Net Margin (%)'},
-                    {'label': 'Operating Margin (%)', 'value': 'Operating Margin (%)'},
-                    {'label': 'Price-to-Book Ratio', 'value': 'Price-to-Book Ratio'},
-                    {'label': 'Price to Earnings TTM', 'value': 'Price to Earnings TTM'},
-                    {'label': 'Price to Free Cash Flow TTM', 'value': 'Price to Free Cash Flow TTM'},
-                    {'label': 'Pre-tax Margin (USD)', 'value': 'Pre-tax Margin (USD)'},
-                    {'label': 'Price to Sales TTM', 'value': 'Price to Sales TTM'},
-                    {'label': 'Quick Ratio', 'value': 'Quick Ratio'},
-                    {'label': 'Return on Assets (USD)', 'value': 'Return on Assets (USD)'},
-                    {'label': 'Return on Equity (USD)', 'value': 'Return on Equity (USD)'},
-                    {'label': 'Return on Invested Capital (USD)', 'value': 'Return on Invested Capital (USD)'},
-                    {'label': 'Return on Traded Capital (USD)', 'value': 'Return on Traded Capital (USD)'},
-                    {'label': 'Sales per Share', 'value': 'Sales per Share'},
-                    {'label': 'SG&A to Sale', 'value': 'SG&A to Sale'},
-                    {'label': 'Total Debt to Equity', 'value': 'Total Debt to Equity'},
-                    {'label': 'Total Debt to Total Asset', 'value': 'Total Debt to Total Asset'},
-                    {'label': 'Total Debt to Total Capital', 'value': 'Total Debt to Total Capital'},
-                    {'label': 'Total Ratio', 'value': 'Total Ratio'},
-    ]
-    
-    #Create a grouped bar graph with earnings surprises (predicted and actual)
-    df = connector.get_earnings_surprises(symbol)
-    df['formatted'] = df.index
-    df['formatted'] = df['formatted'].apply(lambda x: str(f'({x})'))
-    df['Quarter'] = df['Quarter'].apply(lambda x: str(x))
-    df['labels'] = df['Quarter']+ '  ' +df['formatted']
-    fig2 = go.Figure(
-        data=[
-            go.Bar(
-                name="Predicted",
-                x=df['labels'],
-                y=df['Estimate'],
-                offsetgroup=0,
-            ),
-            go.Bar(
-                name="Actual",
-                x=df['labels'],
-                y=df['Actual'],
-                offsetgroup=1,
-            ),
-        ],
-        layout=go.Layout(
-            title=f"{symbol} Earnings Surprises",
-            xaxis_title = "Quarter",
-            yaxis_title="Value (USD)",
-        )
-    )
-    fig2.layout.template='plotly_dark'
-    fig2.data[0].marker.color = ('skyblue')
-    fig2.data[1].marker.color = ('tomato')
-    fig2.update_layout(title_x=0.5, font=dict(size=15))
-
-    #Create a data frame for the current quote of our stock
-    df_quote = connector.get_current_quote(symbol)
-    fig3 = go.Figure(data=[go.Table(
-        header=dict(values=df_quote.columns,
-                    align='center',
-                    line_color='black',
-                    fill_color='ivory'),
-        cells=dict(values=[i for i in list(df_quote.iloc[0])],
-                   line_color='black',
-                   fill_color='cyan',
-                   align='center'))
-    ])
-    
-    fig3.layout.template='plotly_dark'
-    fig3.update_layout(width=1669, height=400,
-        title=f"{symbol} Current Quote",
-        title_x=0.5,
-        title_font_color="white",
-        title_font_size = 22,     
-        font=dict(size=20, color='black'))
-    
-    #Define todays date and variables for dating back 3 years, a month, a week, and the last business day,
-    #Which will later be used for cnadlestick charts
-    current_date = date.today()
-    threeyearsago = current_date - relativedelta(years=3)
-    amonthago = current_date - relativedelta(months=1)
-    aweekago = current_date - relativedelta(weeks=1)
-    diff = max(1, (current_date.weekday() + 6) % 7 - 3)  
-    lastweekday = current_date - relativedelta(days=diff)
-    current_date = str(current_date)
-    threeyearsago = str(threeyearsago)
-    amonthago = str(amonthago)
-    aweekago = str(aweekago)
-    lastweekday = str(lastweekday)
-    
-    #Define data frames for candlestick charts
-    df_threeyearsago = connector.get_stock_candles(symbol, 'D', threeyearsago, current_date)
-    df_fifteen = connector.get_stock_candles(symbol, '15', amonthago, current_date)
-    df_five = connector.get_stock_candles(symbol, '5', aweekago, current_date)
-    df_one = connector.get_stock_candles(symbol, '1', lastweekday, current_date)
+DEFAULT_WATCHLIST = 'AAPL,MSFT,AMZN,GOOGL,META,NVDA,TSLA,AMD,NFLX,INTC'
+
+#Change column names in the symbol[past_year] data frame to prettify for visualization
+columns = {'bookValue': 'Book Value (USD)',
+'cashRatio': 'Cash Ratio',
+'currentRatio': 'Current Ratio',
+'ebitPerShare': 'EBIT per Share (USD)',
+'eps': 'Earnings per Share (USD)',
+'ev': 'Embedded Value (USD)',
+'fcfMargin': 'Free Cash Flow Margin (USD)',
+'fcfPerShareTTM': 'Free Cash Flow Per Share (USD)',
+'grossMargin': 'Gross Margin (%)',
+'longtermDebtTotalAsset': 'Long Term Debt Total Asset (%)',
+'longtermDebtTotalCapital': 'Long Term Debt Total Capital (USD)',
+'longtermDebtTotalEquity': 'Long Term Debt Total Equity (USD)',
+'netDebtToTotalCapital': 'Net Debt to Total Capital',
+'netDebtToTotalEquity': 'Net Debt to Total Equity',
+'netMargin': 'Net Margin (%)',
+'operatingMargin': 'Operating Margin (%)',
+'pb': 'Price-to-Book Ratio',
+'peTTM': 'Price to Earnings TTM',
+'pfcfTTM': 'Price to Free Cash Flow TTM',
+'pretaxMargin': 'Pre-tax Margin (USD)',
+'psTTM': 'Price to Sales TTM',
+'quickRatio': 'Quick Ratio',
+'roaTTM': 'Return on Assets (USD)',
+'roeTTM': 'Return on Equity (USD)',
+'roicTTM': 'Return on Invested Capital (USD)',
+'rotcTTM': 'Return on Traded Capital (USD)',
+'salesPerShare': 'Sales per Share',
+'sgaToSale': 'SG&A to Sale',
+'totalDebtToEquity': 'Total Debt to Equity',
+'totalDebtToTotalAsset': 'Total Debt to Total Asset',
+'totalDebtToTotalCapital': 'Total Debt to Total Capital',
+'totalRatio': 'Total Ratio'}
+
+#Column options for the dropdown menus on the annual and quarterly graphs, in the order of the column map
+a_and_q_options = [{'label': name, 'value': name} for name in columns.values()]
+
+#Candlestick timeframes: candle resolution, how far back the window starts (None for the last trading day)
+#and how long the candles stay fresh
+timeframes = {'Three years to date (Daily)': ('D', relativedelta(years=3), 3600),
+              'One month to date (15 min)': ('15', relativedelta(months=1), 300),
+              'One week to date (5 min)': ('5', relativedelta(weeks=1), 120),
+              'Last trading day (1 min)': ('1', None, 60)}
+timeframe_options = [{'label': name, 'value': name} for name in timeframes]
+
+#Minute resolution of the live bars that extend each intraday timeframe
+live_resolutions = {'One month to date (15 min)': 15, 'One week to date (5 min)': 5,
+                    'Last trading day (1 min)': 1}
+
+#Most candles sent to the browser for one chart, longer histories are merged into coarser bars
+max_bars = 1500
+
+#Indicators that can be drawn on the candlestick chart. RSI and MACD get a row of their own below the volume,
+#the others are drawn over the candles
+overlay_options = ['SMA 20', 'SMA 50', 'EMA 20', 'BB 20 2', 'VWAP', 'RSI 14', 'MACD']
+oscillators = ('RSI', 'MACD')
+
+#Periods of the portfolio tab, all cut from the three years of daily candles the candlestick chart also uses
+portfolio_periods = {'Three years': relativedelta(years=3), 'One year': relativedelta(years=1),
+                     'Six months': relativedelta(months=6), 'Three months': relativedelta(months=3)}
+portfolio_columns = {'Symbol': 'Symbol', 'Weight': 'Weight (%)', 'Last Price': 'Last Price (USD)',
+                     'Total Return': 'Total Return (%)', 'Volatility': 'Volatility (%)',
+                     'Max Drawdown': 'Max Drawdown (%)'}
+
+#Rolling window of the volatility chart in trading days
+volatility_window = 20
+
+
+#Lock files held by this process, see background_leader()
+leader_locks = {}
+
+
+#True in the one process that holds the lock on `path`. gunicorn workers each build their own app, the first to
+#get here keeps the lock (and runs the background jobs) until it exits, then the worker started in its place
+#takes over
+def background_leader(path):
+    if fcntl is None or path in leader_locks:
+        return True
+    lock_file = open(path, 'a')
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        lock_file.close()
+        return False
+    leader_locks[path] = lock_file
+    return True
+
+
+#Build the dash app. Anything not given is taken from the environment (see the top of the file), the symbol is
+#only the one shown when the page opens. With background=False no stream, polling or refresh thread is started
+#(e.g. in tests), views then still work from the REST API
+def create_app(api_key=None, symbol='AAPL', watchlist=None, data_dir=None, cache_dir=None, background=True):
+    import dash
+    from dash import Patch, dash_table, dcc, html
+    from dash.dependencies import Input, Output, State
+    from dash.exceptions import PreventUpdate
+    import plotly.subplots as ms
+    import plotly.graph_objects as go
+    import pandas as pd
+
+    from finnhub_connector import FileRateLimiter, FinnhubConnector
+    from candle_cache import CandleCache
+    from candle_aggregator import CandleAggregator
+    from downsample import viewport_line, viewport_ohlcv, visible_range
+    from indicators import IndicatorSet, compute, output_columns
+    from instrumentation import add_metrics_route, instrument_dash, observe, span
+    from metric_scaling import normalize_metrics
+    from news_store import NewsStore
+    from portfolio import Portfolio, load_frames
+    from quote_board import COLUMNS as BOARD_COLUMNS, QuoteBoard
+    from server_cache import LRUCache, make_cache
+    from snapshot_store import SnapshotStore
+    from symbol_catalog import SymbolCatalog
+    from tick_recorder import TickRecorder, TickReplay
+
+    api_key = api_key or os.environ.get('FINNHUB_API_KEY')
+    if not api_key:
+        raise ValueError('NO FINNHUB API KEY, PASS api_key OR SET FINNHUB_API_KEY')
+    if watchlist is None:
+        watchlist = os.environ.get('FINNHUB_WATCHLIST', DEFAULT_WATCHLIST).split(',')
+    watchlist = [name.strip().upper() for name in watchlist if name.strip()]
+    data_dir = data_dir or os.environ.get('FINNHUB_DATA_DIR', '.')
+    os.makedirs(data_dir, exist_ok=True)
+
+    #define your API connector object that will later be used within the function, candles are kept in a local
+    #SQLite file so a restart only downloads the bars that are new since the last run. Fundamentals, earnings and
+    #quotes are kept as versioned snapshots that are only downloaded again once they may have changed (quotes after
+    #15 seconds, fundamentals after a day, earnings around the expected report date). The rate limiter's bucket is
+    #a file in the data directory, so all gunicorn workers together stay under the API quota
+    connector = FinnhubConnector(api_key = api_key,
+                                 rate_limiter = FileRateLimiter(os.path.join(data_dir, 'finnhub_rate_limit')),
+                                 candle_cache = CandleCache(os.path.join(data_dir, 'finnhub_candles.sqlite')),
+                                 snapshot_store = SnapshotStore(os.path.join(data_dir, 'finnhub_snapshots.sqlite')),
+                                 base_api_url = os.environ.get('FINNHUB_API_URL', 'https://finnhub.io/api/v1/'),
+                                 websocket_url = os.environ.get('FINNHUB_WS_URL', 'wss://ws.finnhub.io'))
+
+    #Every dataset is fetched the first time a view needs it and reused until it is older than its TTL (seconds),
+    #so views that are never opened cost nothing and the page itself renders without waiting for the API. The cache
+    #is keyed by symbol and dataset and shared by every user of the server. With a cache directory (or
+    #FINNHUB_CACHE_DIR) all gunicorn workers share it and N users opening the same symbol cause one API call, not N
+    cache = make_cache(cache_dir or os.environ.get('FINNHUB_CACHE_DIR'))
+
+    #Local copy of the US symbol list for the symbol picker, downloaded once a day in the background so searching
+    #as the user types never calls the API
+    catalog = SymbolCatalog(connector, os.path.join(data_dir, 'finnhub_symbols.pkl'))
+
+    #Local news archive of the watchlist and of the symbols open in the dashboard, polled every 15 minutes in the
+    #background so the news panel reads from disk and never waits for the API. An opened symbol is polled until
+    #no page has shown its news for an hour (the panel renews it every minute), at most 50 of them at a time
+    news_store = NewsStore(connector, os.path.join(data_dir, 'finnhub_news.sqlite'), symbols=watchlist)
+
+    #Load the candles of a timeframe, the dates are worked out when the data is (re)fetched
+    def load_candles(symbol, value):
+        resolution, lookback, ttl = timeframes[value]
+
+        def fetch():
+            #Define todays date and the start of the window, dating back 3 years, a month, a week, or to
+            #the last business day
+            current_date = date.today()
+            if lookback is None:
+                diff = max(1, (current_date.weekday() + 6) % 7 - 3)
+                date_from = current_date - relativedelta(days=diff)
+            else:
+                date_from = current_date - lookback
+            return connector.get_stock_candles(symbol, resolution, str(date_from), str(current_date))
+        return cache.get(('candles', symbol, value), fetch, ttl)
+
+    #The portfolio tab uses the daily candles of the candlestick chart, all symbols are loaded at once and symbols
+    #without data are left out
+    def load_portfolio(symbols, weights):
+        frames, failed = load_frames(lambda name: load_candles(name, 'Three years to date (Daily)'), symbols)
+        if not frames:
+            raise ValueError(f"THERE IS NO DATA FOR-> {', '.join(symbols)}")
+        if weights:
+            weights = {name: weights.get(name, 0.0) for name in frames}
+        return Portfolio.from_frames(frames, weights or None, failed=failed)
+
+    #Basic financials feed three views (annual, quarterly and basic info) and only change around earnings,
+    #define annual and quarterly data frames from the dictionary output with prettified column names. The
+    #snapshot store decides when the API is called again, the hour here only bounds how long a new version
+    #takes to show up
+    def load_basic_financials(symbol):
+        def fetch():
+            basic_fin = connector.get_basic_financials(symbol)
+            basic_fin['annual'].rename(columns=columns, inplace=True)
+            basic_fin['quarterly'].rename(columns=columns, inplace=True)
+            return basic_fin
+        return cache.get(('basic_financials', symbol), fetch, 3600)
+
+    def load_earnings(symbol):
+        return cache.get(('earnings', symbol), lambda: connector.get_earnings_surprises(symbol), 3600)
+
+    #Quotes go through the quote board, requests for a symbol the board polls at the same time share one call
+    def load_quote(symbol):
+        return board.quote(symbol)
+
+    #Stream live trades for the viewed symbols in the background and fold them into 1/5/15 minute bars, the intraday
+    #candlestick views are then extended with those bars instead of re-fetching the candles from the API
+    #Symbols are subscribed to when somebody opens them, one websocket serves all of them
+    #FINNHUB_RECORD_DIR saves every streamed trade to that directory, FINNHUB_REPLAY_DIR plays such a recording
+    #back instead of connecting to Finnhub (at FINNHUB_REPLAY_SPEED times the recorded pace, 0 for full speed)
+    def on_batch(batch):
+        aggregator.add_batch(batch)
+        board.add_batch(batch)
+        if recorder is not None:
+            recorder.add_batch(batch)
+
+    aggregator = CandleAggregator(resolutions=(1, 5, 15))
+    recorder = TickRecorder(os.environ['FINNHUB_RECORD_DIR']) if os.environ.get('FINNHUB_RECORD_DIR') else None
+    if os.environ.get('FINNHUB_REPLAY_DIR'):
+        stream = TickReplay(os.environ['FINNHUB_REPLAY_DIR'], on_batch=on_batch, overflow='drop_oldest',
+                            speed=float(os.environ.get('FINNHUB_REPLAY_SPEED', 1)) or None, max_gap=60)
+    else:
+        stream = connector.stream(on_batch=on_batch, overflow='drop_oldest')
+
+    #Live quotes of the watchlist, traded symbols follow the websocket and the others are polled over REST within
+    #half of the API quota
+    board = QuoteBoard(connector, watchlist, stream=stream)
+
+    #With several gunicorn workers only one of them streams trades, polls the news and refreshes the symbol list,
+    #the others read the news archive and symbol list it keeps in the data directory and serve the charts from the
+    #REST candles. Every worker polls its own quote board, quotes are snapshots shared through the data directory
+    #so that costs about one call per symbol and 15 seconds, not one per worker
+    leader = background and background_leader(os.path.join(data_dir, 'finnhub_background.lock'))
+    if background:
+        board.start_polling_thread()
+    if leader:
+        stream.start_in_thread()
+        news_store.start_polling_thread()
+        catalog.start_refresh_thread()
+        #The recorder also writes its buffer out every second when no trades come in and once more on exit, so
+        #the end of the session is not lost
+        if recorder is not None:
+            recorder.start_flush_thread()
+            atexit.register(recorder.close)
+
+    #Live bars update a running copy of the indicators kept per symbol, timeframe and selection instead of
+    #recomputing them over the whole history
+    live_indicators = LRUCache(ttl=3600, max_entries=64, name='indicators')
 
     #DASH APP STARTS
     app = dash.Dash(__name__)
     app.layout = html.Div(children=[
-        html.H1(children=f'Interactive Financial Dashboard - {symbol}', style={'text-align': 'center'}),
+        html.H1(id='title', style={'text-align': 'center'}),
 
-        html.Div([
-            html.Label(['Choose a Timeframe:'],style={'font-weight': 'bold'}),
-            dcc.Dropdown(
-                id='dropdown0',
+        #The stock views and the portfolio analytics of several symbols are on separate tabs
+        dcc.Tabs(id='tabs', value='stock', children=[
+            dcc.Tab(label='Stock', value='stock', children=[
+                #Searchable picker for the stock symbol, every graph below follows it. Typing a symbol, part of the
+                #company name or a FIGI lists the matches from the local catalog
+                html.Div([
+                    html.Label(['Stock Symbol:'],style={'font-weight': 'bold'}),
+                    dcc.Dropdown(
+                        id='symbol',
+                        options=[{'label': symbol, 'value': symbol}],
+                        value=symbol,
+                        searchable=True,
+                        clearable=False,
+                        placeholder='Search by symbol or company name',
+                        style={"width": "60%"}),
+                    ]),
+
+                html.Div([
+                    html.Label(['Choose a Timeframe:'],style={'font-weight': 'bold'}),
+                    dcc.Dropdown(
+                        id='dropdown0',
                 
-                #Dropdown menu for being able to pick graphs with different time frames
-                options=[
-                    {'label': 'Three years to date (Daily)', 'value': 'Three years to date (Daily)'},
-                    {'label': 'One month to date (15 min)', 'value': 'One month to date (15 min)'},
-                    {'label': 'One week to date (5 min)', 'value': 'One week to date (5 min)'},
-                    {'label': 'Last trading day (1 min)', 'value': 'Last trading day (1 min)'},
-                        ],
-                value='Three years to date (Daily)',
-                style={"width": "60%"}),
-
-        html.Div(dcc.Graph(id='graph0')),
-            ]),
+                        #Dropdown menu for being able to pick graphs with different time frames
+                        options=timeframe_options,
+                        value='Three years to date (Daily)',
+                        style={"width": "60%"}),
+
+                #Indicator overlays for the candlestick chart
+                html.Div([
+                    html.Label(['Indicators:'],style={'font-weight': 'bold'}),
+                    dcc.Checklist(
+                        id='overlays',
+                        options=[{'label': name, 'value': name} for name in overlay_options],
+                        value=[],
+                        inline=True),
+                    ]),
+
+                html.Div(dcc.Graph(id='graph0')),
+
+                #Poll the aggregator every few seconds, live-state remembers what the graph currently shows
+                dcc.Interval(id='live-interval', interval=5000),
+                dcc.Store(id='live-state'),
+                    ]),
         
-        #Define two dropdown menus with callbacks for our annual and quarterly data
-        html.Div([
-            html.Label(['Choose a Parameter:'],style={'font-weight': 'bold'}),
-            dcc.Dropdown(
-                id='dropdown',
-                options= a_and_q_options,
-                value='Book Value (USD)',
-                style={"width": "60%"}),
+                #Define two dropdown menus with callbacks for our annual and quarterly data
+                html.Div([
+                    html.Label(['Choose a Parameter:'],style={'font-weight': 'bold'}),
+                    dcc.Dropdown(
+                        id='dropdown',
+                        options= a_and_q_options,
+                        value='Book Value (USD)',
+                        style={"width": "60%"}),
             
-        html.Div(dcc.Graph(id='graph')),        
+                html.Div(dcc.Graph(id='graph')),        
+                    ]),
+                html.Div([
+                    html.Label(['Choose a Parameter:'],style={'font-weight': 'bold'}),
+                    dcc.Dropdown(
+                        id='dropdown2',
+                        options= a_and_q_options,
+                        value='Book Value (USD)',
+                        style={"width": "60%"}),
+
+                html.Div(dcc.Graph(id='graph2')),        
+                    ]),
+        
+                #Basic info, earnings and quote figures, each filled in by its own callback
+                dcc.Graph(id='basic-info'),
+                dcc.Graph(id='earnings'),
+                dcc.Graph(id='quote'),
+
+                #Latest stored news of the symbol, refreshed every minute
+                html.Div([
+                    html.H2(id='news-title', style={'text-align': 'center'}),
+                    html.Div(id='news'),
+                    dcc.Interval(id='news-interval', interval=60000),
+                    ]),
+
+                #Quote board of the watchlist, only the cells that changed are sent to the browser
+                html.Div([
+                    html.H2('Watchlist', style={'text-align': 'center'}),
+                    dash_table.DataTable(
+                        id='quote-board',
+                        columns=[{'name': column, 'id': column} for column in BOARD_COLUMNS],
+                        data=[],
+                        sort_action='native',
+                        style_header={'backgroundColor': 'ivory', 'fontWeight': 'bold'},
+                        style_cell={'textAlign': 'center', 'fontSize': 16},
+                        style_data_conditional=[
+                            {'if': {'filter_query': '{Change} > 0', 'column_id': ['Change', 'Change %']},
+                             'color': 'green'},
+                            {'if': {'filter_query': '{Change} < 0', 'column_id': ['Change', 'Change %']},
+                             'color': 'red'}]),
+                    dcc.Interval(id='board-interval', interval=2000),
+                    dcc.Store(id='board-state'),
+                    ]),
             ]),
-        html.Div([
-            html.Label(['Choose a Parameter:'],style={'font-weight': 'bold'}),
-            dcc.Dropdown(
-                id='dropdown2',
-                options= a_and_q_options,
-                value='Book Value (USD)',
-                style={"width": "60%"}),
-
-        html.Div(dcc.Graph(id='graph2')),        
+
+            #Analytics of a weighted basket of symbols on daily candles, the watchlist by default
+            dcc.Tab(label='Portfolio', value='portfolio', children=[
+                html.Div([
+                    html.Label(['Symbols:'],style={'font-weight': 'bold'}),
+                    dcc.Dropdown(
+                        id='portfolio-symbols',
+                        options=[{'label': name, 'value': name} for name in watchlist],
+                        value=watchlist,
+                        multi=True,
+                        searchable=True,
+                        placeholder='Search by symbol or company name',
+                        style={"width": "80%"}),
+                    ]),
+
+                #Weights as SYMBOL=weight pairs, symbols that are not listed get none and an empty box weighs
+                #every symbol equally
+                html.Div([
+                    html.Label(['Weights:'],style={'font-weight': 'bold'}),
+                    dcc.Input(
+                        id='portfolio-weights',
+                        type='text',
+                        debounce=True,
+                        placeholder='e.g. AAPL=2, MSFT=1 (equal weights if empty)',
+                        style={"width": "40%"}),
+                    ]),
+
+                html.Div([
+                    html.Label(['Choose a Period:'],style={'font-weight': 'bold'}),
+                    dcc.Dropdown(
+                        id='portfolio-period',
+                        options=[{'label': name, 'value': name} for name in portfolio_periods],
+                        value='One year',
+                        clearable=False,
+                        style={"width": "60%"}),
+                    ]),
+
+                dcc.Graph(id='portfolio-equity'),
+                dcc.Graph(id='portfolio-volatility'),
+                dcc.Graph(id='portfolio-correlation'),
+                dash_table.DataTable(
+                    id='portfolio-summary',
+                    columns=[{'name': name, 'id': column} for column, name in portfolio_columns.items()],
+                    data=[],
+                    sort_action='native',
+                    style_header={'backgroundColor': 'ivory', 'fontWeight': 'bold'},
+                    style_cell={'textAlign': 'center', 'fontSize': 16}),
             ]),
-        
-        #Add all the figures defined before
-        dcc.Graph(figure=fig),
-        dcc.Graph(figure=fig2),
-        dcc.Graph(figure=fig3),
+        ]),
     ])
 
+    #Symbols typed by the user are upper-cased, nothing is fetched for an empty box
+    def clean_symbol(symbol):
+        if not symbol or not symbol.strip():
+            raise PreventUpdate
+        return symbol.strip().upper()
+
+    #Suggestions for the text typed into a symbol picker. The selected symbols stay in the options so the
+    #dropdown keeps showing them, a symbol missing from the catalog can still be picked as typed
+    def suggestions(search_value, selected):
+        if not search_value:
+            raise PreventUpdate
+        try:
+            options = catalog.suggest(search_value, limit=15)
+        except (ValueError, OSError):
+            options = []
+        values = {option['value'] for option in options}
+        typed = search_value.strip().upper()
+        if typed and typed not in values:
+            options.append({'label': typed, 'value': typed})
+            values.add(typed)
+        options[:0] = [{'label': value, 'value': value} for value in selected if value not in values]
+        return options
+
+    @app.callback(
+        Output('symbol', 'options'),
+        [Input(component_id='symbol', component_property='search_value')],
+        [State(component_id='symbol', component_property='value')]
+    )
+    def symbol_options(search_value, value):
+        return suggestions(search_value, [value] if value else [])
+
+    @app.callback(
+        Output('portfolio-symbols', 'options'),
+        [Input(component_id='portfolio-symbols', component_property='search_value')],
+        [State(component_id='portfolio-symbols', component_property='value')]
+    )
+    def portfolio_symbol_options(search_value, value):
+        return suggestions(search_value, value or [])
+
+    @app.callback(
+        Output('title', 'children'),
+        [Input(component_id='symbol', component_property='value')]
+    )
+    def update_title(symbol):
+        return f'Interactive Financial Dashboard - {clean_symbol(symbol)}'
+
+    #Create the basic stock info figure the first time the page asks for it
+    @app.callback(
+        Output('basic-info', 'figure'),
+        [Input(component_id='symbol', component_property='value')]
+    )
+    def basic_info_figure(symbol):
+        symbol = clean_symbol(symbol)
+
+        #Define the past_year data frame and scale every numeric value into the (negative) 5 to 100 range by
+        #powers of ten so they fit on one graph, remembering what each value was divided/multiplied by
+        df_pastyear = load_basic_financials(symbol)['past_year'].copy()
+        normalized = normalize_metrics(df_pastyear['metric'])
+
+        #Get the high and low date for a stock as they are in the datetime format and cannot be normalized
+        highdate = df_pastyear['metric']['52WeekHighDate']
+        lowdate = df_pastyear['metric']['52WeekLowDate']
+
+        #Create a new column for the normalized values to make them look like: X (multiplied/divided by x)
+        df_pastyear['new'] = df_pastyear.index + ' ' + normalized['label']
+
+        #Create the final values, annotate the date with the 52 week low/high values
+        df_pastyear['normalized_vals'] = normalized['value']
+        dfs = df_pastyear.drop(['52WeekHighDate','52WeekLowDate'], axis=0)
+    
+        #Create the plotly go figure, make it horizontal for better representation
+        fig = go.Figure(
+            data=[go.Bar(x= dfs['normalized_vals'], y=dfs['new'])],
+            layout_title=f"{symbol} Basic Stock Info")
+        fig.layout.template='plotly_dark'
+        fig.layout.height = 3500
+        fig.update_layout(xaxis_title="Normalized value between (-)(5 to 100)", title_x=0.5, font=dict(size=15))
+        fig.update_traces(marker_color='yellowgreen', orientation='h')
+        fig.add_annotation(x=dfs['normalized_vals']['52WeekHigh']+10, y=4,
+                           text=highdate,
+                           showarrow=False,)
+        fig.add_annotation(x=dfs['normalized_vals']['52WeekLow']+10, y=5,
+                    text=lowdate,
+                    showarrow=False,)
+        return fig
+
+    @app.callback(
+        Output('earnings', 'figure'),
+        [Input(component_id='symbol', component_property='value')]
+    )
+    def earnings_figure(symbol):
+        symbol = clean_symbol(symbol)
+
+        #Create a grouped bar graph with earnings surprises (predicted and actual)
+        df = load_earnings(symbol).copy()
+        df['formatted'] = df.index
+        df['formatted'] = df['formatted'].apply(lambda x: str(f'({x})'))
+        df['Quarter'] = df['Quarter'].apply(lambda x: str(x))
+        df['labels'] = df['Quarter']+ '  ' +df['formatted']
+        fig2 = go.Figure(
+            data=[
+                go.Bar(
+                    name="Predicted",
+                    x=df['labels'],
+                    y=df['Estimate'],
+                    offsetgroup=0,
+                ),
+                go.Bar(
+                    name="Actual",
+                    x=df['labels'],
+                    y=df['Actual'],
+                    offsetgroup=1,
+                ),
+            ],
+            layout=go.Layout(
+                title=f"{symbol} Earnings Surprises",
+                xaxis_title = "Quarter",
+                yaxis_title="Value (USD)",
+            )
+        )
+        fig2.layout.template='plotly_dark'
+        fig2.data[0].marker.color = ('skyblue')
+        fig2.data[1].marker.color = ('tomato')
+        fig2.update_layout(title_x=0.5, font=dict(size=15))
+        return fig2
+
+    @app.callback(
+        Output('quote', 'figure'),
+        [Input(component_id='symbol', component_property='value')]
+    )
+    def quote_figure(symbol):
+        symbol = clean_symbol(symbol)
+
+        #Create a table for the current quote of our stock
+        df_quote = load_quote(symbol)
+        fig3 = go.Figure(data=[go.Table(
+            header=dict(values=df_quote.columns,
+                        align='center',
+                        line_color='black',
+                        fill_color='ivory'),
+            cells=dict(values=[i for i in list(df_quote.iloc[0])],
+                       line_color='black',
+                       fill_color='cyan',
+                       align='center'))
+        ])
+    
+        fig3.layout.template='plotly_dark'
+        fig3.update_layout(width=1669, height=400,
+            title=f"{symbol} Current Quote",
+            title_x=0.5,
+            title_font_color="white",
+            title_font_size = 22,     
+            font=dict(size=20, color='black'))
+        return fig3
+
+    #News of the last week from the local archive, a symbol that is not archived yet is added to the poller and
+    #shows up with the next refresh
+    @app.callback(
+        Output('news-title', 'children'),
+        Output('news', 'children'),
+        [Input(component_id='symbol', component_property='value'),
+         Input(component_id='news-interval', component_property='n_intervals')]
+    )
+    def news_panel(symbol, n_intervals):
+        symbol = clean_symbol(symbol)
+        news_store.watch(symbol)
+        #Workers without the news poller download the symbol's new articles themselves, at most once per poll
+        #interval (for all workers together when they share a cache directory)
+        if background and not leader:
+            try:
+                cache.get(('news', symbol), lambda: news_store.ingest(symbol), news_store.interval)
+            except (ValueError, OSError):
+                pass
+        df = news_store.news(symbol, start=pd.Timestamp.now(tz='UTC') - pd.Timedelta(days=7), limit=20)
+        if len(df) == 0:
+            return f'{symbol} News', html.P(f'No news stored for {symbol} yet, it is being downloaded.',
+                                            style={'text-align': 'center'})
+        items = [html.P([html.A(headline, href=url, target='_blank', style={'font-weight': 'bold'}),
+                         html.Br(), f"{source} - {when.strftime('%Y-%m-%d %H:%M')} UTC"])
+                 for when, headline, url, source in zip(df.index, df['Headline'], df['URL'], df['Source'])]
+        return f'{symbol} News', items
+
+    #The whole board is sent once, after that only the cells that changed since the version the browser has.
+    #Sorting in the table does not reorder its data, so the row numbers stay valid
+    @app.callback(
+        Output('quote-board', 'data'),
+        Output('board-state', 'data'),
+        Input('board-interval', 'n_intervals'),
+        State('board-state', 'data')
+    )
+    def update_quote_board(n_intervals, state):
+        if state is not None:
+            cells, version, layout = board.changes_since(state['version'])
+            if layout == state['layout']:
+                if not cells:
+                    return dash.no_update, dash.no_update
+                patch = Patch()
+                for row, column, value in cells:
+                    patch[row][column] = value
+                return patch, {'version': version, 'layout': layout}
+
+        data, version, layout = board.records()
+        return data, {'version': version, 'layout': layout}
+
     #Define callback functions for dropdown graphs
     @app.callback(
         Output('graph0', 'figure'),
-        [Input(component_id='dropdown0', component_property='value')]
+        Output('live-state', 'data'),
+        [Input(component_id='symbol', component_property='value'),
+         Input(component_id='dropdown0', component_property='value'),
+         Input(component_id='graph0', component_property='relayoutData'),
+         Input(component_id='overlays', component_property='value')]
     )
 
-    def select_graph(value):
-        if value == 'Three years to date (Daily)':
-            df=df_threeyearsago
+    def select_graph(symbol, value, relayout, overlays):
+        symbol = clean_symbol(symbol)
+
+        #Only the selected timeframe is downloaded, the others are fetched when they are first picked
+        df_full = load_candles(symbol, value)
 
-        elif value == 'One month to date (15 min)':
-            df=df_fifteen
+        #Long histories are downsampled to max_bars candles. Zooming or panning re-renders the visible window
+        #at full resolution (with a coarse view of the rest for the range slider), a new symbol or timeframe
+        #starts from the whole period again
+        window = None
+        if dash.callback_context.triggered_id == 'graph0':
+            window = visible_range(relayout)
+            if window is None:
+                raise PreventUpdate
+        with span('dash_step_seconds', step='downsample', view=value):
+            df = viewport_ohlcv(df_full, window, max_bars)
 
-        elif value == 'One week to date (5 min)':
-            df = df_five
+        #Start receiving live trades for the symbol (does nothing if it is already subscribed)
+        stream.subscribe(symbol)
 
-        elif value == 'Last trading day (1 min)':
-            df = df_one
+        #Indicators are computed on the full resolution candles, VWAP restarts every day on intraday charts. Lines
+        #are thinned with LTTB to the candles' point budget, histogram bars are taken at the bars that are shown
+        overlays = sorted(overlays or [], key=overlay_options.index)
+        anchor = None if timeframes[value][0] == 'D' else 'D'
+        with span('dash_step_seconds', step='indicators', view=value):
+            indicators = compute(df_full, overlays, anchor)
+        panels = [name for name in overlays if name.split()[0] in oscillators]
+        rows = 2 + len(panels)
 
-        #For each value make a plot with a subplot for Volume
-        fig = ms.make_subplots(rows=2,
-        cols=1, row_heights = [0.8, 0.2],
+        #For each value make a plot with a subplot for Volume and one for each oscillator
+        figure_started = time.perf_counter()
+        fig = ms.make_subplots(rows=rows,
+        cols=1, row_heights = [0.8 - 0.15 * len(panels), 0.2] + [0.15] * len(panels),
         shared_xaxes=True,
         vertical_spacing=0.02)
         fig.add_trace(go.Candlestick(x = df.index,
@@ -307,6 +689,23 @@ def run_dash_app(symbol):
         row=2,
         col=1),
 
+        #Indicator traces follow the candles and the volume in the order of overlay_columns, the live updates
+        #rely on that order
+        overlay_columns = []
+        for name in overlays:
+            row = 3 + panels.index(name) if name in panels else 1
+            for column in output_columns([name]):
+                if column == 'MACD Histogram':
+                    fig.add_trace(go.Bar(x=df.index, y=indicators[column].reindex(df.index), name=column,
+                                         marker_color='grey'), row=row, col=1)
+                else:
+                    line = viewport_line(indicators[column], window, max_bars)
+                    fig.add_trace(go.Scatter(x=line.index, y=line, name=column, mode='lines', line_width=1),
+                                  row=row, col=1)
+                overlay_columns.append(column)
+            if name in panels:
+                fig.update_yaxes(title_text=name.split()[0], row=row, col=1)
+
         #CODE BELOW: There are gaps in the candlestick chart which could be fixed by using rangebreaks. However, when applied
         #in conjunction with the dropdown option on graphs they cause an overlap of candles when toggling between graphs.
         #Feel free and try to uncomment this section and see what happens. It looks like someone already had this problem a
@@ -322,21 +721,100 @@ def run_dash_app(symbol):
 #                 ]
 #             )
 
-        fig.update_layout(title = f'{symbol} {value} Candlestick Chart with Volume', title_x=0.5, height = 800, font=dict(size=15),
+        fig.update_layout(title = f'{symbol} {value} Candlestick Chart with Volume', title_x=0.5,
+        height = 800 + 200 * len(panels), font=dict(size=15),
         yaxis1_title = 'Stock Price (USD)',
         yaxis2_title = 'Volume (M)',
-        xaxis2_title = 'Datetime Range',
-        xaxis1_rangeslider_visible = False,
-        xaxis2_rangeslider_visible = True),
+        **{f'xaxis{rows}_title': 'Datetime Range'},
+        **{f'xaxis{row}_rangeslider_visible': row == rows for row in range(1, rows + 1)}),
         fig.layout.template='plotly_dark'
-        return fig
+        fig.layout.uirevision = f'{symbol} {value} {rows}'
+        if window is not None and window != 'auto':
+            fig.update_xaxes(range=[window[0].tz_localize(None), window[1].tz_localize(None)])
+
+        #Number of candles on the graph and the start of the last one (UNIX ms) for the live updates, merged
+        #bars cannot be extended tick by tick so downsampled charts are not updated live
+        live = live_resolutions.get(value) if len(df) == len(df_full) else None
+        state = {'symbol': symbol, 'timeframe': value, 'resolution': live, 'length': len(df),
+                 'last': int(df.index[-1].value // 10**6) if len(df) else 0, 'live': False,
+                 'overlays': overlays, 'overlay_columns': overlay_columns}
+        observe('dash_step_seconds', time.perf_counter() - figure_started, step='figure', view=value)
+        return fig, state
+
+    #Send only the bars that changed since the last poll to the browser: the newest live bar is updated in
+    #place and bars that started after it are appended, the rest of the figure is left untouched
+    @app.callback(
+        Output('graph0', 'figure', allow_duplicate=True),
+        Output('live-state', 'data', allow_duplicate=True),
+        Input('live-interval', 'n_intervals'),
+        State('live-state', 'data'),
+        prevent_initial_call=True
+    )
+    def update_live_candles(n_intervals, state):
+        if not state or state['resolution'] is None:
+            return dash.no_update, dash.no_update
+
+        bars = aggregator.bars_since(state['symbol'], state['resolution'], state['last'])
+        if not bars:
+            return dash.no_update, dash.no_update
+
+        #Running indicators for the chart, started from the REST candles the first time anybody needs them
+        indicators = None
+        if state.get('overlays'):
+            key = (state['symbol'], state['timeframe'], tuple(state['overlays']))
+            indicators = live_indicators.get(key, lambda: IndicatorSet.from_frame(
+                load_candles(state['symbol'], state['timeframe']), state['overlays']))
+
+        patch = Patch()
+        changed = False
+        for bar in bars:
+            start, open_, high, low, close, volume = bar
+            values = None
+            if indicators is not None:
+                values = indicators.update(bar) or indicators.values_at(start) or {}
+                values = [values.get(column) for column in state['overlay_columns']]
+                values = [None if value is None or value != value else value for value in values]
+
+            #Bars already covered by the REST candles are skipped, the API bar has the full volume
+            if start < state['last'] or (start == state['last'] and not state['live']):
+                continue
+            if start == state['last']:
+                i = state['length'] - 1
+                patch['data'][0]['open'][i] = open_
+                patch['data'][0]['high'][i] = high
+                patch['data'][0]['low'][i] = low
+                patch['data'][0]['close'][i] = close
+                patch['data'][1]['y'][i] = volume
+                for trace, value in enumerate(values or (), start=2):
+                    patch['data'][trace]['y'][i] = value
+            else:
+                x = pd.Timestamp(start, unit='ms', tz='UTC').isoformat()
+                patch['data'][0]['x'].append(x)
+                patch['data'][0]['open'].append(open_)
+                patch['data'][0]['high'].append(high)
+                patch['data'][0]['low'].append(low)
+                patch['data'][0]['close'].append(close)
+                patch['data'][1]['x'].append(x)
+                patch['data'][1]['y'].append(volume)
+                for trace, value in enumerate(values or (), start=2):
+                    patch['data'][trace]['x'].append(x)
+                    patch['data'][trace]['y'].append(value)
+                state = dict(state, length=state['length'] + 1, last=start, live=True)
+            changed = True
+
+        if not changed:
+            return dash.no_update, dash.no_update
+        return patch, state
 
     #Callbacks for annual and quarterly graphs
     @app.callback(
         Output('graph', 'figure'),
-        [Input(component_id='dropdown', component_property='value')]
+        [Input(component_id='symbol', component_property='value'),
+         Input(component_id='dropdown', component_property='value')]
     )
-    def select_graph(value):
+    def select_graph(symbol, value):
+        symbol = clean_symbol(symbol)
+        df_annual = load_basic_financials(symbol)['annual']
         fig = go.Figure(
             data=[go.Bar(x= df_annual.index, y=list(df_annual[f'{value}']))],
             layout_title=f"{symbol} Annual {value}"
@@ -348,9 +826,12 @@ def run_dash_app(symbol):
 
     @app.callback(
         Output('graph2', 'figure'),
-        [Input(component_id='dropdown2', component_property='value')]
+        [Input(component_id='symbol', component_property='value'),
+         Input(component_id='dropdown2', component_property='value')]
     )
-    def select_graph2(value2):
+    def select_graph2(symbol, value2):
+        symbol = clean_symbol(symbol)
+        df_quarterly = load_basic_financials(symbol)['quarterly']
         fig = go.Figure(
             data=[go.Bar(x= df_quarterly.index, y=list(df_quarterly[f'{value2}']))],
             layout_title=f"{symbol} Quarterly {value2}"
@@ -360,9 +841,121 @@ def run_dash_app(symbol):
         fig.update_traces(marker_color='orange')
         return fig
 
-    #Run the app
-    if __name__ == '__main__':
-        app.run_server(debug=False)
+    #Weights typed as 'AAPL=2, MSFT=1', entries that cannot be read are skipped
+    def parse_weights(text):
+        weights = {}
+        for item in (text or '').replace(';', ',').split(','):
+            name, _, weight = item.partition('=')
+            try:
+                weights[name.strip().upper()] = float(weight)
+            except ValueError:
+                continue
+        return weights
+
+    #Equity and drawdown of the portfolio, rolling volatility, the correlation matrix of the daily returns and a
+    #summary per symbol. Nothing is loaded before the tab is opened
+    @app.callback(
+        Output('portfolio-equity', 'figure'),
+        Output('portfolio-volatility', 'figure'),
+        Output('portfolio-correlation', 'figure'),
+        Output('portfolio-summary', 'data'),
+        [Input(component_id='tabs', component_property='value'),
+         Input(component_id='portfolio-symbols', component_property='value'),
+         Input(component_id='portfolio-weights', component_property='value'),
+         Input(component_id='portfolio-period', component_property='value')]
+    )
+    def portfolio_views(tab, symbols, weights, period):
+        if tab != 'portfolio' or not symbols:
+            raise PreventUpdate
+        symbols = [clean_symbol(name) for name in symbols]
+
+        try:
+            with span('dash_step_seconds', step='portfolio', view=period):
+                portfolio = load_portfolio(symbols, parse_weights(weights))
+                portfolio = portfolio.since(pd.Timestamp(date.today() - portfolio_periods[period]))
+                equity = portfolio.equity(10000)
+                drawdown = equity / equity.cummax() - 1
+                volatility = portfolio.volatility(volatility_window)
+                correlation = portfolio.correlation()
+                summary = portfolio.summary()
+        except ValueError as error:
+            fig = go.Figure()
+            fig.layout.template='plotly_dark'
+            fig.update_layout(title=str(error), title_x=0.5, font=dict(size=15))
+            return fig, fig, fig, []
+
+        #Value of 10,000 USD invested at the start of the period with the drawdown below it
+        figure_started = time.perf_counter()
+        fig = ms.make_subplots(rows=2, cols=1, row_heights=[0.7, 0.3], shared_xaxes=True, vertical_spacing=0.02)
+        fig.add_trace(go.Scatter(x=equity.index, y=equity, name='Equity', mode='lines',
+                                 line_color='limegreen'), row=1, col=1)
+        fig.add_trace(go.Scatter(x=drawdown.index, y=drawdown * 100, name='Drawdown', mode='lines',
+                                 fill='tozeroy', line_color='orangered'), row=2, col=1)
+        missing = f" (no data for {', '.join(portfolio.failed)})" if portfolio.failed else ''
+        fig.update_layout(title=f'Portfolio of {len(portfolio.symbols)} Symbols, {period}{missing}', title_x=0.5,
+                          height=600, font=dict(size=15), yaxis1_title='Value (USD)', yaxis2_title='Drawdown (%)')
+        fig.layout.template='plotly_dark'
+
+        fig2 = go.Figure()
+        for name in portfolio.symbols:
+            fig2.add_trace(go.Scatter(x=volatility.index, y=volatility[name] * 100, name=name, mode='lines',
+                                      line_width=1))
+        fig2.add_trace(go.Scatter(x=volatility.index, y=portfolio.portfolio_volatility(volatility_window) * 100,
+                                  name='Portfolio', mode='lines', line=dict(width=3, color='white')))
+        fig2.update_layout(title=f'{volatility_window} Day Rolling Volatility (annualized)', title_x=0.5,
+                           yaxis_title='Volatility (%)', font=dict(size=15))
+        fig2.layout.template='plotly_dark'
+
+        fig3 = go.Figure(data=[go.Heatmap(z=correlation.to_numpy(), x=portfolio.symbols, y=portfolio.symbols,
+                                          zmin=-1, zmax=1, colorscale='RdBu', reversescale=True)])
+        fig3.update_layout(title='Correlation of Daily Returns', title_x=0.5, height=700, font=dict(size=15),
+                           yaxis_autorange='reversed')
+        fig3.layout.template='plotly_dark'
+
+        #Fractions are shown in percent
+        summary[['Weight', 'Total Return', 'Volatility', 'Max Drawdown']] *= 100
+        summary = summary.round(2).reset_index()
+        data = summary.astype(object).where(summary.notna(), None).to_dict('records')
+        observe('dash_step_seconds', time.perf_counter() - figure_started, step='figure', view=period)
+        return fig, fig2, fig3, data
+
+    #Time every callback per view and symbol and serve the numbers at http://127.0.0.1:8050/metrics in the
+    #Prometheus text format
+    instrument_dash(app)
+    add_metrics_route(app.server)
+
+    return app
+
+
+#WSGI entry point for gunicorn and other servers, e.g. gunicorn -w 4 'finn_dashapp:create_server()'
+def create_server(**kwargs):
+    return create_app(**kwargs).server
+
+
+#Kept for scripts that started the dashboard with run_dash_app(), builds the app and serves it on port 8050
+def run_dash_app(symbol='AAPL', **kwargs):
+    app = create_app(symbol=symbol, **kwargs)
+    app.run_server(debug=False)
+    return app
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Interactive financial dashboard on the Finnhub API')
+    parser.add_argument('--api-key', help='Finnhub API key, FINNHUB_API_KEY by default')
+    parser.add_argument('--symbol', default='AAPL', help='symbol shown when the page opens')
+    parser.add_argument('--watchlist', help='comma separated symbols of the quote board, FINNHUB_WATCHLIST by default')
+    parser.add_argument('--data-dir', help='directory of the local stores, FINNHUB_DATA_DIR or the current one')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8050)
+    parser.add_argument('--debug', action='store_true')
+    args = parser.parse_args(argv)
+    if not (args.api_key or os.environ.get('FINNHUB_API_KEY')):
+        parser.error('pass --api-key or set the FINNHUB_API_KEY environment variable')
+
+    app = create_app(api_key=args.api_key, symbol=args.symbol.upper(), data_dir=args.data_dir,
+                     watchlist=args.watchlist.split(',') if args.watchlist else None)
+    app.run_server(host=args.host, port=args.port, debug=args.debug)
+
 
-symbol = input('Enter a stock symbol: ')
-run_dash_app(symbol)
+if __name__ == '__main__':
+    main()
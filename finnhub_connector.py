@@ -1,21 +1,257 @@
 import pandas as pd
 import requests
-from datetime import datetime
 import datetime as dt
-import numpy as np
 import asyncio
-import websockets
+import multiprocessing
+import os
+import random
+import struct
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+
+import finnhub_normalize
+import instrumentation
+from candle_cache import RESOLUTION_SECONDS
+from finnhub_stream import FinnhubStream
+
+try:
+    import fcntl
+except ImportError:
+    # not available on Windows, a FileRateLimiter then only limits the process it is used in
+    fcntl = None
+
+
+# token bucket used by the connector to stay under the Finnhub quota (free tier allows 60 calls per minute).
+# The bucket starts full so short bursts (e.g. the dashboard start-up calls) go out immediately, after that
+# calls are spaced out at the refill rate instead of being rejected by the API
+class RateLimiter:
+
+    clock = time.monotonic
+
+    def __init__(self, calls_per_minute=60, burst=None):
+        self.rate = calls_per_minute / 60
+        self.capacity = burst if burst is not None else calls_per_minute
+        self.tokens = float(self.capacity)
+        self.updated = self.clock()
+        self.lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    # block until a token is available and take it, returns the number of seconds spent waiting
+    def acquire(self) -> float:
+        waited = 0.0
+        while True:
+            with self.lock:
+                now = self.clock()
+                self._refill(now)
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return waited
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+            waited += wait
+
+    # empty the bucket and hold it for the given number of seconds, used when the API answers with 429
+    # so that every thread sharing the limiter backs off, not just the one that got rejected. Pauses do not
+    # add up, ten threads rejected at once with Retry-After: 60 hold the bucket for 60 seconds, not 600
+    def pause(self, seconds):
+        with self.lock:
+            now = self.clock()
+            self._refill(now)
+            self.tokens = min(self.tokens, -seconds * self.rate)
+
+
+# raised when the API answers with an error payload ({'error': ...}, e.g. an invalid key or a symbol the plan has
+# no access to) instead of data. It is an OSError like the requests exceptions, so callers treat it as a failed
+# call that is worth retrying later and not as a symbol without data
+class FinnhubAPIError(OSError):
+    pass
+
+
+# RateLimiter whose bucket lives in shared memory, so connectors in several processes (e.g. the workers of
+# backfill.py) stay under one quota together. Pass it to the processes when they are started (as a Process
+# argument or a pool initializer argument), context is the multiprocessing context they are started with
+class SharedRateLimiter(RateLimiter):
+
+    def __init__(self, calls_per_minute=60, burst=None, context=None):
+        context = context or multiprocessing.get_context()
+        self.rate = calls_per_minute / 60
+        self.capacity = burst if burst is not None else calls_per_minute
+        # tokens and the time of the last refill, time.monotonic() is the same clock in every process
+        self.state = context.Array('d', [float(self.capacity), time.monotonic()])
+        self.lock = self.state.get_lock()
+
+    @property
+    def tokens(self):
+        return self.state[0]
+
+    @tokens.setter
+    def tokens(self, value):
+        self.state[0] = value
+
+    @property
+    def updated(self):
+        return self.state[1]
+
+    @updated.setter
+    def updated(self, value):
+        self.state[1] = value
+
+
+# RateLimiter whose bucket is kept in a small file, so processes that were not started together (e.g. the workers
+# gunicorn forks before each of them builds its own app) stay under one quota together. Every acquire() locks the
+# file, reads the bucket, updates it and writes it back; the bucket uses the wall clock because the file outlives
+# the processes (and a reboot)
+class FileRateLimiter(RateLimiter):
+
+    clock = time.time
+
+    def __init__(self, path, calls_per_minute=60, burst=None):
+        super().__init__(calls_per_minute, burst)
+        self.path = path
+        self.thread_lock = threading.Lock()
+        self.fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        self.lock = self
+
+    # `with self.lock` holds the file lock and loads the shared bucket, leaving the block stores it
+    def __enter__(self):
+        self.thread_lock.acquire()
+        if fcntl is not None:
+            fcntl.flock(self.fd, fcntl.LOCK_EX)
+        state = os.pread(self.fd, 16, 0)
+        if len(state) == 16:
+            self.tokens, self.updated = struct.unpack('dd', state)
+
+    def __exit__(self, *exc):
+        try:
+            os.pwrite(self.fd, struct.pack('dd', self.tokens, self.updated), 0)
+        finally:
+            if fcntl is not None:
+                fcntl.flock(self.fd, fcntl.LOCK_UN)
+            self.thread_lock.release()
+
 
 class FinnhubConnector:
 
-    def __init__(self, api_key, base_api_url='https://finnhub.io/api/v1/'):
+    # status codes that are worth retrying, anything else is returned to the caller as is
+    RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+    # the API truncates long responses, so candle and news ranges are split into windows of at most this
+    # many bars / days, fetched concurrently and stitched back together
+    CANDLES_PER_CALL = 5000
+    NEWS_DAYS_PER_CALL = 3
+
+    def __init__(self, api_key, base_api_url='https://finnhub.io/api/v1/', calls_per_minute=60, max_retries=5,
+                 backoff_factor=0.5, timeout=10, pool_size=10, rate_limiter=None, candle_cache=None,
+                 websocket_url='wss://ws.finnhub.io', snapshot_store=None):
         self.api_key = api_key
         self.base_api_url = base_api_url
+        self.websocket_url = websocket_url
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.timeout = timeout
+
+        # one keep-alive session for every call so the TCP+TLS handshake is only paid once per connection
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+        # the limiter can be shared between several connectors that use the same API key
+        self.rate_limiter = rate_limiter if rate_limiter is not None else RateLimiter(calls_per_minute)
+
+        # optional candle_cache.CandleCache, when given candle requests only download the missing time ranges
+        self.candle_cache = candle_cache
+
+        # optional snapshot_store.SnapshotStore, when given fundamentals, earnings and quotes are only downloaded
+        # again once the store's staleness policy for the dataset says so
+        self.snapshot_store = snapshot_store
+
+        # worker threads used to fetch the windows of a long candle or news range at the same time
+        self.executor = ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix='finnhub-chunk')
+
+    def close(self):
+        self.executor.shutdown(wait=False)
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # helper used by every method to call the REST API: waits for the rate limiter, retries with exponential
+    # backoff on 429/5xx and connection errors (honouring the Retry-After header) and returns the decoded json.
+    # Waits, round trips, response sizes, retries and decoding are recorded per endpoint in instrumentation
+    def _get(self, endpoint: str, **params):
+        params['token'] = self.api_key
+        for attempt in range(self.max_retries + 1):
+            instrumentation.observe('finnhub_rate_limit_wait_seconds', self.rate_limiter.acquire())
+            start = time.perf_counter()
+            try:
+                response = self.session.get(f'{self.base_api_url}{endpoint}', params=params, timeout=self.timeout)
+            except (requests.ConnectionError, requests.Timeout) as error:
+                instrumentation.observe('finnhub_api_request_seconds', time.perf_counter() - start,
+                                        endpoint=endpoint, status=type(error).__name__)
+                if attempt == self.max_retries:
+                    raise
+                instrumentation.count('finnhub_api_retries', endpoint=endpoint, reason=type(error).__name__)
+                time.sleep(self._backoff(attempt))
+                continue
+
+            instrumentation.observe('finnhub_api_request_seconds', time.perf_counter() - start, endpoint=endpoint,
+                                    status=response.status_code)
+            instrumentation.count('finnhub_api_response_bytes', len(response.content), endpoint=endpoint)
+            if response.status_code not in self.RETRY_STATUSES:
+                with instrumentation.span('finnhub_api_parse_seconds', endpoint=endpoint):
+                    return response.json()
+            if attempt == self.max_retries:
+                response.raise_for_status()
+            instrumentation.count('finnhub_api_retries', endpoint=endpoint, reason=response.status_code)
+
+            delay = self._backoff(attempt)
+            retry_after = response.headers.get('Retry-After')
+            if retry_after is not None:
+                try:
+                    delay = max(delay, float(retry_after))
+                except ValueError:
+                    pass
+            if response.status_code == 429:
+                self.rate_limiter.pause(delay)
+            time.sleep(delay)
+
+    def _backoff(self, attempt) -> float:
+        return self.backoff_factor * 2 ** attempt * (1 + random.random() / 2)
+
+    # Error answers of the API ({'error': ...} with 401/403, or a candle status other than ok/no_data) raise
+    # FinnhubAPIError, so an invalid key or missing access is not mistaken for a symbol without data (ValueError)
+    @staticmethod
+    def _checked(payload, symbol):
+        if isinstance(payload, dict) and 'error' in payload:
+            raise FinnhubAPIError(f"FINNHUB API ERROR FOR-> {symbol}: {payload['error']}")
+        return payload
+
+    @staticmethod
+    def _checked_candles(payload, symbol) -> dict:
+        if not isinstance(payload, dict) or payload.get('s') not in ('ok', 'no_data'):
+            error = payload.get('error', payload) if isinstance(payload, dict) else payload
+            raise FinnhubAPIError(f'FINNHUB API ERROR FOR-> {symbol}: {error}')
+        return payload
+
+    # _get for the per-symbol snapshot datasets (fundamentals, earnings, quote), goes through the snapshot store when there is one
+    def _get_snapshot(self, dataset: str, symbol: str, endpoint: str, **params):
+        if self.snapshot_store is None:
+            return self._get(endpoint, symbol=symbol, **params)
+        return self.snapshot_store.get_payload(dataset, symbol, lambda: self._get(endpoint, symbol=symbol, **params))
 
     def get_north_american_stocks(self) -> pd.DataFrame:
 
         # call the API with appropriate parameters (free tier only gives access to North American stocks)
-        df = pd.DataFrame(requests.get(f'{self.base_api_url}stock/symbol?exchange=US&token={self.api_key}').json())
+        df = pd.DataFrame(self._get('stock/symbol', exchange='US'))
 
         # sort alphabetically by symbol
         df = df.sort_values(['displaySymbol']).reset_index(drop=True)
@@ -30,8 +266,7 @@ class FinnhubConnector:
     def look_up_stock(self, search_query: str) -> pd.DataFrame:
 
         # Query text can be symbol, name, isin, or cusip.
-        search_results = pd.DataFrame(
-            requests.get(f'{self.base_api_url}search?q={search_query}&token={self.api_key}').json())
+        search_results = pd.DataFrame(self._get('search', q=search_query))
 
         if len(search_results) == 0:
             raise ValueError(f'NOTHING FOUND FOR QUERY-> {search_query}')
@@ -51,108 +286,96 @@ class FinnhubConnector:
         # are only a few days apart
         # symbol: company symbol i.e 'AAPL'
 
-        # make the API call with proper parameters and create a data frame
-        df = pd.DataFrame(requests.get(
-            f'{self.base_api_url}company-news?symbol={symbol}&from={start_date}&to={end_date}&token={self.api_key}').json())
-
+        # make the API call with proper parameters and create a data frame,
         # return value error if the API call returns an empty data frame
+        # the range is split into windows of NEWS_DAYS_PER_CALL days so no articles are cut off
+        def fetch(window):
+            return self._get('company-news', symbol=symbol, **{'from': window[0], 'to': window[1]})
+
+        # a failed window raises instead of being left out, the result would silently miss its days otherwise
+        articles = []
+        for payload in self.executor.map(fetch, self._news_windows(start_date, end_date)):
+            articles.extend(self._news_articles(payload, symbol))
         try:
-            df.set_index(df['datetime'].apply(lambda x: datetime.utcfromtimestamp(x).strftime('%Y-%m-%d %H:%M')),
-                         inplace=True)
-        except:
-            raise ValueError(f'THERE IS NO DATA FOR-> {symbol} FROM {start_date} TO {start_date}')
-
-        # rename the columns and sort by ascending date
-        df.rename(columns={'category': 'Category', 'headline': 'Headline',
-                           'id': 'ID', 'image': 'Image',
-                           'related': 'Related to (symbol)',
-                           'source': 'Source', 'summary': 'Summary', 'url': 'URL'}, inplace=True)
-        df.drop(['datetime'], axis=1, inplace=True)
-        df.index.rename('Datetime', inplace=True)
-        df.sort_index(ascending=True, inplace=True)
-        return df
-
-    def get_basic_financials(self, symbol: str) -> pd.DataFrame:
-        past_year = pd.DataFrame(
-            requests.get(f'{self.base_api_url}stock/metric?symbol={symbol}&metric=all&token={self.api_key}').json())
-
-        # create a dictionary that will later be updated with 3 different dataframes
-        basic_financials = {}
+            df = finnhub_normalize.news_frame(articles)
+        except ValueError:
+            raise ValueError(f'THERE IS NO DATA FOR-> {symbol} FROM {start_date} TO {end_date}')
+
+        # the windows do not overlap, but the API can return an article outside the requested days so the same
+        # article may come back from two windows, keep it once
+        return df[~df['ID'].duplicated()]
+
+    # generator version of get_company_news that yields one data frame per window, oldest first, so a long
+    # range can be processed without holding every article in memory
+    def iter_company_news(self, symbol: str, start_date: str, end_date: str):
+        def fetch(window):
+            return self._get('company-news', symbol=symbol, **{'from': window[0], 'to': window[1]})
+
+        seen = set()
+        for payload in self._prefetch(fetch, self._news_windows(start_date, end_date)):
+            articles = self._news_articles(payload, symbol)
+            if not articles:
+                continue
+            df = finnhub_normalize.news_frame(articles)
+            df = df[~df['ID'].isin(seen)]
+            seen.update(df['ID'])
+            yield df
+
+    # the article list of a company-news response, anything else is an error answer of the API
+    @staticmethod
+    def _news_articles(payload, symbol) -> list:
+        if not isinstance(payload, list):
+            error = payload.get('error', payload) if isinstance(payload, dict) else payload
+            raise FinnhubAPIError(f'FINNHUB API ERROR FOR-> {symbol}: {error}')
+        return payload
+
+    # split a yyyy-mm-dd date range into inclusive (start, end) date strings
+    def _news_windows(self, start_date: str, end_date: str) -> list:
+        start = dt.date.fromisoformat(start_date)
+        end = dt.date.fromisoformat(end_date)
+        windows = []
+        while start <= end:
+            window_end = min(end, start + dt.timedelta(days=self.NEWS_DAYS_PER_CALL - 1))
+            windows.append((str(start), str(window_end)))
+            start = window_end + dt.timedelta(days=1)
+        return windows
+
+    def get_basic_financials(self, symbol: str) -> dict:
+
+        # returns a dictionary with the annual and quarterly series data frames and the past year metrics. Only the
+        # normalizing is wrapped: an undecodable response is an OSError too and must not become "no data"
+        payload = self._checked(self._get_snapshot('basic_financials', symbol, 'stock/metric', metric='all'), symbol)
+        try:
+            return finnhub_normalize.basic_financials(payload)
+        except ValueError:
+            raise ValueError(f'THERE IS NO DATA FOR-> {symbol}')
 
-        # create two dictionaries for annual and quarterly returns that are within cells of the
-        # original df created from calling json()
-        for fiscal in ['annual', 'quarterly']:
-            try:
-                fiscal_period = past_year['series'][fiscal]
-            except:
-                raise ValueError(f'THERE IS NO DATA FOR-> {symbol}')
-
-            # drop the two rows from the original df as they will no longer be needed
-            past_year.drop([fiscal], inplace=True)
-
-            # created dfs out of the given dictionaries
-            fiscal_df = pd.DataFrame({key: pd.Series(value) for key, value in fiscal_period.items()})
-
-            #Create datetime list to set index for our data frame
-            periods = []
-            for i in fiscal_period.values():
-                if len(i) == len(fiscal_df):
-                    for d in i:
-                        periods.append(d['period'])
-                    break 
-                        
-            # clean up data cells to only leave dict values
-            for col in fiscal_df.columns:
-                fiscal_df[col] = fiscal_df[col].apply(lambda x: x.get('v') if type(x) == dict else np.nan)
-
-            #Set index of the df as the earlier defined datetime periods
-            fiscal_df.set_index([periods], inplace=True)
-
-            # sort the dfs by ascending dates, rename index and update the empty dict with annual
-            # quarterly dfs
-            fiscal_df.index.rename('Datetime', inplace=True)
-            fiscal_df.sort_index(ascending=True, inplace=True)
-            basic_financials.update({fiscal: fiscal_df})
-
-        # update the dict with original df outside of the loop
-        basic_financials.update({'past_year': past_year})
-        return basic_financials
+    # only the latest value of every metric (the 'metric' part of the stock/metric response) as a series indexed
+    # by metric name, without building the annual and quarterly frames. Used for cross-sectional screening
+    def get_metric_snapshot(self, symbol: str) -> pd.Series:
+        payload = self._checked(self._get_snapshot('basic_financials', symbol, 'stock/metric', metric='all'), symbol)
+        if not isinstance(payload, dict) or not payload.get('metric'):
+            raise ValueError(f'THERE IS NO DATA FOR-> {symbol}')
+        return pd.Series(payload['metric'], name=symbol)
 
     def get_earnings_surprises(self, symbol: str) -> pd.DataFrame:
 
-        # make the API call with proper parameters and create a data frame
-        df = pd.DataFrame(
-            requests.get(f'{self.base_api_url}stock/earnings?symbol={symbol}&token={self.api_key}').json())
-
+        # make the API call with proper parameters and create a data frame indexed by period
+        payload = self._checked(self._get_snapshot('earnings', symbol, 'stock/earnings'), symbol)
         try:
-            df.set_index(df['period'], inplace=True)
-        except:
+            return finnhub_normalize.earnings_frame(payload)
+        except ValueError:
             raise ValueError(f'THERE IS NO DATA FOR-> {symbol}')
 
-        # rename columns, set datetime as index and sort by datetime
-        df.rename(columns={'actual': 'Actual', 'estimate': 'Estimate', 'quarter': 'Quarter',
-                           'surprise': 'Surprise', 'surprisePercent': 'Surprise percent', 'symbol': 'Symbol',
-                           'year': 'Year'}, inplace=True)
-        df.index.rename('Period', inplace=True)
-        df.drop(['period'], axis=1, inplace=True)
-        df.sort_index(ascending=True, inplace=True)
-        return df
-
     def get_current_quote(self, symbol: str) -> pd.DataFrame:
-        df = pd.DataFrame(requests.get(f'{self.base_api_url}quote?symbol={symbol}&token={self.api_key}').json(),
-                          index=['Value'])
 
         # handles the case when the response is a dataframe with null values (no data)
-        if df['t']['Value'] == 0:
+        payload = self._checked(self._get_snapshot('quote', symbol, 'quote'), symbol)
+        try:
+            return finnhub_normalize.quote_frame(payload)
+        except ValueError:
             raise ValueError(f'THERE IS NO DATA FOR-> {symbol}')
 
-        # convert date and time into readable format and tidy up the data frame
-        df['t'] = datetime.utcfromtimestamp(df['t']['Value']).strftime('%Y-%m-%d %H:%M')
-        df.rename(columns={'c': 'Current price', 'd': 'Change', 'dp': 'Percent change', 'h': 'High price of the day',
-                           'l': 'Low price of the day', 'o': 'Open price of the day', 'pc': 'Previous close price',
-                           't': 'Time'}, inplace=True)
-        return df
-
     # static-method helper function that will be used more than once within
     # the class to convert date and time into UNIX format
     @staticmethod
@@ -164,29 +387,78 @@ class FinnhubConnector:
     # Supported resolution includes [1, 5, 15, 30, 60, D, W, M]. Some timeframes might not be available
     # depending on the exchange. Please specify the date in the following format: yyyy-mm-dd
     # time is an optional argument set to default 00:00:00
+    # compact=True returns float32 prices, unsigned integer volume and the Status in df.attrs (see
+    # finnhub_normalize.candles_frame), meant for holding long histories of many symbols in memory
     def get_stock_candles(self, symbol: str, resolution: str, date_from: str, date_to: str, time_from='00:00:00',
-                          time_to='00:00:00') -> pd.DataFrame:
+                          time_to='00:00:00', compact=False) -> pd.DataFrame:
 
         # make the API call with proper parameters and create a data frame
+        from_unix = self.convert_to_unix(date_from, time_from)
+        to_unix = self.convert_to_unix(date_to, time_to)
+        payload = self._checked_candles(self._get_candles('stock/candle', symbol, resolution, from_unix, to_unix),
+                                        symbol)
         try:
-            df = pd.DataFrame(requests.get(
-                f'{self.base_api_url}stock/candle?symbol={symbol}&resolution={resolution}&from={self.convert_to_unix(date_from, time_from)}&to={self.convert_to_unix(date_to, time_to)}&token={self.api_key}').json())
-        except:
+            return finnhub_normalize.candles_frame(payload, compact=compact)
+        except ValueError:
             raise ValueError(f"THERE IS NO DATA FOR-> {symbol} FROM {date_from} {time_from} TO {date_to} {time_to}")
 
-        # convert date and time from UNIX back into readable format and tidy up the df
-        df.set_index(df['t'].apply(lambda x: datetime.utcfromtimestamp(x).strftime('%Y-%m-%d %H:%M:%S')), inplace=True)
-        df.rename(columns={'c': 'Close', 'h': 'High', 'l': 'Low', 'o': 'Open', 's': 'Status',
-                           'v': 'Volume'}, inplace=True)
-        df.index.rename('Datetime', inplace=True)
-        df.drop(['t'], axis=1, inplace=True)
-        return df
+    # generator version of get_stock_candles that yields one data frame per API sized window, oldest first.
+    # The next window is downloaded while the current one is being processed
+    def iter_stock_candles(self, symbol: str, resolution: str, date_from: str, date_to: str, time_from='00:00:00',
+                           time_to='00:00:00', compact=False):
+        yield from self._iter_candles('stock/candle', symbol, resolution, self.convert_to_unix(date_from, time_from),
+                                      self.convert_to_unix(date_to, time_to), compact)
+
+    # raw candle payload for a UNIX time range, served from the candle cache when one is configured
+    def _get_candles(self, endpoint: str, symbol: str, resolution: str, from_unix: int, to_unix: int) -> dict:
+        def fetch(start, end):
+            return self._get_candle_windows(endpoint, symbol, resolution, start, end)
+
+        if self.candle_cache is None:
+            return fetch(from_unix, to_unix)
+        return self.candle_cache.get_candles(f'{endpoint}:{symbol}', resolution, from_unix, to_unix, fetch)
+
+    # fetch every window of a long range concurrently (the rate limiter still spaces the calls out) and
+    # stitch them into one sorted, de-duplicated payload. When a window fails its error payload is returned
+    # instead, so the candle cache does not store the range with a hole in it
+    def _get_candle_windows(self, endpoint: str, symbol: str, resolution: str, from_unix: int, to_unix: int) -> dict:
+        def fetch(window):
+            return self._get(endpoint, symbol=symbol, resolution=resolution, **{'from': window[0], 'to': window[1]})
+
+        windows = self._candle_windows(resolution, from_unix, to_unix)
+        if len(windows) == 1:
+            return fetch(windows[0])
+        return finnhub_normalize.merge_candle_payloads(list(self.executor.map(fetch, windows)))
+
+    def _iter_candles(self, endpoint: str, symbol: str, resolution: str, from_unix: int, to_unix: int, compact):
+        def fetch(window):
+            return self._get_candles(endpoint, symbol, resolution, window[0], window[1])
+
+        for payload in self._prefetch(fetch, self._candle_windows(resolution, from_unix, to_unix)):
+            if self._checked_candles(payload, symbol).get('s') == 'ok' and payload.get('t'):
+                yield finnhub_normalize.candles_frame(payload, compact=compact)
+
+    # split a UNIX range into inclusive windows of at most CANDLES_PER_CALL bars
+    def _candle_windows(self, resolution: str, from_unix: int, to_unix: int) -> list:
+        span = self.CANDLES_PER_CALL * RESOLUTION_SECONDS.get(str(resolution), 60)
+        return [(start, min(start + span - 1, to_unix)) for start in range(from_unix, to_unix + 1, span)] or \
+            [(from_unix, to_unix)]
+
+    # yield fetch(item) for every item in order while the call for the following item is already running
+    def _prefetch(self, fetch, items):
+        pending = None
+        for item in items:
+            future = self.executor.submit(fetch, item)
+            if pending is not None:
+                yield pending.result()
+            pending = future
+        if pending is not None:
+            yield pending.result()
 
     def get_crypto_symbols(self, exchange: str) -> pd.DataFrame:
         # List of crypto exchanges for function input: ["FXPIG","KUCOIN","GEMINI","BITTREX","POLONIEX",
         # "HUOBI","BINANCEUS","COINBASE","BITFINEX","KRAKEN","HITBTC","OKEX","BITMEX","BINANCE"]
-        crypto_symbols = pd.DataFrame(
-            requests.get(f'{self.base_api_url}crypto/symbol?exchange={exchange}&token={self.api_key}').json())
+        crypto_symbols = pd.DataFrame(self._get('crypto/symbol', exchange=exchange))
 
         if len(crypto_symbols) == 0:
             raise ValueError(f'{exchange} IS NOT A VALID EXCHANGE')
@@ -196,27 +468,34 @@ class FinnhubConnector:
         return crypto_symbols
 
     def get_crypto_candles(self, symbol: str, resolution: str, date_from: str, date_to: str, time_from='00:00:00',
-                           time_to='00:00:00') -> pd.DataFrame:
+                           time_to='00:00:00', compact=False) -> pd.DataFrame:
         # Make sure that the symbol input is in the following format: 'EXCHANGE:SYMBOL' i.e 'BINANCE:BTCUSDT'
         # The list of symbols can be generated by calling get_crypto_symbols and would be in the 'Symbols'
         # column of the returned data frame
 
         # make the API call with proper parameters and create a data frame
+        from_unix = self.convert_to_unix(date_from, time_from)
+        to_unix = self.convert_to_unix(date_to, time_to)
+        payload = self._checked_candles(self._get_candles('crypto/candle', symbol, resolution, from_unix, to_unix),
+                                        symbol)
         try:
-            df = pd.DataFrame(requests.get(
-                f'{self.base_api_url}crypto/candle?symbol={symbol}&resolution={resolution}&from={self.convert_to_unix(date_from, time_from)}&to={self.convert_to_unix(date_to, time_to)}&token={self.api_key}').json())
-        except:
+            return finnhub_normalize.candles_frame(payload, compact=compact)
+        except ValueError:
             raise ValueError(f"THERE IS NO DATA FOR-> {symbol} FROM {date_from} {time_from} TO {date_to} {time_to}")
 
-        # convert date and time from UNIX back into readable format and tidy up the df
-        df.set_index(df['t'].apply(lambda x: datetime.utcfromtimestamp(x).strftime('%Y-%m-%d %H:%M:%S')), inplace=True)
-        df.rename(columns={'c': 'Close', 'h': 'High', 'l': 'Low', 'o': 'Open', 's': 'Status',
-                           'v': 'Volume'}, inplace=True)
-        df.index.rename('Datetime', inplace=True)
-        df.drop(['t'], axis=1, inplace=True)
-        return df
+    # generator version of get_crypto_candles, see iter_stock_candles
+    def iter_crypto_candles(self, symbol: str, resolution: str, date_from: str, date_to: str, time_from='00:00:00',
+                            time_to='00:00:00', compact=False):
+        yield from self._iter_candles('crypto/candle', symbol, resolution, self.convert_to_unix(date_from, time_from),
+                                      self.convert_to_unix(date_to, time_to), compact)
+
+    # live trade stream for any number of symbols over one websocket, see finnhub_stream.FinnhubStream for the
+    # options (callback or async iteration, queue size, overflow policy, reconnect backoff)
+    def stream(self, symbols=(), **kwargs) -> FinnhubStream:
+        kwargs.setdefault('url', self.websocket_url)
+        return FinnhubStream(self.api_key, symbols, **kwargs)
 
-    def stream_websocket(self, symbol: str) -> pd.DataFrame:
+    def stream_websocket(self, symbol: str):
 
         # Run the two lines of code below if you are using Jupyter Notebooks and/or get
         # the 'RuntimeError: This event loop is already running' error.
@@ -224,25 +503,9 @@ class FinnhubConnector:
         # import nest_asyncio
         # nest_asyncio.apply()
 
-        # Define an asynchronous function with websocket URL
-        async def fetch_live():
-            url = f'wss://ws.finnhub.io?token={self.api_key}'
-
-            # Establish the websocket connection, send the live stock subscription  credentials
-            # And wait for the response from the server
-            async with websockets.connect(url) as ws:
-                await ws.send('{"type":"subscribe","symbol":"' + symbol + '"}')
-
-                # Puts the function in an infinite fetch loop in order to stream output. The live data frames
-                # are stopped by pressing the 'interrupt kernel' button.
-                while True:
-                    # Wait for the response from the server and print the message
-                    msg = await ws.recv()
-                    print(msg)
-                    print('')
-
-        # Print 'connection closed' instead of throwing an error when the stream is interrupted
+        # Prints every batch of trades as a data frame until interrupted, the stream reconnects by itself
+        # if the connection drops. Print 'connection closed' instead of throwing an error when the stream is interrupted
         try:
-            asyncio.run(fetch_live())
+            asyncio.run(self.stream([symbol], on_batch=lambda batch: print(batch.to_frame(), end='\n\n')).run())
         except KeyboardInterrupt:
             print('####### CONNECTION CLOSED #######')
@@ -0,0 +1,172 @@
+import numpy as np
+import pandas as pd
+
+from instrumentation import timed
+
+# Turn raw Finnhub json payloads into the data frames returned by FinnhubConnector. Everything here works on
+# whole columns at once (no per-row apply), which matters for month-long 1 minute candle windows and large
+# news or metric payloads. Timestamps become a real UTC DatetimeIndex instead of formatted strings
+
+CANDLE_COLUMNS = {'c': 'Close', 'h': 'High', 'l': 'Low', 'o': 'Open', 's': 'Status', 'v': 'Volume'}
+
+NEWS_COLUMNS = {'category': 'Category', 'headline': 'Headline', 'id': 'ID', 'image': 'Image',
+                'related': 'Related to (symbol)', 'source': 'Source', 'summary': 'Summary', 'url': 'URL'}
+
+EARNINGS_COLUMNS = {'actual': 'Actual', 'estimate': 'Estimate', 'quarter': 'Quarter', 'surprise': 'Surprise',
+                    'surprisePercent': 'Surprise percent', 'symbol': 'Symbol', 'year': 'Year'}
+
+QUOTE_COLUMNS = {'c': 'Current price', 'd': 'Change', 'dp': 'Percent change', 'h': 'High price of the day',
+                 'l': 'Low price of the day', 'o': 'Open price of the day', 'pc': 'Previous close price',
+                 't': 'Time'}
+
+
+# convert an array of UNIX seconds into a UTC DatetimeIndex in one go
+def epoch_index(seconds, name='Datetime') -> pd.DatetimeIndex:
+    return pd.DatetimeIndex(pd.to_datetime(seconds, unit='s', utc=True), name=name)
+
+
+# candle payload {'c': [...], 'h': [...], 'l': [...], 'o': [...], 's': 'ok', 't': [...], 'v': [...]}
+# With compact=True prices are float32, volume the smallest unsigned integer type that holds it (float32 for
+# fractional crypto volumes) and the per-row Status column is moved into df.attrs['status'], which cuts the
+# memory of long intraday histories several times over
+@timed('finnhub_normalize_seconds', function='candles_frame')
+def candles_frame(payload: dict, compact=False) -> pd.DataFrame:
+    if payload.get('s') != 'ok' or not payload.get('t'):
+        raise ValueError('THERE IS NO CANDLE DATA IN THE RESPONSE')
+
+    if not compact:
+        df = pd.DataFrame({CANDLE_COLUMNS[key]: payload[key] for key in ('c', 'h', 'l', 'o', 'v')},
+                          index=epoch_index(payload['t']))
+        df.insert(4, 'Status', payload['s'])
+        return df
+
+    prices = {CANDLE_COLUMNS[key]: np.asarray(payload[key], dtype=np.float32) for key in ('c', 'h', 'l', 'o')}
+    df = pd.DataFrame(prices, index=epoch_index(np.asarray(payload['t'], dtype=np.int64)))
+    df['Volume'] = compact_volume(payload['v'])
+    df.attrs['status'] = payload['s']
+    return df
+
+
+def compact_volume(volume) -> np.ndarray:
+    volume = np.asarray(volume, dtype=np.float64)
+    if len(volume) == 0 or not np.array_equal(volume, np.floor(volume)) or volume.min() < 0:
+        return volume.astype(np.float32)
+    if volume.max() < 2 ** 32:
+        return volume.astype(np.uint32)
+    return volume.astype(np.uint64)
+
+
+# numpy structured array with one record per bar (int64 UNIX seconds plus the OHLCV columns in their
+# current dtypes), handy for numba/numpy code or for writing the bars to a binary file
+def candles_to_records(df: pd.DataFrame) -> np.ndarray:
+    columns = ['Open', 'High', 'Low', 'Close', 'Volume']
+    records = np.empty(len(df), dtype=[('t', np.int64)] + [(column, df[column].dtype) for column in columns])
+    records['t'] = df.index.asi8 // 10 ** 9
+    for column in columns:
+        records[column] = df[column].to_numpy()
+    return records
+
+
+# Arrow record batch that reuses the frame's numeric buffers instead of copying them, pyarrow is optional
+def candles_to_arrow(df: pd.DataFrame):
+    try:
+        import pyarrow as pa
+    except ImportError:
+        raise ImportError('candles_to_arrow needs pyarrow, install it with: pip install pyarrow')
+
+    columns = ['Open', 'High', 'Low', 'Close', 'Volume']
+    arrays = [pa.array(df.index.asi8 // 10 ** 9)] + [pa.array(df[column].to_numpy()) for column in columns]
+    batch = pa.RecordBatch.from_arrays(arrays, names=['t'] + columns)
+    status = df.attrs.get('status')
+    return batch if status is None else batch.replace_schema_metadata({'status': status})
+
+
+# stitch the payloads of several candle windows into one, sorted by time with duplicate bars removed. If any
+# window failed (a status other than ok or no_data) its payload is returned as is and nothing is merged, a
+# merged result would have a hole where that window was and the candle cache would mark it as covered
+@timed('finnhub_normalize_seconds', function='merge_candle_payloads')
+def merge_candle_payloads(payloads: list) -> dict:
+    for payload in payloads:
+        if payload.get('s') not in ('ok', 'no_data'):
+            return payload
+    payloads = [payload for payload in payloads if payload.get('s') == 'ok' and payload.get('t')]
+    if not payloads:
+        return {'s': 'no_data'}
+
+    t = np.concatenate([np.asarray(payload['t'], dtype=np.int64) for payload in payloads])
+    t, first = np.unique(t, return_index=True)
+    merged = {'s': 'ok', 't': t.tolist()}
+    for key in ('c', 'h', 'l', 'o', 'v'):
+        column = np.concatenate([np.asarray(payload[key], dtype=np.float64) for payload in payloads])
+        merged[key] = column[first].tolist()
+    return merged
+
+
+# company news payload, a list of article dicts
+@timed('finnhub_normalize_seconds', function='news_frame')
+def news_frame(payload: list) -> pd.DataFrame:
+    df = pd.DataFrame(payload)
+    if 'datetime' not in df.columns or len(df) == 0:
+        raise ValueError('THERE IS NO NEWS DATA IN THE RESPONSE')
+
+    df.index = epoch_index(df.pop('datetime').to_numpy())
+    df.rename(columns=NEWS_COLUMNS, inplace=True)
+    df.sort_index(ascending=True, inplace=True, kind='stable')
+    return df
+
+
+# annual or quarterly 'series' dict {metric: [{'period': 'yyyy-mm-dd', 'v': value}, ...]} flattened into
+# one long table and pivoted to a period x metric frame in a single step
+def financial_series_frame(series: dict) -> pd.DataFrame:
+    metrics, periods, values = [], [], []
+    for metric, points in series.items():
+        metrics.extend([metric] * len(points))
+        periods.extend([point.get('period') for point in points])
+        values.extend([point.get('v') for point in points])
+
+    long = pd.DataFrame({'metric': metrics, 'period': periods, 'v': pd.to_numeric(values, errors='coerce')})
+    df = long.pivot_table(index='period', columns='metric', values='v', aggfunc='last', dropna=False)
+    df = df.reindex(columns=list(series.keys()))
+    df.columns.name = None
+    df.index.rename('Datetime', inplace=True)
+    df.sort_index(ascending=True, inplace=True)
+    return df
+
+
+# stock/metric payload, returns {'annual': df, 'quarterly': df, 'past_year': df}
+@timed('finnhub_normalize_seconds', function='basic_financials')
+def basic_financials(payload: dict) -> dict:
+    series = payload.get('series') or {}
+    if 'annual' not in series or 'quarterly' not in series:
+        raise ValueError('THERE IS NO FINANCIAL DATA IN THE RESPONSE')
+
+    # the past year df keeps the metric names as index, the two series rows are not needed in it
+    past_year = pd.DataFrame(payload).drop(['annual', 'quarterly'], errors='ignore')
+    return {'annual': financial_series_frame(series['annual']),
+            'quarterly': financial_series_frame(series['quarterly']),
+            'past_year': past_year}
+
+
+# earnings surprises payload, a list of quarter dicts
+@timed('finnhub_normalize_seconds', function='earnings_frame')
+def earnings_frame(payload: list) -> pd.DataFrame:
+    df = pd.DataFrame(payload)
+    if 'period' not in df.columns or len(df) == 0:
+        raise ValueError('THERE IS NO EARNINGS DATA IN THE RESPONSE')
+
+    df.index = pd.Index(df.pop('period'), name='Period')
+    df.rename(columns=EARNINGS_COLUMNS, inplace=True)
+    df.sort_index(ascending=True, inplace=True)
+    return df
+
+
+# quote payload, a single dict of scalars
+@timed('finnhub_normalize_seconds', function='quote_frame')
+def quote_frame(payload: dict) -> pd.DataFrame:
+    df = pd.DataFrame(payload, index=['Value'])
+    if 't' not in df.columns or df['t'].iloc[0] == 0:
+        raise ValueError('THERE IS NO QUOTE DATA IN THE RESPONSE')
+
+    df['t'] = pd.to_datetime(df['t'], unit='s', utc=True)
+    df.rename(columns=QUOTE_COLUMNS, inplace=True)
+    return df
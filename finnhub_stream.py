@@ -0,0 +1,235 @@
+import asyncio
+import json
+import random
+import threading
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+import websockets
+
+import instrumentation
+
+
+# one websocket message worth of trades, stored column-wise. Timestamps are UNIX milliseconds as sent by
+# Finnhub, conditions keeps the raw trade condition codes (or None) per trade
+@dataclass(frozen=True)
+class TradeBatch:
+    symbols: np.ndarray
+    prices: np.ndarray
+    volumes: np.ndarray
+    timestamps: np.ndarray
+    conditions: list
+
+    def __len__(self):
+        return len(self.prices)
+
+    @classmethod
+    def from_trades(cls, trades: list) -> 'TradeBatch':
+        return cls(symbols=np.array([trade.get('s') for trade in trades], dtype=object),
+                   prices=np.array([trade.get('p', np.nan) for trade in trades], dtype=np.float64),
+                   volumes=np.array([trade.get('v', 0) for trade in trades], dtype=np.float64),
+                   timestamps=np.array([trade.get('t', 0) for trade in trades], dtype=np.int64),
+                   conditions=[trade.get('c') for trade in trades])
+
+    def for_symbol(self, symbol: str) -> 'TradeBatch':
+        mask = self.symbols == symbol
+        return TradeBatch(self.symbols[mask], self.prices[mask], self.volumes[mask], self.timestamps[mask],
+                          [c for c, keep in zip(self.conditions, mask) if keep])
+
+    def to_frame(self) -> pd.DataFrame:
+        return pd.DataFrame({'Symbol': self.symbols, 'Price': self.prices, 'Volume': self.volumes},
+                            index=pd.DatetimeIndex(pd.to_datetime(self.timestamps, unit='ms', utc=True),
+                                                   name='Datetime'))
+
+
+# Live trade stream for any number of symbols over a single websocket. Symbols can be added or removed
+# while the stream runs, a dropped connection is re-opened with exponential backoff and every subscription
+# is sent again. Trades are delivered as TradeBatch objects either to an on_batch callback (plain function
+# or coroutine) or through a bounded queue read with `async for batch in stream`. When the queue is full
+# overflow='block' stops reading from the socket until the consumer catches up, overflow='drop_oldest'
+# throws away the oldest batch instead and counts it in stream.dropped
+class FinnhubStream:
+
+    def __init__(self, api_key, symbols=(), url='wss://ws.finnhub.io', on_batch=None, queue_size=1000,
+                 overflow='block', reconnect_delay=1, max_reconnect_delay=60):
+        if overflow not in ('block', 'drop_oldest'):
+            raise ValueError(f'UNKNOWN OVERFLOW POLICY-> {overflow}')
+        self.api_key = api_key
+        self.url = url
+        self.symbols = set(symbols)
+        # subscribe/unsubscribe change self.symbols from other threads while a reconnect iterates over it
+        self.symbols_lock = threading.Lock()
+        self.on_batch = on_batch
+        self.queue_size = queue_size
+        self.overflow = overflow
+        self.reconnect_delay = reconnect_delay
+        self.max_reconnect_delay = max_reconnect_delay
+
+        # statistics that are handy when sizing the queue
+        self.dropped = 0
+        self.reconnects = 0
+        self.messages = 0
+        # messages that could not be decoded or made the on_batch callback raise, they are skipped
+        self.errors = 0
+
+        self.loop = None
+        self.queue = None
+        self.ws = None
+        self.running = False
+        self.task = None
+
+    # -- subscriptions, safe to call from any thread before or while the stream is running
+
+    def subscribe(self, *symbols):
+        with self.symbols_lock:
+            new = [symbol for symbol in symbols if symbol not in self.symbols]
+            self.symbols.update(new)
+        self._send_threadsafe([{'type': 'subscribe', 'symbol': symbol} for symbol in new])
+
+    def unsubscribe(self, *symbols):
+        with self.symbols_lock:
+            old = [symbol for symbol in symbols if symbol in self.symbols]
+            self.symbols.difference_update(old)
+        self._send_threadsafe([{'type': 'unsubscribe', 'symbol': symbol} for symbol in old])
+
+    def _send_threadsafe(self, messages):
+        if not messages or self.loop is None or not self.loop.is_running():
+            return
+        try:
+            running_loop = asyncio.get_running_loop()
+        except RuntimeError:
+            running_loop = None
+        if running_loop is self.loop:
+            self.loop.create_task(self._send(messages))
+        else:
+            asyncio.run_coroutine_threadsafe(self._send(messages), self.loop)
+
+    async def _send(self, messages):
+        # messages sent while disconnected are not lost, the reconnect re-subscribes from self.symbols
+        ws = self.ws
+        if ws is None:
+            return
+        try:
+            for message in messages:
+                await ws.send(json.dumps(message))
+        except websockets.ConnectionClosed:
+            pass
+
+    # -- running the stream
+
+    async def run(self):
+        self.loop = asyncio.get_running_loop()
+        if self.queue is None:
+            self.queue = asyncio.Queue(maxsize=self.queue_size)
+        self.running = True
+        delay = self.reconnect_delay
+        try:
+            while self.running:
+                try:
+                    async with websockets.connect(f'{self.url}?token={self.api_key}') as ws:
+                        self.ws = ws
+                        with self.symbols_lock:
+                            symbols = sorted(self.symbols)
+                        await self._send([{'type': 'subscribe', 'symbol': symbol} for symbol in symbols])
+                        delay = self.reconnect_delay
+                        async for message in ws:
+                            await self._handle(message)
+                except (websockets.ConnectionClosed, websockets.InvalidHandshake, OSError, asyncio.TimeoutError):
+                    pass
+                finally:
+                    self.ws = None
+
+                if self.running:
+                    # wait with exponential backoff and some jitter so many clients do not reconnect at once
+                    self.reconnects += 1
+                    await asyncio.sleep(delay * (1 + random.random() / 2))
+                    delay = min(delay * 2, self.max_reconnect_delay)
+        finally:
+            self.running = False
+            if self.queue is not None and self.on_batch is None:
+                # wake up consumers so `async for` ends once the stream stops
+                self._put_nowait(None)
+
+    # a malformed message or an exception in the on_batch callback is counted and skipped, it must not end the
+    # stream (run() only reconnects on connection errors)
+    async def _handle(self, message):
+        self.messages += 1
+        instrumentation.count('finnhub_stream_messages')
+        instrumentation.count('finnhub_stream_bytes', len(message))
+        try:
+            data = json.loads(message)
+            if not isinstance(data, dict) or data.get('type') != 'trade' or not data.get('data'):
+                return
+            batch = TradeBatch.from_trades(data['data'])
+        except (ValueError, TypeError, AttributeError) as error:
+            self._count_error('decode', error)
+            return
+
+        if self.on_batch is not None:
+            try:
+                result = self.on_batch(batch)
+                if asyncio.iscoroutine(result):
+                    await result
+            except Exception as error:
+                self._count_error('on_batch', error)
+        elif self.overflow == 'block':
+            await self.queue.put(batch)
+        else:
+            self._put_nowait(batch)
+
+    def _count_error(self, stage, error):
+        self.errors += 1
+        instrumentation.count('finnhub_stream_errors', stage=stage, error=type(error).__name__)
+
+    def _put_nowait(self, item):
+        while True:
+            try:
+                self.queue.put_nowait(item)
+                return
+            except asyncio.QueueFull:
+                self.queue.get_nowait()
+                self.dropped += 1
+
+    async def stop(self):
+        self.running = False
+        if self.ws is not None:
+            await self.ws.close()
+
+    # start the stream on a background thread with its own event loop, for synchronous code such as the
+    # dash app. The callback (if any) runs on that thread. Returns once the loop is set, so subscribe() can be
+    # called right away
+    def start_in_thread(self) -> threading.Thread:
+        started = threading.Event()
+
+        def target():
+            async def main():
+                self.task = asyncio.current_task()
+                self.loop = asyncio.get_running_loop()
+                started.set()
+                await self.run()
+            asyncio.run(main())
+
+        thread = threading.Thread(target=target, name='finnhub-stream', daemon=True)
+        thread.start()
+        started.wait()
+        return thread
+
+    def stop_threadsafe(self):
+        if self.loop is not None and self.loop.is_running():
+            asyncio.run_coroutine_threadsafe(self.stop(), self.loop)
+
+    def __aiter__(self):
+        if self.on_batch is not None:
+            raise ValueError('BATCHES GO TO THE on_batch CALLBACK, THE STREAM CANNOT BE ITERATED')
+        if self.queue is None:
+            self.queue = asyncio.Queue(maxsize=self.queue_size)
+        if not self.running:
+            self.task = asyncio.get_running_loop().create_task(self.run())
+        return self
+
+    async def __anext__(self) -> TradeBatch:
+        batch = await self.queue.get()
+        if batch is None:
+            raise StopAsyncIteration
+        return batch
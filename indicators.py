@@ -0,0 +1,408 @@
+import threading
+from collections import deque
+
+import numpy as np
+import pandas as pd
+
+# Technical indicators for the connector's candle frames (Close/High/Low/Open/Volume columns, datetime index).
+# The lower case functions compute an indicator over a whole frame at once with NumPy/pandas. The classes of
+# the same name keep the running state of one indicator and update it in constant time per new bar, for live
+# bars and for refreshes that only add a few bars to a long history. Both give the same numbers: EMAs start
+# at the first value, values are NaN until an indicator has seen enough bars, and the last bar can be
+# replaced as often as needed while it is still open.
+# Indicators are named like 'SMA 20', 'EMA 50', 'RSI 14', 'BB 20 2' (Bollinger bands), 'MACD 12 26 9' and
+# 'VWAP', parameters can be left out to use the defaults
+
+
+def _values(series) -> np.ndarray:
+    return np.asarray(series, dtype=np.float64)
+
+
+def _ema_raw(values, alpha) -> np.ndarray:
+    return pd.Series(values).ewm(alpha=alpha, adjust=False).mean().to_numpy()
+
+
+def sma(close: pd.Series, period=20) -> pd.Series:
+    values = _values(close)
+    out = np.full(len(values), np.nan)
+    if len(values) >= period:
+        sums = np.cumsum(np.r_[0.0, values])
+        out[period - 1:] = (sums[period:] - sums[:-period]) / period
+    return pd.Series(out, index=close.index, name=f'SMA {period}')
+
+
+def ema(close: pd.Series, period=20) -> pd.Series:
+    out = _ema_raw(_values(close), 2 / (period + 1))
+    out[:period - 1] = np.nan
+    return pd.Series(out, index=close.index, name=f'EMA {period}')
+
+
+# Wilder's relative strength index, gains and losses are smoothed with alpha = 1 / period
+def rsi(close: pd.Series, period=14) -> pd.Series:
+    values = _values(close)
+    out = np.full(len(values), np.nan)
+    if len(values) > period:
+        delta = np.diff(values)
+        gain = _ema_raw(np.maximum(delta, 0), 1 / period)
+        loss = _ema_raw(np.maximum(-delta, 0), 1 / period)
+        out[period:] = _rsi_value(gain, loss)[period - 1:]
+    return pd.Series(out, index=close.index, name=f'RSI {period}')
+
+
+def _rsi_value(gain, loss):
+    with np.errstate(divide='ignore', invalid='ignore'):
+        value = 100 - 100 / (1 + gain / loss)
+    return np.where(loss == 0, np.where(gain == 0, 50.0, 100.0), value)
+
+
+def macd(close: pd.Series, fast=12, slow=26, signal=9) -> pd.DataFrame:
+    values = _values(close)
+    line = _ema_raw(values, 2 / (fast + 1)) - _ema_raw(values, 2 / (slow + 1))
+    signal_line = _ema_raw(line, 2 / (signal + 1))
+    histogram = line - signal_line
+    line[:slow - 1] = np.nan
+    signal_line[:slow + signal - 2] = np.nan
+    histogram[:slow + signal - 2] = np.nan
+    return pd.DataFrame({'MACD': line, 'MACD Signal': signal_line, 'MACD Histogram': histogram}, index=close.index)
+
+
+# middle band is the SMA, the outer bands are width population standard deviations away from it
+def bollinger(close: pd.Series, period=20, width=2) -> pd.DataFrame:
+    values = _values(close)
+    middle = sma(close, period).to_numpy()
+    std = np.full(len(values), np.nan)
+    if len(values) >= period:
+        std[period - 1:] = np.lib.stride_tricks.sliding_window_view(values, period).std(axis=1)
+    name = f'BB {period} {width}'
+    return pd.DataFrame({f'{name} Upper': middle + width * std, f'{name} Middle': middle,
+                         f'{name} Lower': middle - width * std}, index=close.index)
+
+
+# volume weighted average of the typical price (high + low + close) / 3, restarting at every anchor period
+# ('D' for daily sessions, any fixed pandas frequency such as '4H' works) or running over the whole frame when anchor is None
+def vwap(df: pd.DataFrame, anchor='D') -> pd.Series:
+    typical = (_values(df['High']) + _values(df['Low']) + _values(df['Close'])) / 3
+    volume = _values(df['Volume'])
+    pv, cum_volume = np.cumsum(typical * volume), np.cumsum(volume)
+    if anchor is not None and len(df):
+        sessions = df.index.floor(anchor).asi8
+        rows = np.arange(len(df))
+        first = np.maximum.accumulate(np.where(np.r_[True, sessions[1:] != sessions[:-1]], rows, 0))
+        pv = pv - np.r_[0.0, pv][first]
+        cum_volume = cum_volume - np.r_[0.0, cum_volume][first]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        out = np.where(cum_volume > 0, pv / cum_volume, np.nan)
+    return pd.Series(out, index=df.index, name='VWAP')
+
+
+# Running indicators. update() takes one bar as (start_ms, open, high, low, close, volume), the layout of
+# candle_aggregator.CandleAggregator.bars_since(), with replace=True when it is a new version of the last bar.
+# seed() loads the state from a candle frame so only bars after it have to be fed in. values() returns the
+# current value of every column in `columns`
+
+class EMAState:
+
+    def __init__(self, alpha, min_count=1):
+        self.alpha = alpha
+        self.min_count = min_count
+        self.raw = None
+        self.prev = None
+        self.count = 0
+
+    def update(self, value, replace=False):
+        if replace and self.count:
+            base = self.prev
+        else:
+            base = self.prev = self.raw
+            self.count += 1
+        self.raw = value if base is None else (1 - self.alpha) * base + self.alpha * value
+
+    def seed(self, values):
+        values = _values(values)
+        raw = _ema_raw(values, self.alpha)
+        self.count = len(values)
+        self.raw = raw[-1] if len(raw) else None
+        self.prev = raw[-2] if len(raw) > 1 else None
+
+    @property
+    def value(self):
+        return self.raw if self.count >= self.min_count else np.nan
+
+
+class SMA:
+
+    def __init__(self, period=20):
+        self.period = period
+        self.columns = [f'SMA {period}']
+        self.window = deque(maxlen=period)
+        self.total = 0.0
+
+    def update(self, bar, replace=False):
+        close = float(bar[4])
+        if replace and self.window:
+            self.total += close - self.window[-1]
+            self.window[-1] = close
+            return
+        dropped = self.window[0] if len(self.window) == self.period else 0.0
+        self.total += close - dropped
+        self.window.append(close)
+
+    def seed(self, df):
+        self.window = deque(_values(df['Close'])[-self.period:].tolist(), maxlen=self.period)
+        self.total = float(np.sum(self.window))
+
+    def values(self):
+        return (self.total / self.period if len(self.window) == self.period else np.nan,)
+
+
+class EMA:
+
+    def __init__(self, period=20):
+        self.columns = [f'EMA {period}']
+        self.state = EMAState(2 / (period + 1), period)
+
+    def update(self, bar, replace=False):
+        self.state.update(float(bar[4]), replace)
+
+    def seed(self, df):
+        self.state.seed(df['Close'])
+
+    def values(self):
+        return (self.state.value,)
+
+
+class RSI:
+
+    def __init__(self, period=14):
+        self.period = period
+        self.columns = [f'RSI {period}']
+        self.gain = EMAState(1 / period, period)
+        self.loss = EMAState(1 / period, period)
+        self.close = None
+        self.before = None
+
+    def update(self, bar, replace=False):
+        close = float(bar[4])
+        if not (replace and self.close is not None):
+            self.before = self.close
+        elif self.before is None:
+            self.close = close
+            return
+        self.close = close
+        if self.before is not None:
+            delta = close - self.before
+            self.gain.update(max(delta, 0.0), replace)
+            self.loss.update(max(-delta, 0.0), replace)
+
+    def seed(self, df):
+        values = _values(df['Close'])
+        delta = np.diff(values)
+        self.gain.seed(np.maximum(delta, 0))
+        self.loss.seed(np.maximum(-delta, 0))
+        self.close = values[-1] if len(values) else None
+        self.before = values[-2] if len(values) > 1 else None
+
+    def values(self):
+        if self.gain.count < self.period:
+            return (np.nan,)
+        if self.loss.raw == 0:
+            return (50.0 if self.gain.raw == 0 else 100.0,)
+        return (100 - 100 / (1 + self.gain.raw / self.loss.raw),)
+
+
+class MACD:
+
+    def __init__(self, fast=12, slow=26, signal=9):
+        self.columns = ['MACD', 'MACD Signal', 'MACD Histogram']
+        self.fast = EMAState(2 / (fast + 1))
+        self.slow = EMAState(2 / (slow + 1), slow)
+        self.signal = EMAState(2 / (signal + 1), slow + signal - 1)
+
+    def update(self, bar, replace=False):
+        close = float(bar[4])
+        self.fast.update(close, replace)
+        self.slow.update(close, replace)
+        self.signal.update(self.fast.raw - self.slow.raw, replace)
+
+    def seed(self, df):
+        values = _values(df['Close'])
+        self.fast.seed(values)
+        self.slow.seed(values)
+        self.signal.seed(_ema_raw(values, self.fast.alpha) - _ema_raw(values, self.slow.alpha))
+
+    def values(self):
+        if self.slow.count < self.slow.min_count:
+            return np.nan, np.nan, np.nan
+        line, signal = self.fast.raw - self.slow.raw, self.signal.value
+        return line, signal, line - signal
+
+
+# the outer bands use running sums of the window and of its squares, so they can differ from bollinger() in
+# the last few digits
+class Bollinger:
+
+    def __init__(self, period=20, width=2):
+        self.period = period
+        self.width = width
+        self.columns = [f'BB {period} {width} Upper', f'BB {period} {width} Middle', f'BB {period} {width} Lower']
+        self.window = deque(maxlen=period)
+        self.total = 0.0
+        self.squares = 0.0
+
+    def update(self, bar, replace=False):
+        close = float(bar[4])
+        if replace and self.window:
+            old = self.window[-1]
+            self.window[-1] = close
+        else:
+            old = self.window[0] if len(self.window) == self.period else 0.0
+            self.window.append(close)
+        self.total += close - old
+        self.squares += close * close - old * old
+
+    def seed(self, df):
+        self.window = deque(_values(df['Close'])[-self.period:].tolist(), maxlen=self.period)
+        self.total = float(np.sum(self.window))
+        self.squares = float(np.sum(np.square(self.window)))
+
+    def values(self):
+        if len(self.window) < self.period:
+            return np.nan, np.nan, np.nan
+        middle = self.total / self.period
+        std = np.sqrt(max(self.squares / self.period - middle * middle, 0.0))
+        return middle + self.width * std, middle, middle - self.width * std
+
+
+class VWAP:
+
+    def __init__(self, anchor='D'):
+        self.anchor = anchor
+        self.columns = ['VWAP']
+        self.step_ms = pd.tseries.frequencies.to_offset(anchor).nanos // 10**6 if anchor is not None else None
+        self.session = None
+        self.pv = 0.0
+        self.volume = 0.0
+        self.prev = (None, 0.0, 0.0)
+
+    def update(self, bar, replace=False):
+        start, _, high, low, close, volume = bar
+        if not replace:
+            self.prev = (self.session, self.pv, self.volume)
+        session, pv, cum_volume = self.prev
+        bar_session = self._session(start)
+        if bar_session != session:
+            pv, cum_volume = 0.0, 0.0
+        self.session = bar_session
+        self.pv = pv + (high + low + close) / 3 * volume
+        self.volume = cum_volume + volume
+
+    def seed(self, df):
+        if len(df) == 0:
+            return
+        last = df.iloc[-1]
+        session = self._session(df.index[-1].value // 10**6)
+        if self.anchor is not None:
+            df = df[df.index.floor(self.anchor) == df.index[-1].floor(self.anchor)]
+        typical = (_values(df['High']) + _values(df['Low']) + _values(df['Close'])) / 3
+        self.session = session
+        self.pv = float(np.sum(typical * _values(df['Volume'])))
+        self.volume = float(np.sum(_values(df['Volume'])))
+        last_pv = (float(last['High']) + float(last['Low']) + float(last['Close'])) / 3 * float(last['Volume'])
+        # the state before the last bar, the last bar may still be replaced
+        if len(df) > 1:
+            self.prev = (session, self.pv - last_pv, self.volume - float(last['Volume']))
+        else:
+            self.prev = (None, 0.0, 0.0)
+
+    def _session(self, start_ms):
+        return 0 if self.step_ms is None else int(start_ms) // self.step_ms
+
+    def values(self):
+        return (self.pv / self.volume if self.volume > 0 else np.nan,)
+
+
+# name -> (vectorized function, running class, default parameters)
+INDICATORS = {'SMA': (sma, SMA, (20,)),
+              'EMA': (ema, EMA, (20,)),
+              'RSI': (rsi, RSI, (14,)),
+              'BB': (bollinger, Bollinger, (20, 2)),
+              'MACD': (macd, MACD, (12, 26, 9)),
+              'VWAP': (vwap, VWAP, ())}
+
+
+def _parse(name: str):
+    kind, *params = name.split()
+    if kind not in INDICATORS:
+        raise ValueError(f'UNKNOWN INDICATOR-> {name}')
+    function, cls, defaults = INDICATORS[kind]
+    params = [float(param) if '.' in param else int(param) for param in params]
+    return function, cls, tuple(params) + defaults[len(params):]
+
+
+# the output columns of the named indicators, in the order compute() and IndicatorSet give them
+def output_columns(names) -> list:
+    return IndicatorSet(names).columns
+
+
+# the named indicators over a whole candle frame, one column per output (see the classes for column names)
+def compute(df: pd.DataFrame, names, anchor='D') -> pd.DataFrame:
+    out = pd.DataFrame(index=df.index)
+    for name in names:
+        function, _, params = _parse(name)
+        result = function(df, anchor) if function is vwap else function(df['Close'], *params)
+        for column, values in (result.items() if isinstance(result, pd.DataFrame) else [(result.name, result)]):
+            out[column] = values
+    return out
+
+
+# Running state of several indicators for one symbol and resolution. Bars older than the last one seen are
+# ignored and the last bar of the seed frame is not replaced by a live bar with the same start (the REST candle
+# already has the full volume of that bar), so several pollers can feed it the same bars
+class IndicatorSet:
+
+    def __init__(self, names, anchor='D', history=500):
+        self.names = list(names)
+        self.indicators = []
+        for name in self.names:
+            _, cls, params = _parse(name)
+            self.indicators.append(cls(anchor) if cls is VWAP else cls(*params))
+        self.columns = [column for indicator in self.indicators for column in indicator.columns]
+        self.last = None
+        self.last_live = False
+        self.history = {}
+        self.history_size = history
+        self.lock = threading.Lock()
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame, names, anchor='D', history=500):
+        indicators = cls(names, anchor, history)
+        for indicator in indicators.indicators:
+            indicator.seed(df)
+        if len(df):
+            indicators.last = int(df.index[-1].value // 10**6)
+        return indicators
+
+    # feed one bar, returns {column: value} after it or None when the bar was ignored
+    def update(self, bar):
+        start = int(bar[0])
+        with self.lock:
+            if self.last is not None and (start < self.last or (start == self.last and not self.last_live)):
+                return None
+            replace = start == self.last
+            for indicator in self.indicators:
+                indicator.update(bar, replace)
+            self.last, self.last_live = start, True
+            values = self._values()
+            self.history[start] = values
+            if len(self.history) > self.history_size:
+                del self.history[next(iter(self.history))]
+            return values
+
+    # the values after the live bar that started at start_ms, None if it is unknown
+    def values_at(self, start_ms):
+        with self.lock:
+            return self.history.get(int(start_ms))
+
+    def _values(self):
+        return dict(zip(self.columns, (float(value) for indicator in self.indicators
+                                       for value in indicator.values())))
@@ -0,0 +1,193 @@
+import functools
+import threading
+import time
+from contextlib import contextmanager
+
+# Lightweight in-process metrics: counters and latency histograms keyed by name and labels, rendered in the
+# Prometheus text format by the /metrics route added with add_metrics_route(). The connector, the caches,
+# the normalizers, the live stream and the dash callbacks report into the shared REGISTRY, so a scrape (or a
+# look at http://host:8050/metrics) tells which endpoint, dataset, view or symbol the time goes to.
+# Recording is a dict lookup and a few additions under a lock, cheap enough for the per-message hot paths
+
+# histogram bucket upper bounds in seconds, +Inf is implied
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+# label sets kept per metric, further ones are counted under label values '_other' so a stream of distinct
+# symbols cannot grow the registry without bound
+MAX_SERIES = 2000
+
+
+class Registry:
+
+    def __init__(self, buckets=BUCKETS, max_series=MAX_SERIES):
+        self.buckets = tuple(buckets)
+        self.max_series = max_series
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+        self.help = {}
+
+    def describe(self, name, text):
+        self.help[name] = text
+
+    def count(self, name, value=1, **labels):
+        with self.lock:
+            series = self.counters.setdefault(name, {})
+            key = self._key(series, labels)
+            series[key] = series.get(key, 0) + value
+
+    def observe(self, name, seconds, **labels):
+        with self.lock:
+            series = self.histograms.setdefault(name, {})
+            key = self._key(series, labels)
+            histogram = series.get(key)
+            if histogram is None:
+                # per bucket counts (not cumulative), then the sum and the count
+                histogram = series[key] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+            i = 0
+            for bound in self.buckets:
+                if seconds <= bound:
+                    break
+                i += 1
+            histogram[i] += 1
+            histogram[-2] += seconds
+            histogram[-1] += 1
+
+    def _key(self, series, labels):
+        key = tuple(sorted(labels.items()))
+        if key not in series and len(series) >= self.max_series:
+            key = tuple((name, '_other') for name, _ in key)
+        return key
+
+    def reset(self):
+        with self.lock:
+            self.counters.clear()
+            self.histograms.clear()
+
+    # {(name, labels): value} for counters and {(name, labels): (count, sum)} for histograms, handy in scripts
+    def snapshot(self) -> dict:
+        with self.lock:
+            values = {(name, key): value for name, series in self.counters.items() for key, value in series.items()}
+            values.update({(name, key): (histogram[-1], histogram[-2]) for name, series in self.histograms.items()
+                           for key, histogram in series.items()})
+        return values
+
+    # every metric in the Prometheus text exposition format (version 0.0.4)
+    def render(self) -> str:
+        with self.lock:
+            counters = {name: dict(series) for name, series in self.counters.items()}
+            histograms = {name: {key: list(values) for key, values in series.items()}
+                          for name, series in self.histograms.items()}
+        lines = []
+        for name in sorted(counters):
+            lines.extend(self._header(f'{name}_total', 'counter'))
+            for key, value in sorted(counters[name].items()):
+                lines.append(f'{name}_total{_labels(key)} {_number(value)}')
+        for name in sorted(histograms):
+            lines.extend(self._header(name, 'histogram'))
+            for key, values in sorted(histograms[name].items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + ('+Inf',), values):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{_labels(key + (("le", _number(bound)),))} {cumulative}')
+                lines.append(f'{name}_sum{_labels(key)} {_number(values[-2])}')
+                lines.append(f'{name}_count{_labels(key)} {values[-1]}')
+        return '\n'.join(lines) + '\n'
+
+    def _header(self, name, kind):
+        text = self.help.get(name.removesuffix('_total'))
+        return ([f'# HELP {name} {text}'] if text else []) + [f'# TYPE {name} {kind}']
+
+
+def _labels(key) -> str:
+    if not key:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in key)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(key, escaped)) + '}'
+
+
+def _number(value) -> str:
+    return value if isinstance(value, str) else repr(float(value)) if isinstance(value, float) else str(value)
+
+
+REGISTRY = Registry()
+REGISTRY.describe('finnhub_api_request_seconds', 'Finnhub REST round trip per attempt, by endpoint and status')
+REGISTRY.describe('finnhub_api_response_bytes', 'Bytes received from the Finnhub REST API, by endpoint')
+REGISTRY.describe('finnhub_api_retries', 'Retried Finnhub REST calls, by endpoint and reason')
+REGISTRY.describe('finnhub_api_parse_seconds', 'JSON decoding of Finnhub responses, by endpoint')
+REGISTRY.describe('finnhub_rate_limit_wait_seconds', 'Time calls waited for the rate limiter')
+REGISTRY.describe('finnhub_normalize_seconds', 'Payload to DataFrame transforms, by function')
+REGISTRY.describe('finnhub_cache_requests', 'Server cache lookups, by dataset and result (hit or miss)')
+REGISTRY.describe('finnhub_cache_fetch_seconds', 'Time to produce a missing cache entry, by dataset')
+REGISTRY.describe('finnhub_stream_messages', 'Websocket messages received')
+REGISTRY.describe('finnhub_stream_bytes', 'Websocket bytes received')
+REGISTRY.describe('finnhub_stream_errors', 'Websocket messages skipped, by stage (decode or on_batch)')
+REGISTRY.describe('quote_board_poll_errors', 'Quote board polls that failed, by exception type')
+REGISTRY.describe('news_store_poll_errors', 'News archive polls that failed, by exception type')
+REGISTRY.describe('dash_callback_seconds', 'Dash callback duration, by output and symbol')
+REGISTRY.describe('dash_step_seconds', 'Steps inside the dash callbacks, by step and view')
+
+
+def count(name, value=1, **labels):
+    REGISTRY.count(name, value, **labels)
+
+
+def observe(name, seconds, **labels):
+    REGISTRY.observe(name, seconds, **labels)
+
+
+# time the block into the histogram `name`, also when it raises
+@contextmanager
+def span(name, **labels):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        REGISTRY.observe(name, time.perf_counter() - start, **labels)
+
+
+# decorator version of span
+def timed(name, **labels):
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                REGISTRY.observe(name, time.perf_counter() - start, **labels)
+        return wrapper
+    return decorator
+
+
+# serve the registry at `path` on a Flask server (a dash app's app.server)
+def add_metrics_route(server, path='/metrics', registry=REGISTRY):
+    def metrics():
+        return registry.render(), 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
+    server.add_url_rule(path, 'metrics', metrics)
+
+
+# time every callback of a dash app into dash_callback_seconds, labelled with the callback's first output and
+# the value of the given input/state ids (e.g. the symbol), so slow views and symbols stand out
+def instrument_dash(app, label_ids=('symbol',)):
+    import flask
+
+    for key, spec in app.callback_map.items():
+        output = key.strip('.').split('...')[0].split('@')[0]
+        spec['callback'] = _timed_callback(spec['callback'], output, label_ids, flask)
+
+
+def _timed_callback(callback, output, label_ids, flask):
+    @functools.wraps(callback)
+    def wrapper(*args, **kwargs):
+        labels = {'output': output}
+        body = flask.request.get_json(silent=True) or {}
+        for item in body.get('inputs', []) + body.get('state', []):
+            if isinstance(item, dict) and item.get('id') in label_ids:
+                labels[item['id']] = item.get('value')
+        start = time.perf_counter()
+        try:
+            return callback(*args, **kwargs)
+        finally:
+            REGISTRY.observe('dash_callback_seconds', time.perf_counter() - start, **labels)
+    return wrapper
@@ -0,0 +1,60 @@
+import numpy as np
+import pandas as pd
+
+# Rescale metric values by powers of ten so they all fit on one bar chart: values above 100 are divided and
+# values between -5 and 5 are multiplied until their magnitude lies between 5 and 100, values already in that
+# range are kept as they are. Works on arrays of any shape, so one call covers a single symbol's metrics or a
+# whole watchlist (symbols x metrics) at once
+
+
+# returns (scaled values, power of ten each value was divided by). A negative power means the value was
+# multiplied, zeros and NaNs are left alone with a power of 0
+def scale_to_range(values, low=5, high=100):
+    values = np.asarray(values, dtype=np.float64)
+    magnitude = np.abs(values)
+    powers = np.zeros(values.shape, dtype=np.int64)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        big = magnitude > high
+        powers[big] = np.ceil(np.log10(magnitude[big] / high))
+        small = (magnitude < low) & (magnitude > 0)
+        powers[small] = -np.ceil(np.log10(low / magnitude[small]))
+
+        # log10 is not exact around powers of ten, move every value that landed one step off back in range
+        scaled = values / 10.0 ** powers
+        powers[big & (np.abs(scaled) > high)] += 1
+        powers[big & (np.abs(values / 10.0 ** (powers - 1)) <= high) & (powers > 1)] -= 1
+        scaled = values / 10.0 ** powers
+        powers[small & (np.abs(scaled) < low)] -= 1
+        powers[small & (np.abs(values / 10.0 ** (powers + 1)) >= low) & (powers < -1)] += 1
+        scaled = values / 10.0 ** powers
+
+    scaled = np.where(powers != 0, np.round(scaled, 3), values)
+    return scaled, powers
+
+
+# '(Divided by 1000)' / '(Multiplied by 10)' style labels for an array of powers, '' where nothing changed
+def scale_labels(powers) -> np.ndarray:
+    powers = np.asarray(powers, dtype=np.int64)
+    factors = (10 ** np.abs(powers)).astype(str).astype(object)
+    labels = np.full(powers.shape, '', dtype=object)
+    labels[powers > 0] = '(Divided by ' + factors[powers > 0] + ')'
+    labels[powers < 0] = '(Multiplied by ' + factors[powers < 0] + ')'
+    return labels
+
+
+# one symbol's metrics (the 'metric' column of get_basic_financials()['past_year']). Non numeric entries such
+# as the 52 week high/low dates become NaN. Returns a frame with the scaled 'value' and its 'label'
+def normalize_metrics(metric: pd.Series) -> pd.DataFrame:
+    values = pd.to_numeric(metric.where(metric.map(type).isin((int, float, np.float64, np.int64))),
+                           errors='coerce')
+    scaled, powers = scale_to_range(values.to_numpy())
+    return pd.DataFrame({'value': scaled, 'label': scale_labels(powers)}, index=metric.index)
+
+
+# a watchlist frame (one row per symbol, one column per metric) scaled in a single pass,
+# returns (scaled values, labels) as two frames shaped like the input
+def normalize_watchlist(metrics: pd.DataFrame):
+    scaled, powers = scale_to_range(metrics.apply(pd.to_numeric, errors='coerce').to_numpy())
+    return (pd.DataFrame(scaled, index=metrics.index, columns=metrics.columns),
+            pd.DataFrame(scale_labels(powers), index=metrics.index, columns=metrics.columns))
@@ -0,0 +1,245 @@
+import datetime as dt
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import pandas as pd
+
+import instrumentation
+from finnhub_connector import FinnhubConnector
+from finnhub_normalize import epoch_index
+
+# article columns in the order they are stored, named as in the connector's news frames
+ARTICLE_COLUMNS = ['ID', 'Category', 'Headline', 'Image', 'Related to (symbol)', 'Source', 'Summary', 'URL']
+
+
+# Local news archive for a watchlist. ingest() downloads only the news published since the symbol's high-water
+# mark (the newest article seen for it, or the last poll when it had none) and writes the articles that are not
+# stored yet, the article ID is the primary key so overlapping windows and articles about several symbols are
+# stored once. Headlines and summaries are indexed with SQLite FTS5 when the sqlite build has it. Queries such
+# as "news for these 200 tickers this week" or a keyword search then run on the local database, newest first.
+# Symbols added with watch() (e.g. the ones opened in the dashboard) are only polled until they have not been
+# watched for watch_ttl seconds, and at most max_watched of them, so the polling load stays bounded
+class NewsStore:
+
+    def __init__(self, connector: FinnhubConnector, path='finnhub_news.sqlite', symbols=(), interval=900,
+                 lookback_days=7, watch_ttl=3600, max_watched=50):
+        self.connector = connector
+        self.path = path
+        self.symbols = list(dict.fromkeys(symbols))
+        # symbols added with watch() and the time they were last watched, least recently watched first
+        self.watched = OrderedDict()
+        self.watch_ttl = watch_ttl
+        self.max_watched = max_watched
+        self.interval = interval
+        self.lookback_days = lookback_days
+        self.lock = threading.Lock()
+        self.poll_stop = None
+        self.poll_wake = threading.Event()
+        # last error of every symbol whose ingest failed, cleared once it succeeds again
+        self.errors = {}
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        with self.conn:
+            self.conn.execute('PRAGMA journal_mode=WAL')
+            self.conn.execute('CREATE TABLE IF NOT EXISTS articles (id INTEGER PRIMARY KEY, datetime INTEGER, '
+                              'category TEXT, headline TEXT, image TEXT, related TEXT, source TEXT, summary TEXT, '
+                              'url TEXT)')
+            self.conn.execute('CREATE TABLE IF NOT EXISTS symbol_articles (symbol TEXT, datetime INTEGER, '
+                              'id INTEGER, PRIMARY KEY (symbol, datetime, id)) WITHOUT ROWID')
+            self.conn.execute('CREATE TABLE IF NOT EXISTS watermarks (symbol TEXT PRIMARY KEY, latest INTEGER, '
+                              'polled_at REAL)')
+            try:
+                self.conn.execute("CREATE VIRTUAL TABLE IF NOT EXISTS articles_fts USING fts5(headline, summary, "
+                                  "content='articles', content_rowid='id')")
+                self.conn.execute('CREATE TRIGGER IF NOT EXISTS articles_fts_insert AFTER INSERT ON articles BEGIN '
+                                  'INSERT INTO articles_fts (rowid, headline, summary) '
+                                  'VALUES (new.id, new.headline, new.summary); END')
+                self.fts = True
+            except sqlite3.OperationalError:
+                # sqlite built without FTS5, search() falls back to LIKE on the headlines
+                self.fts = False
+
+    def close(self):
+        self.stop_polling_thread()
+        self.conn.close()
+
+    # -- ingestion
+
+    # the symbols polled by poll(): the fixed ones and those watched within the last watch_ttl seconds
+    def polled_symbols(self) -> list:
+        cutoff = time.time() - self.watch_ttl
+        with self.lock:
+            for symbol in [symbol for symbol, watched_at in self.watched.items() if watched_at < cutoff]:
+                del self.watched[symbol]
+            return self.symbols + list(self.watched)
+
+    # poll these symbols too for the next watch_ttl seconds, watching them again extends that
+    def watch(self, *symbols):
+        now = time.time()
+        with self.lock:
+            new = [symbol for symbol in symbols if symbol not in self.symbols and symbol not in self.watched]
+            for symbol in symbols:
+                if symbol not in self.symbols:
+                    self.watched[symbol] = now
+                    self.watched.move_to_end(symbol)
+            while len(self.watched) > self.max_watched:
+                self.watched.popitem(last=False)
+        if new:
+            # fetch the new symbols' news now instead of at the next interval
+            self.poll_wake.set()
+
+    # download and store the news of one symbol published since its high-water mark, returns the number of
+    # articles that were new
+    def ingest(self, symbol: str) -> int:
+        now = time.time()
+        with self.lock:
+            row = self.conn.execute('SELECT latest, polled_at FROM watermarks WHERE symbol=?', (symbol,)).fetchone()
+        start = now - self.lookback_days * 86400
+        if row is not None:
+            start = max(start, row[0] if row[0] is not None else row[1])
+
+        # the API takes whole days, the articles of the first day that are already stored are skipped
+        start_date = dt.datetime.fromtimestamp(start, dt.timezone.utc).date()
+        end_date = dt.datetime.fromtimestamp(now, dt.timezone.utc).date()
+        new, latest = 0, None
+        for df in self.connector.iter_company_news(symbol, str(start_date), str(end_date)):
+            if len(df) == 0:
+                continue
+            new += self._save(symbol, df)
+            latest = max(latest or 0, int(df.index.asi8.max() // 10**9))
+
+        with self.lock, self.conn:
+            self.conn.execute('INSERT INTO watermarks VALUES (?, ?, ?) ON CONFLICT (symbol) DO UPDATE SET '
+                              'latest=max(coalesce(latest, 0), coalesce(excluded.latest, 0)), '
+                              'polled_at=excluded.polled_at', (symbol, latest, now))
+        return new
+
+    def _save(self, symbol, df):
+        seconds = (df.index.asi8 // 10**9).tolist()
+        ids = df['ID'].astype('int64').tolist()
+        columns = [df[column].tolist() if column in df.columns else [None] * len(df) for column in ARTICLE_COLUMNS[1:]]
+        with self.lock, self.conn:
+            stored = {row[0] for row in self.conn.execute(
+                f"SELECT id FROM articles WHERE id IN ({','.join('?' * len(ids))})", ids)}
+            rows = [row for row in zip(ids, seconds, *columns) if row[0] not in stored]
+            self.conn.executemany('INSERT OR IGNORE INTO articles VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)', rows)
+            self.conn.executemany('INSERT OR IGNORE INTO symbol_articles VALUES (?, ?, ?)',
+                                  zip([symbol] * len(ids), seconds, ids))
+        return len(rows)
+
+    # ingest every symbol (the watchlist by default), returns the number of new articles. Symbols that fail, for
+    # whatever reason, are kept in self.errors and tried again at the next poll. progress(done, total) is called
+    # after every symbol if given
+    def poll(self, symbols=None, max_workers=4, progress=None) -> int:
+        symbols = list(self.polled_symbols() if symbols is None else symbols)
+        new = done = 0
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {executor.submit(self.ingest, symbol): symbol for symbol in symbols}
+            for future in as_completed(futures):
+                symbol = futures[future]
+                try:
+                    new += future.result()
+                    self.errors.pop(symbol, None)
+                except Exception as error:
+                    # e.g. an unreachable API or an article payload without the expected fields
+                    self.errors[symbol] = f'{type(error).__name__}: {error}'
+                    instrumentation.count('news_store_poll_errors', error=type(error).__name__)
+                done += 1
+                if progress is not None:
+                    progress(done, len(symbols))
+        return new
+
+    # poll the symbols every `interval` seconds (and right away when symbols are added) in a daemon thread
+    def start_polling_thread(self) -> threading.Thread:
+        self.poll_stop = threading.Event()
+
+        # a failed round is counted and the next one runs as usual, the thread only ends when stopped
+        def loop(stop):
+            while not stop.is_set():
+                self.poll_wake.clear()
+                try:
+                    self.poll()
+                except Exception as error:
+                    instrumentation.count('news_store_poll_errors', error=type(error).__name__)
+                self.poll_wake.wait(self.interval)
+
+        thread = threading.Thread(target=loop, args=(self.poll_stop,), name='news-store', daemon=True)
+        thread.start()
+        return thread
+
+    def stop_polling_thread(self):
+        if self.poll_stop is not None:
+            self.poll_stop.set()
+            self.poll_wake.set()
+
+    # -- queries
+
+    # stored news of the given symbols published between start and end (anything pd.Timestamp accepts, UTC),
+    # newest first with a Symbol column. An article about several of the symbols is listed once per symbol
+    def news(self, symbols, start=None, end=None, limit=None) -> pd.DataFrame:
+        symbols = [symbols] if isinstance(symbols, str) else list(symbols)
+        where, params = _time_range('s.datetime', start, end)
+        query = (f"SELECT s.symbol, {_SELECT} FROM symbol_articles s JOIN articles a ON a.id=s.id "
+                 f"WHERE s.symbol IN ({','.join('?' * len(symbols))}){where} ORDER BY s.datetime DESC, s.id DESC")
+        return self._frame(query, symbols + params, limit, with_symbol=True)
+
+    # articles whose headline or summary match an FTS5 query (e.g. 'earnings', 'apple AND iphone' or 'chip*'),
+    # optionally limited to some symbols and a time range, newest first. Without FTS5 the words are matched
+    # as substrings of the headline
+    def search(self, text: str, symbols=None, start=None, end=None, limit=50) -> pd.DataFrame:
+        where, params = _time_range('a.datetime', start, end)
+        if self.fts:
+            query = f'SELECT {_SELECT} FROM articles_fts f JOIN articles a ON a.id=f.rowid WHERE articles_fts MATCH ?'
+            params = [text] + params
+        else:
+            words = text.split()
+            query = f"SELECT {_SELECT} FROM articles a WHERE {' AND '.join(['a.headline LIKE ?'] * len(words)) or '1'}"
+            params = [f'%{word}%' for word in words] + params
+        if symbols is not None:
+            symbols = [symbols] if isinstance(symbols, str) else list(symbols)
+            where += f" AND a.id IN (SELECT id FROM symbol_articles WHERE symbol IN ({','.join('?' * len(symbols))}))"
+            params += symbols
+        return self._frame(f'{query}{where} ORDER BY a.datetime DESC, a.id DESC', params, limit)
+
+    # per symbol: number of stored articles, newest article and time of the last poll
+    def status(self) -> pd.DataFrame:
+        with self.lock:
+            rows = self.conn.execute('SELECT w.symbol, (SELECT count(*) FROM symbol_articles s WHERE '
+                                     's.symbol=w.symbol), w.latest, w.polled_at FROM watermarks w '
+                                     'ORDER BY w.symbol').fetchall()
+        df = pd.DataFrame(rows, columns=['Symbol', 'Articles', 'Latest', 'Polled'])
+        df['Latest'] = pd.to_datetime(df['Latest'], unit='s', utc=True)
+        df['Polled'] = pd.to_datetime(df['Polled'], unit='s', utc=True)
+        return df.set_index('Symbol')
+
+    def _frame(self, query, params, limit, with_symbol=False):
+        if limit is not None:
+            query += f' LIMIT {int(limit)}'
+        with self.lock:
+            try:
+                rows = self.conn.execute(query, params).fetchall()
+            except sqlite3.OperationalError:
+                # e.g. unbalanced quotes in an FTS5 query
+                raise ValueError(f'INVALID NEWS QUERY-> {params[0]}')
+        columns = (['Symbol'] if with_symbol else []) + ['Datetime'] + ARTICLE_COLUMNS
+        df = pd.DataFrame(rows, columns=columns)
+        df.index = epoch_index(df.pop('Datetime').to_numpy(dtype='int64'))
+        return df
+
+
+_SELECT = 'a.datetime, a.id, a.category, a.headline, a.image, a.related, a.source, a.summary, a.url'
+
+
+# extra WHERE conditions and their parameters for a time range, naive times are taken as UTC
+def _time_range(column, start, end):
+    where, params = '', []
+    for value, operator in ((start, '>='), (end, '<=')):
+        if value is not None:
+            value = pd.Timestamp(value)
+            if value.tzinfo is None:
+                value = value.tz_localize('UTC')
+            where += f' AND {column}{operator}?'
+            params.append(int(value.timestamp()))
+    return where, params
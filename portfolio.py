@@ -0,0 +1,217 @@
+import datetime as dt
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+from dateutil.relativedelta import relativedelta
+
+# bars per year used to annualize volatility, intraday resolutions assume the 6.5 hour US session
+PERIODS_PER_YEAR = {'D': 252, 'W': 52, 'M': 12}
+
+
+def periods_per_year(resolution) -> float:
+    resolution = str(resolution)
+    if resolution in PERIODS_PER_YEAR:
+        return PERIODS_PER_YEAR[resolution]
+    return 252 * 390 / int(resolution)
+
+
+# Align the candle frames of several symbols ({symbol: frame}) on the union of their timestamps into one
+# timestamp x symbol float64 frame of the given column. Each symbol is placed with one searchsorted over the
+# shared index, bars a symbol does not have stay NaN
+def price_matrix(frames: dict, field='Close') -> pd.DataFrame:
+    frames = {symbol: frame for symbol, frame in frames.items() if frame is not None and len(frame)}
+    if not frames:
+        raise ValueError('THERE IS NO CANDLE DATA TO ALIGN')
+
+    stamps = [frame.index.asi8 for frame in frames.values()]
+    index = np.unique(np.concatenate(stamps))
+    matrix = np.full((len(index), len(frames)), np.nan)
+    for j, (t, frame) in enumerate(zip(stamps, frames.values())):
+        matrix[np.searchsorted(index, t), j] = frame[field].to_numpy(np.float64)
+    return pd.DataFrame(matrix, index=pd.DatetimeIndex(pd.to_datetime(index, utc=True), name='Datetime'),
+                        columns=pd.Index(list(frames), name='Symbol'))
+
+
+# call load(symbol) for every symbol at once on a thread pool, returns the frames {symbol: frame} in the order
+# of the symbols and the errors {symbol: message} of the symbols that could not be loaded
+def load_frames(load, symbols, max_workers=8):
+    symbols = list(dict.fromkeys(symbols))
+    frames, failed = {}, {}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(load, symbol): symbol for symbol in symbols}
+        for future in as_completed(futures):
+            symbol = futures[future]
+            try:
+                frames[symbol] = future.result()
+            except (ValueError, OSError) as error:
+                failed[symbol] = str(error)
+    return {symbol: frames[symbol] for symbol in symbols if symbol in frames}, failed
+
+
+# Vectorized analytics of a weighted basket of symbols over an aligned price matrix (see price_matrix):
+# returns, rolling volatility, covariance and correlation matrices, drawdowns and the P&L of the weighted
+# portfolio. Everything works on the whole timestamp x symbol array at once, the covariance and correlation
+# matrices come from a handful of matrix products, so 500 symbols over three years of daily bars take a
+# fraction of a second. Missing bars are carried forward (a symbol that did not trade has a return of 0), bars
+# before a symbol's first price stay NaN and are left out of its statistics. Weights are a {symbol: weight}
+# dict or a sequence in the order of the symbols, equal weights by default, and are scaled to sum to 1; the
+# portfolio is rebalanced to them every bar
+class Portfolio:
+
+    def __init__(self, prices: pd.DataFrame, weights=None, periods_per_year=252, failed=None):
+        self.prices = prices
+        self.symbols = list(prices.columns)
+        self.index = prices.index
+        self.periods_per_year = periods_per_year
+        # symbols that could not be loaded, {symbol: error message}
+        self.failed = dict(failed or {})
+        self.weights = self._weights(weights)
+
+        values = prices.to_numpy(np.float64)
+        valid = ~np.isnan(values)
+        # forward fill: the row of the last price seen in every column
+        rows = np.where(valid, np.arange(len(values))[:, None], 0)
+        np.maximum.accumulate(rows, axis=0, out=rows)
+        self.values = values[rows, np.arange(values.shape[1])]
+        self.first = valid.argmax(axis=0) if len(values) else np.zeros(len(self.symbols), dtype=int)
+
+        self.simple = np.full_like(self.values, np.nan)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            self.simple[1:] = self.values[1:] / self.values[:-1] - 1
+
+    # candle frames {symbol: frame} as returned by the connector
+    @classmethod
+    def from_frames(cls, frames: dict, weights=None, field='Close', periods_per_year=252, failed=None):
+        return cls(price_matrix(frames, field), weights, periods_per_year, failed)
+
+    # download the candles of every symbol concurrently (through the connector's candle cache, so repeated
+    # calls only fetch new bars) and align them. date_to defaults to today and date_from to three years before
+    # it. Symbols without data are left out and listed in portfolio.failed
+    @classmethod
+    def fetch(cls, connector, symbols, resolution='D', date_from=None, date_to=None, weights=None,
+              max_workers=8, field='Close'):
+        date_to = date_to or str(dt.date.today())
+        date_from = date_from or str(dt.date.fromisoformat(date_to) - relativedelta(years=3))
+
+        frames, failed = load_frames(
+            lambda symbol: connector.get_stock_candles(symbol, resolution, date_from, date_to), symbols, max_workers)
+        if isinstance(weights, dict):
+            weights = {symbol: weight for symbol, weight in weights.items() if symbol in frames}
+        return cls.from_frames(frames, weights, field, periods_per_year(resolution), failed)
+
+    def _weights(self, weights) -> np.ndarray:
+        if weights is None:
+            weights = np.ones(len(self.symbols))
+        elif isinstance(weights, dict):
+            weights = np.array([weights.get(symbol, 0.0) for symbol in self.symbols], dtype=np.float64)
+        else:
+            weights = np.asarray(weights, dtype=np.float64)
+            if weights.shape != (len(self.symbols),):
+                raise ValueError(f'EXPECTED {len(self.symbols)} PORTFOLIO WEIGHTS, GOT {weights.size}')
+        total = weights.sum()
+        if not np.isfinite(total) or total == 0:
+            raise ValueError('PORTFOLIO WEIGHTS MUST SUM TO A NON-ZERO NUMBER')
+        return weights / total
+
+    # the same portfolio from `start` (a date or timestamp) onwards, e.g. portfolio.since('2024-01-01')
+    def since(self, start):
+        start = pd.Timestamp(start)
+        if start.tzinfo is None:
+            start = start.tz_localize('UTC')
+        return Portfolio(self.prices[self.index >= start], self.weights, self.periods_per_year, self.failed)
+
+    def _frame(self, values) -> pd.DataFrame:
+        return pd.DataFrame(values, index=self.index, columns=self.prices.columns)
+
+    # per bar returns of every symbol, the first bar (and bars before a symbol's first price) are NaN
+    def returns(self, log=False) -> pd.DataFrame:
+        return self._frame(np.log1p(self.simple) if log else self.simple)
+
+    # rolling standard deviation of the returns over `window` bars, annualized by default
+    def volatility(self, window=20, annualize=True) -> pd.DataFrame:
+        volatility = self.returns().rolling(window, min_periods=window).std()
+        return volatility * np.sqrt(self.periods_per_year) if annualize else volatility
+
+    # pairwise covariance and correlation of the returns. Every pair uses the bars where both symbols have a
+    # return, which comes down to a few (bars x symbols)' x (bars x symbols) products instead of a loop over
+    # pairs. Pairs with fewer than min_periods common bars are NaN
+    def _pairwise(self, min_periods):
+        valid = ~np.isnan(self.simple)
+        x = np.where(valid, self.simple, 0.0)
+        mask = valid.astype(np.float64)
+
+        n = mask.T @ mask
+        sum_x = x.T @ mask
+        sum_xx = (x * x).T @ mask
+        sum_xy = x.T @ x
+        with np.errstate(divide='ignore', invalid='ignore'):
+            # sum_x[i, j] sums symbol i over the bars it shares with j and sum_x.T[i, j] symbol j over the same bars
+            covariance = (sum_xy - sum_x * sum_x.T / n) / (n - 1)
+            variance = sum_xx - sum_x ** 2 / n
+            correlation = (sum_xy - sum_x * sum_x.T / n) / np.sqrt(variance * variance.T)
+        covariance[n < max(min_periods, 2)] = np.nan
+        correlation[n < max(min_periods, 2)] = np.nan
+        np.clip(correlation, -1, 1, out=correlation)
+        return covariance, correlation
+
+    def covariance(self, min_periods=2, annualize=False) -> pd.DataFrame:
+        covariance = self._pairwise(min_periods)[0]
+        if annualize:
+            covariance = covariance * self.periods_per_year
+        return pd.DataFrame(covariance, index=self.prices.columns, columns=self.prices.columns)
+
+    def correlation(self, min_periods=2) -> pd.DataFrame:
+        return pd.DataFrame(self._pairwise(min_periods)[1], index=self.prices.columns, columns=self.prices.columns)
+
+    # distance of every price below its running maximum, 0 at a new high and -0.25 25 % below it
+    def drawdowns(self) -> pd.DataFrame:
+        return self._frame(self.values / np.fmax.accumulate(self.values, axis=0) - 1)
+
+    def max_drawdown(self) -> pd.Series:
+        return self.drawdowns().min()
+
+    # returns of the portfolio, the weighted sum of the symbol returns. A symbol without a price yet
+    # contributes nothing
+    def portfolio_returns(self) -> pd.Series:
+        returns = np.nan_to_num(self.simple) @ self.weights
+        returns[0] = np.nan
+        return pd.Series(returns, index=self.index, name='Portfolio')
+
+    def portfolio_volatility(self, window=20, annualize=True) -> pd.Series:
+        volatility = self.portfolio_returns().rolling(window, min_periods=window).std()
+        return volatility * np.sqrt(self.periods_per_year) if annualize else volatility
+
+    # value of `capital` invested in the portfolio at the first bar
+    def equity(self, capital=1.0) -> pd.Series:
+        returns = np.nan_to_num(self.portfolio_returns().to_numpy())
+        return pd.Series(capital * np.cumprod(1 + returns), index=self.index, name='Equity')
+
+    # profit and loss of every position per bar (weight x portfolio value at the previous bar x return) with
+    # their sum in the 'Total' column, .cumsum() gives the running P&L
+    def pnl(self, capital=1.0) -> pd.DataFrame:
+        equity = self.equity(capital).to_numpy()
+        pnl = np.zeros_like(self.values)
+        pnl[1:] = equity[:-1, None] * self.weights * np.nan_to_num(self.simple[1:])
+        df = self._frame(pnl)
+        df['Total'] = pnl.sum(axis=1)
+        return df
+
+    # one row per symbol plus the portfolio: weight, last price, total return, annualized volatility and the
+    # maximum drawdown over the whole period
+    def summary(self) -> pd.DataFrame:
+        returns = self.returns()
+        last = self.values[-1]
+        first = self.values[self.first, np.arange(len(self.symbols))]
+        df = pd.DataFrame({'Weight': self.weights,
+                           'Last Price': last,
+                           'Total Return': last / first - 1,
+                           'Volatility': returns.std().to_numpy() * np.sqrt(self.periods_per_year),
+                           'Max Drawdown': self.max_drawdown().to_numpy()},
+                          index=pd.Index(self.symbols, name='Symbol'))
+
+        equity = self.equity()
+        df.loc['Portfolio'] = [self.weights.sum(), np.nan, equity.iloc[-1] - 1,
+                               self.portfolio_returns().std() * np.sqrt(self.periods_per_year),
+                               (equity / equity.cummax() - 1).min()]
+        return df
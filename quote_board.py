@@ -0,0 +1,211 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import pandas as pd
+
+import instrumentation
+from finnhub_connector import FinnhubConnector
+from server_cache import LRUCache
+
+# columns of the board in display order, one row per watched symbol
+COLUMNS = ['Symbol', 'Price', 'Change', 'Change %', 'High', 'Low', 'Open', 'Prev Close', 'Updated (UTC)', 'Source']
+
+# board column -> column of the connector's quote frame
+REST_COLUMNS = {'Price': 'Current price', 'Change': 'Change', 'Change %': 'Percent change',
+                'High': 'High price of the day', 'Low': 'Low price of the day', 'Open': 'Open price of the day',
+                'Prev Close': 'Previous close price'}
+
+
+# Live quote table for a whole watchlist. Symbols that trade are kept up to date from the websocket (feed
+# add_batch with the stream's TradeBatch objects), the others are polled over REST: every `refresh` seconds
+# the symbols without a trade in the last trade_max_age seconds are polled, least recently polled first and
+# at most `budget` of them per round, so a large board never takes more than its share of the API quota.
+# Requests for the same symbol within one refresh window share a single upstream call. Every cell that
+# changes gets a new version number, changes_since(version) returns only the cells changed after a version
+# so clients (the dash DataTable) receive diffs instead of the whole table
+class QuoteBoard:
+
+    def __init__(self, connector: FinnhubConnector, symbols=(), stream=None, refresh=5, trade_max_age=30,
+                 quota_share=0.5, budget=None, max_workers=4):
+        self.connector = connector
+        self.stream = stream
+        self.refresh = refresh
+        self.trade_max_age = trade_max_age
+
+        # REST calls per round, by default quota_share of what the connector's rate limiter lets through
+        # in one refresh interval
+        if budget is None:
+            budget = int(connector.rate_limiter.rate * refresh * quota_share)
+        self.budget = max(1, budget)
+
+        self.lock = threading.Lock()
+        self.symbols = []
+        self.positions = {}
+        self.rows = {}
+        self.cell_versions = {}
+        self.version = 0
+        # bumped when symbols are added or removed, clients then need the whole table again
+        self.layout = 0
+        self.last_trade = {}
+        self.last_poll = {}
+        self.errors = {}
+
+        self.quotes = LRUCache(ttl=refresh, max_entries=4096, name='quote_board')
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='quote-board')
+        self.poll_stop = None
+        self.watch(*symbols)
+
+    def close(self):
+        self.stop_polling_thread()
+        self.executor.shutdown(wait=False)
+
+    # -- watchlist
+
+    def watch(self, *symbols):
+        with self.lock:
+            new = [symbol for symbol in dict.fromkeys(symbols) if symbol not in self.positions]
+            for symbol in new:
+                self.positions[symbol] = len(self.symbols)
+                self.symbols.append(symbol)
+                self.rows[symbol] = dict.fromkeys(COLUMNS)
+                self.rows[symbol]['Symbol'] = symbol
+                self.cell_versions[symbol] = {}
+            if new:
+                self.layout += 1
+        if new and self.stream is not None:
+            self.stream.subscribe(*new)
+
+    def unwatch(self, *symbols):
+        with self.lock:
+            old = [symbol for symbol in symbols if symbol in self.positions]
+            for symbol in old:
+                del self.rows[symbol], self.cell_versions[symbol]
+                for table in (self.last_trade, self.last_poll, self.errors):
+                    table.pop(symbol, None)
+            if old:
+                self.symbols = [symbol for symbol in self.symbols if symbol in self.rows]
+                self.positions = {symbol: i for i, symbol in enumerate(self.symbols)}
+                self.layout += 1
+        # symbols the dashboard still shows elsewhere stay subscribed, the stream is shared
+        return old
+
+    # -- reading the board
+
+    # the whole table as DataTable records, with the version and layout they correspond to
+    def records(self) -> tuple:
+        with self.lock:
+            return [dict(self.rows[symbol]) for symbol in self.symbols], self.version, self.layout
+
+    # (row, column, value) for every cell that changed after `version`, with the current version and layout.
+    # Row numbers are only meaningful if the layout is still the one the client's table was built with
+    def changes_since(self, version) -> tuple:
+        with self.lock:
+            cells = [(self.positions[symbol], column, self.rows[symbol][column])
+                     for symbol in self.symbols
+                     for column, changed in self.cell_versions[symbol].items() if changed > version]
+            return cells, self.version, self.layout
+
+    # -- updates
+
+    # the current quote of one symbol in the connector's one-row frame. Concurrent callers within one refresh
+    # interval share a single API call, a watched symbol's row is updated with the answer as well
+    def quote(self, symbol: str):
+        def fetch():
+            frame = self.connector.get_current_quote(symbol)
+            self._apply_quote(symbol, frame.iloc[0])
+            return frame
+        return self.quotes.get(symbol, fetch)
+
+    # fields the API left null are skipped, the cell keeps its last value
+    def _apply_quote(self, symbol, quote):
+        values = {column: float(quote[name]) for column, name in REST_COLUMNS.items()
+                  if name in quote and not pd.isna(quote[name])}
+        if 'Time' in quote and not pd.isna(quote['Time']):
+            values['Updated (UTC)'] = quote['Time'].strftime('%H:%M:%S')
+        values['Source'] = 'rest'
+        with self.lock:
+            self._set(symbol, values)
+
+    # feed a finnhub_stream.TradeBatch, only the last trade of every symbol in the batch matters
+    def add_batch(self, batch):
+        last = {symbol: (price, timestamp) for symbol, price, timestamp in
+                zip(batch.symbols.tolist(), batch.prices.tolist(), batch.timestamps.tolist())}
+        now = time.monotonic()
+        with self.lock:
+            for symbol, (price, timestamp) in last.items():
+                row = self.rows.get(symbol)
+                if row is None:
+                    continue
+                self.last_trade[symbol] = now
+                values = {'Price': price, 'Updated (UTC)': time.strftime('%H:%M:%S', time.gmtime(timestamp / 1000)),
+                          'Source': 'trade'}
+                if row['High'] is not None:
+                    values['High'] = max(row['High'], price)
+                if row['Low'] is not None:
+                    values['Low'] = min(row['Low'], price)
+                if row['Prev Close']:
+                    values['Change'] = round(price - row['Prev Close'], 4)
+                    values['Change %'] = round((price / row['Prev Close'] - 1) * 100, 4)
+                self._set(symbol, values)
+
+    # store the values of a row and version the cells that actually changed, called with the lock held
+    def _set(self, symbol, values):
+        row = self.rows.get(symbol)
+        if row is None:
+            return
+        changed = [column for column, value in values.items() if row[column] != value]
+        if not changed:
+            return
+        self.version += 1
+        versions = self.cell_versions[symbol]
+        for column in changed:
+            row[column] = values[column]
+            versions[column] = self.version
+
+    # -- REST polling
+
+    # one polling round, returns the number of symbols fetched
+    def poll(self) -> int:
+        now = time.monotonic()
+        with self.lock:
+            due = [symbol for symbol in self.symbols
+                   if now - self.last_trade.get(symbol, float('-inf')) >= self.trade_max_age]
+            due.sort(key=lambda symbol: self.last_poll.get(symbol, float('-inf')))
+            due = due[:self.budget]
+            for symbol in due:
+                self.last_poll[symbol] = now
+
+        futures = {self.executor.submit(self.quote, symbol): symbol for symbol in due}
+        for future in as_completed(futures):
+            symbol = futures[future]
+            try:
+                future.result()
+                self.errors.pop(symbol, None)
+            except Exception as error:
+                # e.g. an unknown symbol or an odd payload, it is tried again once every other symbol had its turn
+                self.errors[symbol] = f'{type(error).__name__}: {error}'
+                instrumentation.count('quote_board_poll_errors', error=type(error).__name__)
+        return len(due)
+
+    # poll every `refresh` seconds in a daemon thread, returns the thread
+    def start_polling_thread(self) -> threading.Thread:
+        self.poll_stop = threading.Event()
+
+        # a failed round is counted and the next one runs as usual, the thread only ends when stopped
+        def loop(stop):
+            while True:
+                try:
+                    self.poll()
+                except Exception as error:
+                    instrumentation.count('quote_board_poll_errors', error=type(error).__name__)
+                if stop.wait(self.refresh):
+                    return
+
+        thread = threading.Thread(target=loop, args=(self.poll_stop,), name='quote-board', daemon=True)
+        thread.start()
+        return thread
+
+    def stop_polling_thread(self):
+        if self.poll_stop is not None:
+            self.poll_stop.set()
@@ -0,0 +1,165 @@
+import argparse
+import itertools
+import json
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import numpy as np
+import pandas as pd
+
+from finnhub_connector import FinnhubConnector
+
+
+# Cross-sectional stock screener. refresh() downloads the stock/metric snapshot of every symbol in the
+# universe (or a subset) under the connector's rate limit and saves each one as soon as it arrives, so an
+# interrupted run picks up where it stopped and symbols fetched within max_age are skipped. The metrics are
+# then kept as one columnar symbol x metric table, and filter/rank queries such as
+# screener.query('peTTM < 15 and roeTTM > 20') run against that table in milliseconds without any API call
+class Screener:
+
+    def __init__(self, connector: FinnhubConnector, path='finnhub_screener.sqlite'):
+        self.connector = connector
+        self.path = path
+        self.table_path = f'{path}.table.pkl'
+        self.lock = threading.Lock()
+        self.frame = None
+        self.frame_version = None
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        with self.conn:
+            self.conn.execute('PRAGMA journal_mode=WAL')
+            self.conn.execute('CREATE TABLE IF NOT EXISTS metrics (symbol TEXT PRIMARY KEY, fetched_at REAL, '
+                              'status TEXT, payload TEXT)')
+            self.conn.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)')
+
+    def close(self):
+        self.conn.close()
+
+    # the symbols of the universe, optionally limited to some security types (e.g. ('Common Stock',))
+    def universe(self, types=None) -> list:
+        stocks = self.connector.get_north_american_stocks()
+        if types is not None:
+            stocks = stocks[stocks['Type'].isin(types)]
+        return stocks['Symbol'].tolist()
+
+    # symbols that still need a download: never fetched, failed last time or older than max_age seconds
+    def pending(self, symbols, max_age=86400) -> list:
+        with self.lock:
+            fresh = {row[0] for row in self.conn.execute(
+                "SELECT symbol FROM metrics WHERE status='ok' AND fetched_at>=?", (time.time() - max_age,))}
+        return [symbol for symbol in symbols if symbol not in fresh]
+
+    # download the metrics of the given symbols (the whole universe by default), returns how many were fetched.
+    # progress(done, total) is called after every symbol if given. Only a couple of calls per worker are queued
+    # at a time, so an interrupted run (Ctrl+C or an error) returns after the calls in flight instead of working
+    # through the rest of the universe first. A symbol whose call fails in any way is saved as an error and
+    # tried again by the next run
+    def refresh(self, symbols=None, max_age=86400, max_workers=8, types=None, progress=None) -> int:
+        if symbols is None:
+            symbols = self.universe(types)
+        symbols = self.pending(symbols, max_age)
+
+        done = 0
+        queue = iter(symbols)
+        executor = ThreadPoolExecutor(max_workers=max_workers)
+        try:
+            futures = {executor.submit(self.connector.get_metric_snapshot, symbol): symbol
+                       for symbol in itertools.islice(queue, 2 * max_workers)}
+            while futures:
+                finished, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    symbol = futures.pop(future)
+                    try:
+                        self._save(symbol, 'ok', future.result())
+                    except Exception as error:
+                        self._save(symbol, 'error', f'{type(error).__name__}: {error}')
+                    done += 1
+                    if progress is not None:
+                        progress(done, len(symbols))
+                    for symbol in itertools.islice(queue, 1):
+                        futures[executor.submit(self.connector.get_metric_snapshot, symbol)] = symbol
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+        return done
+
+    def _save(self, symbol, status, result):
+        if status == 'ok':
+            # only numeric metrics are screened, dates and other strings are dropped
+            values = pd.to_numeric(result, errors='coerce').dropna()
+            payload = json.dumps({key: float(value) for key, value in values.items()})
+        else:
+            payload = json.dumps({'error': result})
+        with self.lock, self.conn:
+            self.conn.execute('INSERT OR REPLACE INTO metrics VALUES (?, ?, ?, ?)',
+                              (symbol, time.time(), status, payload))
+            self.conn.execute("INSERT OR REPLACE INTO meta VALUES ('version', ?)", (str(time.time_ns()),))
+
+    # the symbol x metric table of every successfully fetched symbol. It is rebuilt from the database only
+    # after new data was saved and kept as a pickle so other processes load it without parsing anything
+    def table(self) -> pd.DataFrame:
+        with self.lock:
+            row = self.conn.execute("SELECT value FROM meta WHERE key='version'").fetchone()
+        version = row[0] if row else None
+        if self.frame is not None and self.frame_version == version:
+            return self.frame
+
+        if os.path.exists(self.table_path):
+            stored_version, frame = pd.read_pickle(self.table_path)
+            if stored_version == version:
+                self.frame, self.frame_version = frame, version
+                return frame
+
+        with self.lock:
+            rows = self.conn.execute("SELECT symbol, payload FROM metrics WHERE status='ok' ORDER BY symbol"
+                                     ).fetchall()
+        frame = pd.DataFrame.from_records([json.loads(payload) for _, payload in rows],
+                                          index=pd.Index([symbol for symbol, _ in rows], name='Symbol'))
+        frame = frame.astype(np.float64)
+        pd.to_pickle((version, frame), self.table_path)
+        self.frame, self.frame_version = frame, version
+        return frame
+
+    # filter with a pandas query expression, metric names that start with a digit need backticks,
+    # e.g. '`52WeekHigh` > 100'. The result can be sorted and cut to the first `limit` rows
+    def query(self, expression: str, sort_by=None, ascending=True, limit=None, columns=None) -> pd.DataFrame:
+        result = self.table().query(expression)
+        if sort_by is not None:
+            result = result.sort_values(sort_by, ascending=ascending)
+        if columns is not None:
+            result = result[columns]
+        return result if limit is None else result.head(limit)
+
+    # symbols ordered by one metric, best first (highest unless ascending=True)
+    def rank(self, metric: str, ascending=False, limit=50) -> pd.Series:
+        return self.table()[metric].dropna().sort_values(ascending=ascending).head(limit)
+
+    def failed(self) -> pd.DataFrame:
+        with self.lock:
+            rows = self.conn.execute("SELECT symbol, fetched_at, payload FROM metrics WHERE status='error'").fetchall()
+        return pd.DataFrame([(symbol, pd.Timestamp(fetched_at, unit='s', tz='UTC'), json.loads(payload)['error'])
+                             for symbol, fetched_at, payload in rows], columns=['Symbol', 'Fetched', 'Error'])
+
+
+# python screener.py --refresh "peTTM < 15 and roeTTM > 20" --sort peTTM
+# the API key is read from the FINNHUB_API_KEY environment variable
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Screen the US stock universe on Finnhub basic financials')
+    parser.add_argument('query', nargs='?', help="pandas query expression, e.g. 'peTTM < 15 and roeTTM > 20'")
+    parser.add_argument('--refresh', action='store_true', help='download missing or stale metrics first')
+    parser.add_argument('--max-age', type=float, default=86400, help='seconds before a symbol is re-downloaded')
+    parser.add_argument('--common-only', action='store_true', help="only screen 'Common Stock' symbols")
+    parser.add_argument('--sort', help='metric to sort the result by')
+    parser.add_argument('--limit', type=int, default=50)
+    parser.add_argument('--db', default='finnhub_screener.sqlite')
+    args = parser.parse_args()
+
+    screener = Screener(FinnhubConnector(os.environ.get('FINNHUB_API_KEY')), args.db)
+    if args.refresh:
+        types = ('Common Stock',) if args.common_only else None
+        screener.refresh(max_age=args.max_age, types=types,
+                         progress=lambda done, total: print(f'\r{done}/{total}', end='', flush=True))
+        print()
+    if args.query:
+        print(screener.query(args.query, sort_by=args.sort, limit=args.limit))
@@ -0,0 +1,181 @@
+import hashlib
+import os
+import pickle
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+import instrumentation
+
+try:
+    import fcntl
+except ImportError:
+    # not available on Windows, the file cache then only de-duplicates fetches within one process
+    fcntl = None
+
+
+# Server-side caches used by the dash app to fetch every dataset on first use and reuse it until it goes stale.
+# Both classes have the same get(key, fetch, ttl) interface: fetch() produces the value when the key is missing
+# or expired, and concurrent callers asking for the same key wait for one fetch instead of all hitting the API.
+# Keys are tuples such as ('candles', 'AAPL', 'D') so every symbol and dataset is cached separately. Hits, misses
+# and fetch times are recorded in instrumentation per cache name and dataset (the first item of a tuple key)
+
+
+# In-process cache with a time-to-live per entry that keeps at most max_entries values, dropping the least
+# recently used one first. Shared by every user of one server process
+class LRUCache:
+
+    def __init__(self, ttl=300, max_entries=512, name='server'):
+        self.name = name
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.key_locks = {}
+        self.lock = threading.Lock()
+
+    def get(self, key, fetch, ttl=None):
+        value = self._lookup(key)
+        if value is not _MISSING:
+            _record(self.name, key, 'hit')
+            return value
+
+        # only one thread per key runs fetch(), the others find the fresh entry once they get the lock
+        with self._key_lock(key):
+            value = self._lookup(key)
+            if value is not _MISSING:
+                _record(self.name, key, 'hit')
+                return value
+            value = _fetch(self.name, key, fetch)
+            self.set(key, value, ttl)
+            return value
+
+    def set(self, key, value, ttl=None):
+        expires = time.time() + (self.ttl if ttl is None else ttl)
+        with self.lock:
+            self.entries[key] = (expires, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                old_key, _ = self.entries.popitem(last=False)
+                lock = self.key_locks.get(old_key)
+                if lock is not None and not lock.locked():
+                    del self.key_locks[old_key]
+
+    def invalidate(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def _lookup(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return _MISSING
+            if entry[0] < time.time():
+                del self.entries[key]
+                return _MISSING
+            self.entries.move_to_end(key)
+            return entry[1]
+
+    def _key_lock(self, key):
+        with self.lock:
+            return self.key_locks.setdefault(key, threading.Lock())
+
+
+# Cache stored as one pickle file per key in a directory, so several server processes (e.g. gunicorn workers)
+# share it. A per-key lock file makes sure only one process fetches a missing key, the others block on the
+# lock and then read the value it wrote. Files are replaced atomically so readers never see half a value
+class FileCache:
+
+    def __init__(self, directory, ttl=300, name='server'):
+        self.name = name
+        self.directory = directory
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.key_locks = {}
+        os.makedirs(directory, exist_ok=True)
+
+    def get(self, key, fetch, ttl=None):
+        path = self._path(key)
+        value = self._read(path)
+        if value is not _MISSING:
+            _record(self.name, key, 'hit')
+            return value
+
+        with self._key_lock(key), open(f'{path}.lock', 'a') as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                value = self._read(path)
+                if value is not _MISSING:
+                    _record(self.name, key, 'hit')
+                    return value
+                value = _fetch(self.name, key, fetch)
+                self._write(path, value, ttl)
+                return value
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def set(self, key, value, ttl=None):
+        self._write(self._path(key), value, ttl)
+
+    def invalidate(self, key):
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def clear(self):
+        for name in os.listdir(self.directory):
+            if name.endswith('.pkl'):
+                os.remove(os.path.join(self.directory, name))
+
+    def _path(self, key) -> str:
+        return os.path.join(self.directory, hashlib.sha1(repr(key).encode()).hexdigest() + '.pkl')
+
+    def _read(self, path):
+        try:
+            with open(path, 'rb') as file:
+                expires, value = pickle.load(file)
+        except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+            return _MISSING
+        return value if expires >= time.time() else _MISSING
+
+    def _write(self, path, value, ttl=None):
+        expires = time.time() + (self.ttl if ttl is None else ttl)
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as file:
+            pickle.dump((expires, value), file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+
+    def _key_lock(self, key):
+        with self.lock:
+            return self.key_locks.setdefault(key, threading.Lock())
+
+
+# file cache when a directory is given (shared between processes), in-process LRU cache otherwise
+def make_cache(directory=None, ttl=300, max_entries=512):
+    if directory:
+        return FileCache(directory, ttl=ttl)
+    return LRUCache(ttl=ttl, max_entries=max_entries)
+
+
+def _dataset(key):
+    return key[0] if isinstance(key, tuple) and key else ''
+
+
+def _record(name, key, result):
+    instrumentation.count('finnhub_cache_requests', cache=name, dataset=_dataset(key), result=result)
+
+
+def _fetch(name, key, fetch):
+    _record(name, key, 'miss')
+    with instrumentation.span('finnhub_cache_fetch_seconds', cache=name, dataset=_dataset(key)):
+        return fetch()
+
+
+_MISSING = object()
@@ -0,0 +1,166 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+
+import pandas as pd
+
+
+# How long a snapshot may be served before it is fetched again. is_stale() gets the latest snapshot (None when
+# there is none) and the current UNIX time
+class MaxAge:
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+
+    def is_stale(self, snapshot, now) -> bool:
+        return snapshot is None or now - snapshot.checked_at >= self.seconds
+
+
+# Earnings only change when a company reports, which happens some weeks after the end of each fiscal quarter.
+# The next report is expected from min_lag days after the end of the quarter following the latest reported
+# period, before that the snapshot is only re-checked every max_age seconds, from then on every check_every
+# seconds until the new period shows up in the data
+class EarningsCalendar:
+
+    def __init__(self, max_age=7 * 86400, check_every=12 * 3600, min_lag=14):
+        self.max_age = max_age
+        self.check_every = check_every
+        self.min_lag = min_lag
+
+    def next_report(self, payload):
+        periods = [entry['period'] for entry in payload or () if isinstance(entry, dict) and entry.get('period')]
+        if not periods:
+            return None
+        next_period_end = pd.Timestamp(max(periods)) + pd.DateOffset(months=3)
+        return (next_period_end + pd.Timedelta(days=self.min_lag)).tz_localize('UTC').timestamp()
+
+    def is_stale(self, snapshot, now) -> bool:
+        if snapshot is None:
+            return True
+        age = now - snapshot.checked_at
+        next_report = self.next_report(snapshot.payload)
+        if next_report is not None and now >= next_report:
+            return age >= self.check_every
+        return age >= self.max_age
+
+
+@dataclass(frozen=True)
+class Snapshot:
+    version: int
+    fetched_at: float
+    checked_at: float
+    hash: str
+    payload: object
+
+
+# staleness policy per dataset, datasets without their own policy use the basic_financials one
+DEFAULT_POLICIES = {'quote': MaxAge(15),
+                    'basic_financials': MaxAge(86400),
+                    'earnings': EarningsCalendar()}
+
+
+# Versioned store of raw API payloads for datasets that rarely change (basic financials, earnings) and for the
+# short-lived quote, kept in SQLite per (dataset, symbol). A payload is only fetched again when the dataset's
+# staleness policy says so, and a new version is only written when its content hash differs from the latest
+# one, otherwise just the check time is updated. changes() tells which parts of a payload a new version touched
+class SnapshotStore:
+
+    def __init__(self, path='finnhub_snapshots.sqlite', policies=None, keep_versions=5):
+        self.path = path
+        self.policies = dict(DEFAULT_POLICIES, **(policies or {}))
+        self.keep_versions = keep_versions
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        with self.conn:
+            self.conn.execute('PRAGMA journal_mode=WAL')
+            self.conn.execute('CREATE TABLE IF NOT EXISTS snapshots (dataset TEXT, symbol TEXT, version INTEGER, '
+                              'fetched_at REAL, checked_at REAL, hash TEXT, payload TEXT, '
+                              'PRIMARY KEY (dataset, symbol, version)) WITHOUT ROWID')
+
+    def close(self):
+        self.conn.close()
+
+    # the latest payload of a dataset, fetch() is only called when the dataset's policy finds it stale
+    # (or force is set). Payloads fetch() returns with an 'error' key are passed through without being saved
+    def get_payload(self, dataset: str, symbol: str, fetch, force=False):
+        snapshot = self.latest(dataset, symbol)
+        if not force and not self.policy(dataset).is_stale(snapshot, time.time()):
+            return snapshot.payload
+
+        payload = fetch()
+        if isinstance(payload, dict) and 'error' in payload:
+            return payload
+        self.save(dataset, symbol, payload)
+        return payload
+
+    def policy(self, dataset: str):
+        return self.policies.get(dataset, self.policies['basic_financials'])
+
+    # store a payload, returns True when it differs from the latest version
+    def save(self, dataset: str, symbol: str, payload) -> bool:
+        text = json.dumps(payload, sort_keys=True, separators=(',', ':'))
+        digest = hashlib.sha256(text.encode()).hexdigest()
+        now = time.time()
+        with self.lock, self.conn:
+            row = self.conn.execute('SELECT version, hash FROM snapshots WHERE dataset=? AND symbol=? '
+                                    'ORDER BY version DESC LIMIT 1', (dataset, symbol)).fetchone()
+            if row is not None and row[1] == digest:
+                self.conn.execute('UPDATE snapshots SET checked_at=? WHERE dataset=? AND symbol=? AND version=?',
+                                  (now, dataset, symbol, row[0]))
+                return False
+
+            version = 1 if row is None else row[0] + 1
+            self.conn.execute('INSERT INTO snapshots VALUES (?, ?, ?, ?, ?, ?, ?)',
+                              (dataset, symbol, version, now, now, digest, text))
+            self.conn.execute('DELETE FROM snapshots WHERE dataset=? AND symbol=? AND version<=?',
+                              (dataset, symbol, version - self.keep_versions))
+            return True
+
+    def latest(self, dataset: str, symbol: str):
+        with self.lock:
+            row = self.conn.execute('SELECT version, fetched_at, checked_at, hash, payload FROM snapshots '
+                                    'WHERE dataset=? AND symbol=? ORDER BY version DESC LIMIT 1',
+                                    (dataset, symbol)).fetchone()
+        return None if row is None else Snapshot(*row[:4], json.loads(row[4]))
+
+    # every kept version of a dataset without the payloads, oldest first
+    def history(self, dataset: str, symbol: str) -> pd.DataFrame:
+        with self.lock:
+            rows = self.conn.execute('SELECT version, fetched_at, checked_at, hash FROM snapshots '
+                                     'WHERE dataset=? AND symbol=? ORDER BY version', (dataset, symbol)).fetchall()
+        df = pd.DataFrame(rows, columns=['Version', 'Fetched', 'Checked', 'Hash'])
+        df['Fetched'] = pd.to_datetime(df['Fetched'], unit='s', utc=True)
+        df['Checked'] = pd.to_datetime(df['Checked'], unit='s', utc=True)
+        return df.set_index('Version')
+
+    # what the latest version changed compared to the one before it: the keys of a dict payload whose values
+    # differ (e.g. 'metric.peTTM') and the periods of period lists that were added or changed (e.g.
+    # 'series.quarterly.eps.2024-03-30' or, for earnings, just the period). Empty when there is only one version
+    def changes(self, dataset: str, symbol: str) -> list:
+        with self.lock:
+            rows = self.conn.execute('SELECT payload FROM snapshots WHERE dataset=? AND symbol=? '
+                                     'ORDER BY version DESC LIMIT 2', (dataset, symbol)).fetchall()
+        if len(rows) < 2:
+            return []
+        return _diff(json.loads(rows[1][0]), json.loads(rows[0][0]))
+
+    def invalidate(self, dataset: str, symbol: str):
+        with self.lock, self.conn:
+            self.conn.execute('UPDATE snapshots SET checked_at=0 WHERE dataset=? AND symbol=?', (dataset, symbol))
+
+
+def _diff(old, new, prefix='', depth=3) -> list:
+    if isinstance(old, dict) and isinstance(new, dict) and depth > 0:
+        changed = []
+        for key in sorted(set(old) | set(new), key=str):
+            if old.get(key) != new.get(key):
+                changed.extend(_diff(old.get(key), new.get(key), f'{prefix}{key}.', depth - 1))
+        return changed
+    if isinstance(old, list) and isinstance(new, list) and all(isinstance(entry, dict) and 'period' in entry
+                                                                for entry in old + new):
+        before = {entry['period']: entry for entry in old}
+        return [f"{prefix}{entry['period']}" for entry in new if before.get(entry['period']) != entry]
+    return [prefix.rstrip('.')]
@@ -0,0 +1,189 @@
+import os
+import pickle
+import tempfile
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from finnhub_connector import FinnhubConnector
+
+
+# Local copy of the symbol listings with an in-memory search index, so autocomplete never goes to the network.
+# The listings (US stocks and optionally some crypto exchanges) are downloaded once, kept in a pickle file and
+# re-downloaded when they are older than max_age, either on access or by a background thread. Searching
+# looks up, in this order: exact symbol or FIGI, symbol/FIGI prefix, prefix of a word of the description and
+# finally shared trigrams of symbol and description, which also finds names with a typo in them
+class SymbolCatalog:
+
+    def __init__(self, connector: FinnhubConnector, path='finnhub_symbols.pkl', max_age=86400,
+                 crypto_exchanges=()):
+        self.connector = connector
+        self.path = path
+        self.max_age = max_age
+        self.crypto_exchanges = tuple(crypto_exchanges)
+        self.lock = threading.Lock()
+        self.frame = None
+        self.fetched_at = 0
+        self.index = None
+        self.refresh_stop = None
+
+    # the listing as a frame with Symbol, Description, FIGI, Type and Exchange columns, downloaded if the
+    # saved copy is missing or stale
+    def symbols(self) -> pd.DataFrame:
+        self._ensure()
+        return self.frame
+
+    def refresh(self):
+        frames = []
+        stocks = self.connector.get_north_american_stocks()
+        frames.append(stocks[['Symbol', 'Description', 'FIGI', 'Type']].assign(Exchange='US'))
+        for exchange in self.crypto_exchanges:
+            crypto = self.connector.get_crypto_symbols(exchange)
+            frames.append(pd.DataFrame({'Symbol': crypto['Symbol'], 'Description': crypto['Description'],
+                                        'FIGI': '', 'Type': 'Crypto', 'Exchange': exchange}))
+        frame = pd.concat(frames, ignore_index=True).fillna('')
+        fetched_at = time.time()
+
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(self.path)), suffix='.tmp')
+        with os.fdopen(fd, 'wb') as file:
+            pickle.dump((fetched_at, frame), file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, self.path)
+        self._set(frame, fetched_at)
+
+    # re-download the listing every `interval` seconds in a daemon thread, returns the thread
+    def start_refresh_thread(self, interval=None) -> threading.Thread:
+        interval = self.max_age if interval is None else interval
+        self.refresh_stop = threading.Event()
+
+        # load (or download) the listing right away so the first search does not wait for it
+        def loop(stop):
+            try:
+                self._ensure()
+            except (ValueError, OSError):
+                pass
+            while not stop.wait(max(self.fetched_at + interval - time.time(), 1)):
+                try:
+                    self.refresh()
+                except (ValueError, OSError):
+                    # keep serving the old listing, try again after another interval
+                    self.fetched_at = time.time()
+
+        thread = threading.Thread(target=loop, args=(self.refresh_stop,), name='symbol-catalog', daemon=True)
+        thread.start()
+        return thread
+
+    def stop_refresh_thread(self):
+        if self.refresh_stop is not None:
+            self.refresh_stop.set()
+
+    # up to `limit` listing rows matching the query, best matches first
+    def search(self, query: str, limit=10) -> pd.DataFrame:
+        self._ensure()
+        rows = self.index.search(query, limit)
+        return self.frame.iloc[rows].reset_index(drop=True)
+
+    # options for a dcc.Dropdown, e.g. {'label': 'AAPL - APPLE INC', 'value': 'AAPL'}
+    def suggest(self, query: str, limit=10) -> list:
+        results = self.search(query, limit)
+        return [{'label': f'{symbol} - {description}' if description else symbol, 'value': symbol}
+                for symbol, description in zip(results['Symbol'], results['Description'])]
+
+    def _ensure(self):
+        if self.frame is not None and time.time() - self.fetched_at < self.max_age:
+            return
+        with self.lock:
+            # the file may have been refreshed by another process sharing it (e.g. another dashboard worker)
+            if os.path.exists(self.path):
+                with open(self.path, 'rb') as file:
+                    fetched_at, frame = pickle.load(file)
+                if self.frame is None or fetched_at > self.fetched_at:
+                    self._set(frame, fetched_at)
+            if self.frame is None or time.time() - self.fetched_at >= self.max_age:
+                # a stale listing is still better than none when the download fails
+                try:
+                    self.refresh()
+                except (ValueError, OSError):
+                    if self.frame is None:
+                        raise
+
+    def _set(self, frame, fetched_at):
+        index = SymbolIndex(frame['Symbol'], frame['Description'], frame['FIGI'])
+        self.frame, self.fetched_at, self.index = frame, fetched_at, index
+
+
+# Prefix and trigram index over the symbol, description and FIGI columns. Prefix lookups are binary searches
+# in sorted key arrays, trigram lookups count shared trigrams per row with one bincount, so a query costs well
+# under a millisecond even for the full US listing
+class SymbolIndex:
+
+    def __init__(self, symbols, descriptions, figis):
+        symbols = [str(symbol).lower() for symbol in symbols]
+        descriptions = [str(description).lower() for description in descriptions]
+        figis = [str(figi).lower() for figi in figis]
+        self.size = len(symbols)
+        self.symbol_lengths = np.array([len(symbol) for symbol in symbols], dtype=np.int64)
+        self.rank = np.empty(self.size, dtype=np.int64)
+        self.rank[np.argsort(symbols, kind='stable')] = np.arange(self.size)
+
+        self.codes, self.code_rows = self._sorted_keys(
+            [(symbol, row) for row, symbol in enumerate(symbols)] +
+            [(figi, row) for row, figi in enumerate(figis) if figi])
+        self.words, self.word_rows = self._sorted_keys(
+            [(word, row) for row, description in enumerate(descriptions) for word in set(description.split())])
+
+        grams = {}
+        for row, (symbol, description) in enumerate(zip(symbols, descriptions)):
+            for gram in self._trigrams(f'{symbol} {description}'):
+                grams.setdefault(gram, []).append(row)
+        self.grams = {gram: np.array(rows, dtype=np.int32) for gram, rows in grams.items()}
+
+    # row numbers of the best `limit` matches
+    def search(self, query: str, limit=10) -> list:
+        query = query.strip().lower()
+        if not query or limit < 1:
+            return []
+
+        # tier per row, lower is better
+        tiers = np.full(self.size, 4, dtype=np.int8)
+        codes = self._prefix(self.codes, self.code_rows, query)
+        tiers[codes] = 1
+        tiers[self.code_rows[self._exact(self.codes, query)]] = 0
+        words = self._prefix(self.words, self.word_rows, query.split()[0])
+        for word in query.split()[1:]:
+            words = np.intersect1d(words, self._prefix(self.words, self.word_rows, word))
+        tiers[words] = np.minimum(tiers[words], 2)
+
+        if len(query) >= 3 and np.count_nonzero(tiers < 4) < limit:
+            query_grams = self._trigrams(query)
+            postings = [self.grams[gram] for gram in query_grams if gram in self.grams]
+            if postings:
+                shared = np.bincount(np.concatenate(postings), minlength=self.size)
+                tiers[(shared >= max(len(query_grams) * 0.6, 1)) & (tiers == 4)] = 3
+
+        rows = np.flatnonzero(tiers < 4)
+        # best tier first, then shorter symbols (AAPL before AAPL.MX), then alphabetical
+        rows = rows[np.lexsort((self.rank[rows], self.symbol_lengths[rows], tiers[rows]))]
+        return rows[:limit].tolist()
+
+    @staticmethod
+    def _sorted_keys(pairs):
+        keys = np.array([key for key, _ in pairs], dtype=str)
+        rows = np.array([row for _, row in pairs], dtype=np.int64)
+        order = np.argsort(keys, kind='stable')
+        return keys[order], rows[order]
+
+    @staticmethod
+    def _prefix(keys, rows, prefix):
+        start, end = np.searchsorted(keys, prefix), np.searchsorted(keys, prefix + '\U0010ffff')
+        return rows[start:end]
+
+    @staticmethod
+    def _exact(keys, key):
+        return slice(np.searchsorted(keys, key), np.searchsorted(keys, key, side='right'))
+
+    @staticmethod
+    def _trigrams(text):
+        text = f'  {text} '
+        return {text[i:i + 3] for i in range(len(text) - 2)}
@@ -0,0 +1,22 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backfill import Backfill
+from benchmarks.mock_finnhub import MockFinnhub
+
+
+# an undecodable 200 answer (an HTML error page) is a failed call: every unit is recorded as 'error' and done by
+# the next run, none of them is marked 'empty' for good
+def test_undecodable_response_is_retried(tmp_path):
+    backfill = Backfill(str(tmp_path))
+    backfill.plan(['AAPL', 'MSFT'])
+    with MockFinnhub(n_symbols=10, garbage_every=1) as mock:
+        counts = backfill.run('key', processes=1, calls_per_minute=100000, base_api_url=mock.rest_url)
+    assert counts == {'error': 6}
+    assert len(backfill.pending()) == 6
+
+    with MockFinnhub(n_symbols=10) as mock:
+        counts = backfill.run('key', processes=1, calls_per_minute=100000, base_api_url=mock.rest_url)
+    assert counts == {'done': 6}
@@ -0,0 +1,313 @@
+import argparse
+import asyncio
+import os
+import threading
+import time
+import urllib.parse
+
+import numpy as np
+import pandas as pd
+
+from finnhub_stream import FinnhubStream, TradeBatch
+
+# one recorded trade, 24 bytes: UNIX milliseconds, price and volume. Trade conditions are not recorded
+TICK_DTYPE = np.dtype([('t', '<i8'), ('p', '<f8'), ('v', '<f8')])
+DAY_MS = 86400000
+
+
+# Records streamed trades into append-only binary files, one per symbol and UTC day:
+# <directory>/<yyyy-mm-dd>/<symbol>.ticks holding TICK_DTYPE records in arrival order. add_batch can be passed
+# as (or called from) the stream's on_batch callback, it only copies the batch into a buffer, the buffers are
+# written every flush_interval seconds or once flush_rows trades are waiting. add_batch only flushes when
+# trades arrive, start_flush_thread() also writes them out when the stream goes quiet. A crash loses at most
+# the unflushed trades, a torn last record is ignored when reading and cut off before the file is appended to
+# again, so the files need no index or footer and can be memory-mapped while they are still being written
+class TickRecorder:
+
+    def __init__(self, directory='finnhub_ticks', flush_interval=1.0, flush_rows=50000):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self.flush_rows = flush_rows
+        self.lock = threading.Lock()
+        self.buffers = {}
+        self.buffered = 0
+        self.flushed_at = time.monotonic()
+        self.recorded = 0
+        # files already checked for a torn last record by this recorder
+        self.trimmed = set()
+        self.flush_stop = None
+
+    def add_batch(self, batch):
+        if len(batch) == 0:
+            return
+        records = np.empty(len(batch), TICK_DTYPE)
+        records['t'] = batch.timestamps
+        records['p'] = batch.prices
+        records['v'] = batch.volumes
+        days = batch.timestamps // DAY_MS
+
+        with self.lock:
+            # a message almost always holds trades of one symbol on one day, no grouping needed then
+            first = batch.symbols[0]
+            if (batch.symbols == first).all() and (days == days[0]).all():
+                self._buffer(first, int(days[0]), records)
+            else:
+                for symbol in set(batch.symbols.tolist()):
+                    mask = batch.symbols == symbol
+                    for day in np.unique(days[mask]).tolist():
+                        self._buffer(symbol, day, records[mask & (days == day)])
+
+            self.recorded += len(records)
+            if self.buffered >= self.flush_rows or time.monotonic() - self.flushed_at >= self.flush_interval:
+                self._flush()
+
+    def _buffer(self, symbol, day, records):
+        self.buffers.setdefault((symbol, day), []).append(records)
+        self.buffered += len(records)
+
+    def flush(self):
+        with self.lock:
+            self._flush()
+
+    def _flush(self):
+        for (symbol, day), chunks in self.buffers.items():
+            path = tick_path(self.directory, symbol, day)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            if path not in self.trimmed:
+                # a crash during an earlier write can leave part of a record at the end, appending after it
+                # would shift every following record
+                size = os.path.getsize(path) if os.path.exists(path) else 0
+                if size % TICK_DTYPE.itemsize:
+                    os.truncate(path, size - size % TICK_DTYPE.itemsize)
+                self.trimmed.add(path)
+            with open(path, 'ab') as file:
+                for chunk in chunks:
+                    file.write(chunk.tobytes())
+        self.buffers.clear()
+        self.buffered = 0
+        self.flushed_at = time.monotonic()
+
+    # flush the buffers every flush_interval seconds in a daemon thread, returns the thread
+    def start_flush_thread(self) -> threading.Thread:
+        self.flush_stop = threading.Event()
+
+        def loop(stop):
+            while not stop.wait(self.flush_interval):
+                try:
+                    self.flush()
+                except OSError:
+                    # e.g. a full disk, the trades stay buffered and are written by the next flush
+                    pass
+
+        thread = threading.Thread(target=loop, args=(self.flush_stop,), name='tick-recorder', daemon=True)
+        thread.start()
+        return thread
+
+    def stop_flush_thread(self):
+        if self.flush_stop is not None:
+            self.flush_stop.set()
+
+    def close(self):
+        self.stop_flush_thread()
+        self.flush()
+
+
+# day is a yyyy-mm-dd string or the number of days since the epoch
+def tick_path(directory, symbol, day) -> str:
+    if isinstance(day, int):
+        day = time.strftime('%Y-%m-%d', time.gmtime(day * 86400))
+    # symbols such as 'BINANCE:BTCUSDT' are quoted to stay valid file names
+    return os.path.join(directory, day, f"{urllib.parse.quote(symbol, safe='')}.ticks")
+
+
+# recorded days (yyyy-mm-dd) between start and end (inclusive, None for no limit), oldest first
+def recorded_days(directory, start=None, end=None) -> list:
+    if not os.path.isdir(directory):
+        return []
+    return [day for day in sorted(os.listdir(directory))
+            if os.path.isdir(os.path.join(directory, day))
+            and (start is None or day >= str(start)) and (end is None or day <= str(end))]
+
+
+def recorded_symbols(directory, day) -> list:
+    folder = os.path.join(directory, str(day))
+    if not os.path.isdir(folder):
+        return []
+    return sorted(urllib.parse.unquote(name[:-len('.ticks')]) for name in os.listdir(folder)
+                  if name.endswith('.ticks'))
+
+
+# the recorded trades of one symbol and day as a read-only memory map of TICK_DTYPE records, in arrival order
+def load_ticks(directory, symbol, day) -> np.ndarray:
+    path = tick_path(directory, symbol, str(day))
+    rows = os.path.getsize(path) // TICK_DTYPE.itemsize if os.path.exists(path) else 0
+    if rows == 0:
+        return np.empty(0, TICK_DTYPE)
+    return np.memmap(path, dtype=TICK_DTYPE, mode='r', shape=(rows,))
+
+
+# the recorded trades of one symbol and day in the layout of TradeBatch.to_frame
+def ticks_frame(directory, symbol, day) -> pd.DataFrame:
+    ticks = load_ticks(directory, symbol, day)
+    return pd.DataFrame({'Symbol': symbol, 'Price': np.asarray(ticks['p']), 'Volume': np.asarray(ticks['v'])},
+                        index=pd.DatetimeIndex(pd.to_datetime(np.asarray(ticks['t']), unit='ms', utc=True),
+                                               name='Datetime'))
+
+
+# Plays recordings back through the same interface as finnhub_stream.FinnhubStream: subscribe/unsubscribe,
+# an on_batch callback or `async for batch in replay`, run/stop and start_in_thread/stop_threadsafe, so
+# anything written for the live stream (the candle aggregator, the quote board, the dash app) runs on recorded
+# data. The trades of every recorded symbol of a day are merged in time order and trades with the same
+# millisecond (or batch_ms window) form one batch, only subscribed symbols are delivered. speed=1 keeps the
+# recorded pace, speed=10 plays ten times faster and speed=None as fast as the consumer takes the batches.
+# Pauses longer than max_gap seconds (e.g. overnight) are shortened to max_gap
+class TickReplay(FinnhubStream):
+
+    def __init__(self, directory='finnhub_ticks', symbols=(), start=None, end=None, speed=1.0, on_batch=None,
+                 queue_size=1000, overflow='block', batch_ms=1, max_gap=None):
+        super().__init__(None, symbols, url=None, on_batch=on_batch, queue_size=queue_size, overflow=overflow)
+        self.directory = directory
+        self.start = start
+        self.end = end
+        self.speed = speed
+        self.batch_ms = max(1, int(batch_ms))
+        self.max_gap = max_gap
+        self.active = None
+        self.names = None
+
+    # -- subscriptions, safe to call from any thread before or while the replay runs
+
+    def subscribe(self, *symbols):
+        with self.symbols_lock:
+            self.symbols.update(symbols)
+        self._update_active()
+
+    def unsubscribe(self, *symbols):
+        with self.symbols_lock:
+            self.symbols.difference_update(symbols)
+        self._update_active()
+
+    def _update_active(self):
+        names = self.names
+        if names is not None:
+            with self.symbols_lock:
+                self.active = np.array([name in self.symbols for name in names], dtype=bool)
+
+    # -- running the replay
+
+    # every recorded trade of a day in time order as (symbol codes, ticks), with the symbol names
+    def _merge(self, day):
+        names = recorded_symbols(self.directory, day)
+        parts = [load_ticks(self.directory, name, day) for name in names]
+        codes = np.concatenate([np.full(len(part), i, dtype=np.int32) for i, part in enumerate(parts)] or
+                               [np.empty(0, np.int32)])
+        ticks = np.concatenate([np.asarray(part) for part in parts] or [np.empty(0, TICK_DTYPE)])
+        order = np.argsort(ticks['t'], kind='stable')
+        return np.array(names, dtype=object), codes[order], ticks[order]
+
+    async def run(self):
+        self.loop = asyncio.get_running_loop()
+        if self.queue is None:
+            self.queue = asyncio.Queue(maxsize=self.queue_size)
+        self.running = True
+        # clock maps recorded time to the loop's time, last is the time of the previous batch
+        clock = last = None
+        try:
+            for day in recorded_days(self.directory, self.start, self.end):
+                names, codes, ticks = self._merge(day)
+                self.names = names
+                self._update_active()
+                keys = ticks['t'] // self.batch_ms
+                bounds = np.concatenate([[0], np.flatnonzero(np.diff(keys)) + 1, [len(ticks)]])
+
+                for n, (lo, hi) in enumerate(zip(bounds[:-1].tolist(), bounds[1:].tolist())):
+                    if not self.running:
+                        return
+                    timestamp = int(ticks['t'][lo])
+                    if self.speed:
+                        # gaps beyond max_gap move the clock forward
+                        if clock is None:
+                            clock = (timestamp, self.loop.time())
+                        elif self.max_gap is not None and last is not None and timestamp - last > self.max_gap * 1000:
+                            clock = (clock[0] + timestamp - last - self.max_gap * 1000, clock[1])
+                        delay = clock[1] + (timestamp - clock[0]) / 1000 / self.speed - self.loop.time()
+                        if delay > 0:
+                            await asyncio.sleep(delay)
+                    elif n % 100 == 0:
+                        # let subscribe/stop calls in
+                        await asyncio.sleep(0)
+                    last = timestamp
+
+                    mask = self.active[codes[lo:hi]]
+                    if not mask.any():
+                        continue
+                    group = ticks[lo:hi][mask]
+                    batch = TradeBatch(names[codes[lo:hi][mask]], group['p'].copy(), group['v'].copy(),
+                                       group['t'].copy(), [None] * len(group))
+                    await self._deliver(batch)
+        finally:
+            self.running = False
+            if self.queue is not None and self.on_batch is None:
+                # wake up consumers so `async for` ends once the replay is over
+                self._put_nowait(None)
+
+    # a failing on_batch is counted and the replay goes on, as in the live stream
+    async def _deliver(self, batch):
+        self.messages += 1
+        if self.on_batch is not None:
+            try:
+                result = self.on_batch(batch)
+                if asyncio.iscoroutine(result):
+                    await result
+            except Exception as error:
+                self._count_error('on_batch', error)
+        elif self.overflow == 'block':
+            await self.queue.put(batch)
+        else:
+            self._put_nowait(batch)
+
+    async def stop(self):
+        self.running = False
+
+    def stop_threadsafe(self):
+        self.running = False
+
+
+# python tick_recorder.py record AAPL MSFT BINANCE:BTCUSDT     (until Ctrl+C, API key from FINNHUB_API_KEY)
+# python tick_recorder.py replay --speed 60                    (prints trades per symbol as they are replayed)
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Record Finnhub trades to disk or replay a recording')
+    parser.add_argument('command', choices=['record', 'replay'])
+    parser.add_argument('symbols', nargs='*', help='symbols to record or replay, every recorded one by default')
+    parser.add_argument('--dir', default='finnhub_ticks')
+    parser.add_argument('--speed', type=float, default=1.0, help='replay speed, 0 for as fast as possible')
+    parser.add_argument('--start', help='first day to replay (yyyy-mm-dd)')
+    parser.add_argument('--end', help='last day to replay (yyyy-mm-dd)')
+    args = parser.parse_args()
+
+    if args.command == 'record':
+        recorder = TickRecorder(args.dir)
+        recorder.start_flush_thread()
+        stream = FinnhubStream(os.environ.get('FINNHUB_API_KEY'), args.symbols, on_batch=recorder.add_batch)
+        try:
+            asyncio.run(stream.run())
+        except KeyboardInterrupt:
+            pass
+        finally:
+            recorder.close()
+            print(f'{recorder.recorded} trades recorded')
+    else:
+        days = recorded_days(args.dir, args.start, args.end)
+        symbols = args.symbols or sorted({symbol for day in days for symbol in recorded_symbols(args.dir, day)})
+        counts = dict.fromkeys(symbols, 0)
+
+        def show(batch):
+            for symbol in batch.symbols.tolist():
+                counts[symbol] += 1
+            print(f"\r{pd.Timestamp(int(batch.timestamps[-1]), unit='ms', tz='UTC')}  "
+                  + '  '.join(f'{symbol}: {count}' for symbol, count in counts.items()), end='', flush=True)
+
+        started = time.perf_counter()
+        asyncio.run(TickReplay(args.dir, symbols, args.start, args.end, speed=args.speed or None,
+                               on_batch=show).run())
+        print(f'\n{sum(counts.values())} trades replayed in {time.perf_counter() - started:.1f} s')